@@ -4,7 +4,7 @@ from sqlalchemy import pool
 from alembic import context
 from app.core.config import settings
 from app.database.base import Base
-from app.models import user, job  # Import all models
+from app.models import user, job, preset  # Import all models
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,32 @@
+"""job item queue columns
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('job_items', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('job_items', sa.Column('locked_until', sa.DateTime(), nullable=True))
+    op.add_column('job_items', sa.Column('error', sa.Text(), nullable=True))
+    op.add_column('job_items', sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.create_index(op.f('ix_job_items_status'), 'job_items', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_job_items_status'), table_name='job_items')
+    op.drop_column('job_items', 'created_at')
+    op.drop_column('job_items', 'error')
+    op.drop_column('job_items', 'locked_until')
+    op.drop_column('job_items', 'attempts')
@@ -0,0 +1,41 @@
+"""custom presets
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'custom_presets',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('key', sa.String(length=100), nullable=False),
+        sa.Column('label', sa.String(length=255), nullable=False),
+        sa.Column('w', sa.Integer(), nullable=False),
+        sa.Column('h', sa.Integer(), nullable=False),
+        sa.Column('profile', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_custom_presets_key'), 'custom_presets', ['key'], unique=True)
+    op.create_index(op.f('ix_custom_presets_user_id'), 'custom_presets', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_custom_presets_user_id'), table_name='custom_presets')
+    op.drop_index(op.f('ix_custom_presets_key'), table_name='custom_presets')
+    op.drop_table('custom_presets')
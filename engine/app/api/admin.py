@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from app.api.deps import require_admin
+from app.schemas.profiles import ProfileInfo, ProfileListResponse
+from app.services.profiling import profiler
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiles", response_model=ProfileListResponse)
+def list_profiles():
+    """Stored profiles, newest first."""
+    return ProfileListResponse(profiles=[ProfileInfo(**info) for info in profiler.list()])
+
+
+@router.get("/profiles/{profile_id}", response_model=ProfileInfo)
+def get_profile(profile_id: str):
+    """A profile's timings, memory peak and top functions."""
+    info = profiler.get(profile_id)
+    if info is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return ProfileInfo(**info)
+
+
+@router.get("/profiles/{profile_id}/stats")
+def download_profile_stats(profile_id: str):
+    """The raw pstats file; open it with `python -m pstats` or snakeviz."""
+    path = profiler.stats_path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
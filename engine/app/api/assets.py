@@ -0,0 +1,69 @@
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from app.api.deps import byte_range
+from app.core.config import settings
+from app.services.assets import asset_service
+from app.services.storage import LocalStorage, storage
+
+router = APIRouter(prefix="/assets", tags=["assets"])
+
+
+@router.api_route("/{name}", methods=["GET", "HEAD"])
+def get_asset(
+    request: Request,
+    name: str,
+    expires: int = Query(...),
+    sig: str = Query(...),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Serve a rendered output from a signed, expiring URL.
+
+    Local files go through FileResponse, which handles Range, If-Range and
+    HEAD and hands the file to the server with zero-copy `pathsend` where
+    supported. Other backends are streamed with ranged reads.
+    """
+    if not asset_service.verify(name, expires, sig):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired asset URL"
+        )
+    obj = storage.stat(name) if asset_service.is_asset_name(name) else None
+    if obj is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Asset not found"
+        )
+
+    media_type = asset_service.media_type(name)
+    headers = {
+        "ETag": asset_service.etag(obj),
+        "Cache-Control": f"public, max-age={settings.asset_cache_max_age}, immutable"
+    }
+    if if_none_match and (if_none_match.strip() == "*" or headers["ETag"] in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    path = storage.local_path(name)
+    if path is not None:
+        if settings.asset_accel_redirect and isinstance(storage, LocalStorage):
+            # Let the fronting nginx sendfile() the file itself
+            headers["X-Accel-Redirect"] = f"{settings.asset_accel_redirect.rstrip('/')}/{storage.relative_path(name)}"
+            return Response(media_type=media_type, headers=headers)
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    headers["Accept-Ranges"] = "bytes"
+    start, end = 0, obj.size
+    status_code = status.HTTP_200_OK
+    if range_header and (if_range is None or if_range.strip() == headers["ETag"]):
+        requested = byte_range(range_header, obj.size)
+        if requested is not None:
+            start, end = requested
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{obj.size}"
+    headers["Content-Length"] = str(end - start)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, media_type=media_type, headers=headers)
+    body = storage.read(name, start, end) if end > start else iter(())
+    return StreamingResponse(body, status_code=status_code, media_type=media_type, headers=headers)
@@ -1,20 +1,28 @@
-from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+import hmac
+from typing import Generator, Optional, Tuple
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database.base import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.database.base import get_async_db
 from app.models.user import User
-from app.core.security import verify_token
 from app.schemas.auth import TokenData
+from app.services.auth_cache import CurrentUser, auth_cache
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user."""
+    db: AsyncSession = Depends(get_async_db)
+) -> CurrentUser:
+    """Get current authenticated user.
+    
+    Verified tokens and users are cached for a short TTL, so repeat calls
+    (e.g. polling a job) neither re-verify the token nor touch the database.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -22,7 +30,7 @@ def get_current_user(
     )
     
     token = credentials.credentials
-    payload = verify_token(token)
+    payload = auth_cache.verify_token(token)
     
     if payload is None:
         raise credentials_exception
@@ -33,15 +41,69 @@ def get_current_user(
     
     token_data = TokenData(email=email)
     
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = auth_cache.get_user(token_data.email)
     if user is None:
-        raise credentials_exception
+        # The session only checks out a connection here, on a cache miss
+        result = await db.execute(select(User).where(User.email == token_data.email))
+        db_user = result.scalars().first()
+        if db_user is None:
+            raise credentials_exception
+        user = CurrentUser.from_user(db_user)
+        auth_cache.put_user(user)
     
     return user
 
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_async_db)
+) -> Optional[CurrentUser]:
+    """The authenticated user, or None for requests without credentials.
+    
+    Credentials that are sent must still be valid.
+    """
+    if credentials is None:
+        return None
+    return await get_current_user(credentials, db)
+
+
+def get_current_active_user(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     """Get current active user."""
     return current_user
 
 
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Allow operators holding ADMIN_TOKEN; admin endpoints don't exist without one."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), settings.admin_token.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin token"
+        )
+
+
+def byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `Range` header into [start, end); None means serve everything."""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        # Multiple ranges aren't worth a multipart response; send the whole body
+        return None
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep:
+            raise ValueError
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start, end = max(size - int(last), 0), size
+    except ValueError:
+        return None
+    if start >= size or start >= end or start < 0:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size)
@@ -1,4 +1,7 @@
 from fastapi import APIRouter
+from app.services.cache import rendition_cache
+from app.services.passwords import password_hasher
+from app.services.pool import cpu_pool
 
 router = APIRouter(prefix="/health", tags=["health"])
 
@@ -13,3 +16,11 @@ def health_check():
     }
 
 
+@router.get("/stats")
+def health_stats():
+    """Load and latency counters for the shared worker pools and caches."""
+    return {
+        "image_pool": {"in_flight": cpu_pool.in_flight},
+        "password_hashing": password_hasher.stats(),
+        "rendition_cache": rendition_cache.stats()
+    }
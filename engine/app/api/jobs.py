@@ -1,119 +1,408 @@
+import base64
+import json
 import os
 import uuid
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from app.database.base import get_db
-from app.models.user import User
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status, UploadFile, File
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.base import get_async_db
+from app.services.auth_cache import CurrentUser
 from app.models.job import Job, JobItem
-from app.schemas.jobs import JobCreate, JobResponse, JobItemRequest, JobItemResult
-from app.api.deps import get_current_active_user
+from app.schemas.jobs import JobCreate, JobListResponse, JobResponse, JobItemRequest, JobItemResult, JobUploadResponse
+from app.api.deps import byte_range, get_current_active_user
+from app.services.archive import archive_service
+from app.services.assets import asset_service
+from app.services.events import job_events
+from app.services.image import image_service
 from app.services.presets import preset_service
+from app.services.remote import remote_sources
+from app.services.uploads import UploadTooLargeError, upload_service
 from app.core.config import settings
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
+TERMINAL_STATUSES = ("done", "failed")
+
+
+def _sources_dir(user: CurrentUser) -> str:
+    """Directory holding a user's uploaded job sources."""
+    return os.path.join(settings.upload_dir, "sources", str(user.id))
+
+
+def _encode_cursor(*parts: object) -> str:
+    """Opaque pagination cursor from the sort key of the last row returned."""
+    raw = "|".join(str(part) for part in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, count: int) -> List[str]:
+    try:
+        parts = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+    except ValueError:
+        parts = []
+    if len(parts) != count:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return parts
+
+
+def _resolve_source(item_data: JobItemRequest, user: CurrentUser) -> str:
+    """Return the src_path a worker should read for this item."""
+    if item_data.source == "upload":
+        if not item_data.file:
+            raise ValueError("'file' is required for upload sources")
+        path = os.path.join(_sources_dir(user), os.path.basename(item_data.file))
+        if not os.path.isfile(path):
+            raise ValueError(f"Upload '{item_data.file}' not found")
+        return path
+    
+    if item_data.source == "url":
+        if not item_data.url or not item_data.url.startswith(("http://", "https://")):
+            raise ValueError("A valid http(s) 'url' is required for url sources")
+        return item_data.url
+    
+    raise ValueError(f"Unknown source '{item_data.source}'")
+
+
+@router.post("/uploads", response_model=JobUploadResponse)
+async def upload_source(
+    file: UploadFile = File(...),
+    current_user: CurrentUser = Depends(get_current_active_user)
+):
+    """Upload a source image to reference from job items."""
+    source_id = uuid.uuid4().hex
+    path = os.path.join(_sources_dir(current_user), source_id)
+    
+    # Stream straight to the sources directory
+    try:
+        await upload_service.ingest(file, dest_path=path)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    is_valid, error_message = await image_service.validate_image_async(path, file.filename or "upload")
+    if not is_valid:
+        os.remove(path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=error_message
+        )
+    
+    return JobUploadResponse(file=source_id)
+
 
 @router.post("", response_model=JobResponse)
 async def create_job(
     job_data: JobCreate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Create a new job for batch processing."""
-    # Create job
-    job = Job(user_id=current_user.id)
-    db.add(job)
-    db.commit()
-    db.refresh(job)
+    """Create a new job for batch processing.
     
-    # Process items synchronously (for Iteration 1)
-    results = []
+    Every item is validated before anything is written; the job and all of
+    its items are then inserted in one transaction.
+    """
+    if not job_data.items:
+        # Only finishing items finalize a job, so an empty one would stay queued forever
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A job needs at least one item"
+        )
     
-    for item_data in job_data.items:
-        try:
-            # Validate preset
-            preset = preset_service.get_preset_by_key(item_data.preset_key)
+    job_id = uuid.uuid4()
+    rows = []
+    # Jobs usually repeat a few presets and sources across many items
+    checked_presets = set()
+    resolved_sources = {}
+    checked_hosts = set()
+    try:
+        for item_data in job_data.items:
+            if item_data.preset_key not in checked_presets:
+                await preset_service.get_preset_async(item_data.preset_key, db, current_user.id)
+                checked_presets.add(item_data.preset_key)
+            if item_data.profile is not None and item_data.profile not in image_service.encode_profiles:
+                raise ValueError(f"Unknown profile '{item_data.profile}'")
+            if item_data.max_frames is not None and item_data.max_frames < 1:
+                raise ValueError("max_frames must be at least 1")
+            
+            source_key = (item_data.source, item_data.file, item_data.url)
+            if source_key not in resolved_sources:
+                resolved_sources[source_key] = _resolve_source(item_data, current_user)
+            if item_data.source == "url" and urlsplit(item_data.url).netloc not in checked_hosts:
+                # Workers must never be pointed at loopback, private or metadata addresses
+                await run_in_threadpool(remote_sources.check_url, item_data.url)
+                checked_hosts.add(urlsplit(item_data.url).netloc)
             
-            # Create job item
-            job_item = JobItem(
-                job_id=job.id,
-                src_path=f"temp_{uuid.uuid4()}",  # Placeholder for now
-                preset_key=item_data.preset_key,
-                fmt=item_data.fmt or "jpeg",
-                params_json={
+            rows.append({
+                "job_id": job_id,
+                "src_path": resolved_sources[source_key],
+                "preset_key": item_data.preset_key,
+                "fmt": item_data.fmt or "jpeg",
+                "params_json": {
                     "quality": item_data.quality or 85,
                     "fit": "cover",
-                    "bg_color": "#FFFFFF"
+                    "bg_color": "#FFFFFF",
+                    "profile": item_data.profile,
+                    "max_frames": item_data.max_frames,
+                    "dedupe_frames": item_data.dedupe_frames
                 },
-                status="done"  # For now, mark as done immediately
-            )
-            db.add(job_item)
-            
-            # Create result URL (placeholder for now)
-            result_filename = f"result_{uuid.uuid4()}.{job_item.fmt}"
-            result = JobItemResult(
-                filename=result_filename,
-                url=f"/assets/{result_filename}"
-            )
-            results.append(result)
-            
-        except Exception as e:
-            # Mark job as failed
-            job.status = "failed"
-            db.commit()
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to process job item: {str(e)}"
-            )
+                "status": "pending"
+            })
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to process job item: {str(e)}"
+        )
     
-    # Mark job as done
-    job.status = "done"
-    db.commit()
+    job = Job(id=job_id, user_id=current_user.id)
+    db.add(job)
+    # The job row must exist before items reference it
+    await db.flush()
+    # One executemany instead of a flush per ORM object; workers pick items up from job_items
+    await db.execute(insert(JobItem), rows)
+    await db.commit()
     
     return JobResponse(
         id=str(job.id),
         status=job.status,
-        results=results,
+        results=None,
         created_at=job.created_at,
         updated_at=job.updated_at
     )
 
 
-@router.get("/{job_id}", response_model=JobResponse)
-def get_job(
-    job_id: str,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+@router.get("", response_model=JobListResponse)
+async def list_jobs(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get job status and results."""
-    job = db.query(Job).filter(
-        Job.id == job_id,
-        Job.user_id == current_user.id
-    ).first()
+    """List the current user's jobs, newest first."""
+    query = select(Job).where(Job.user_id == current_user.id)
+    if cursor:
+        created_at, job_id = _decode_cursor(cursor, 2)
+        try:
+            created_at, job_id = datetime.fromisoformat(created_at), uuid.UUID(job_id)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        # Keyset pagination; the (user_id, created_at) index serves both filter and order
+        query = query.where(or_(
+            Job.created_at < created_at,
+            and_(Job.created_at == created_at, Job.id < job_id)
+        ))
+    
+    result = await db.execute(query.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit + 1))
+    jobs = result.scalars().all()
+    page = jobs[:limit]
+    
+    return JobListResponse(
+        jobs=[
+            JobResponse(id=str(job.id), status=job.status, created_at=job.created_at, updated_at=job.updated_at)
+            for job in page
+        ],
+        next_cursor=_encode_cursor(page[-1].created_at.isoformat(), page[-1].id) if len(jobs) > limit else None
+    )
+
+
+async def _get_user_job(db: AsyncSession, job_id: str, user: CurrentUser) -> Job:
+    """Load one of the user's jobs, or raise 404."""
+    try:
+        job_uuid = uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    result = await db.execute(
+        select(Job).where(Job.id == job_uuid, Job.user_id == user.id)
+    )
+    job = result.scalars().first()
     
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Job not found"
         )
+    return job
+
+
+async def _item_counts(db: AsyncSession, job_id: uuid.UUID) -> Dict[str, int]:
+    # Counts come from an aggregate rather than loading every item
+    result = await db.execute(
+        select(JobItem.status, func.count())
+        .where(JobItem.job_id == job_id)
+        .group_by(JobItem.status)
+    )
+    return {item_status: count for item_status, count in result.all()}
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get job status, per-status item counts and a page of results."""
+    job = await _get_user_job(db, job_id, current_user)
+    counts = await _item_counts(db, job.id)
     
-    # Build results from job items
-    results = []
-    for item in job.items:
-        if item.status == "done" and item.dst_path:
-            result = JobItemResult(
-                filename=os.path.basename(item.dst_path),
-                url=f"/assets/{os.path.basename(item.dst_path)}"
+    # Fetch only the columns needed to build URLs for one page of finished items
+    query = select(JobItem.id, JobItem.dst_path).where(
+        JobItem.job_id == job.id,
+        JobItem.status == "done"
+    )
+    if cursor:
+        (after,) = _decode_cursor(cursor, 1)
+        try:
+            query = query.where(JobItem.id > uuid.UUID(after))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
             )
-            results.append(result)
+    result = await db.execute(query.order_by(JobItem.id).limit(limit + 1))
+    rows = result.all()
+    page = rows[:limit]
+    
+    # Build results from job items
+    results = [
+        JobItemResult(
+            filename=os.path.basename(dst_path),
+            url=asset_service.url_for(os.path.basename(dst_path))
+        )
+        for _item_id, dst_path in page
+        if dst_path
+    ]
     
     return JobResponse(
         id=str(job.id),
         status=job.status,
         results=results if results else None,
+        counts=counts,
+        next_cursor=_encode_cursor(page[-1][0]) if len(rows) > limit else None,
         created_at=job.created_at,
         updated_at=job.updated_at
     )
 
 
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream item and job status changes as Server-Sent Events.
+    
+    The first event is a `snapshot` of the job's status and item counts;
+    `item` and `job` events follow as the workers progress. The stream
+    ends once the job is done or failed.
+    """
+    job = await _get_user_job(db, job_id, current_user)
+    
+    # Subscribe before reading the snapshot so no transition falls in between
+    subscription = await job_events.subscribe(str(job.id))
+    try:
+        counts = await _item_counts(db, job.id)
+        await db.refresh(job, ["status"])
+        snapshot = {"job_id": str(job.id), "status": job.status, "counts": counts}
+    except BaseException:
+        subscription.close()
+        raise
+    # Don't hold a pooled connection for the life of the stream
+    await db.close()
+    
+    async def events():
+        try:
+            yield _sse("snapshot", snapshot)
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+            while True:
+                event = await subscription.get(settings.job_events_keepalive)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event["type"], event)
+                if event["type"] == "job" and event["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/{job_id}/archive")
+async def download_job_archive(
+    job_id: str,
+    fmt: str = Query("zip", pattern="^(zip|tar)$"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Download every finished output of a job as one zip or tar archive.
+    
+    The archive is generated while it is sent and supports `Range`
+    requests (with `If-Range`) so interrupted downloads can resume.
+    """
+    job = await _get_user_job(db, job_id, current_user)
+    result = await db.execute(
+        select(JobItem.dst_path)
+        .where(JobItem.job_id == job.id, JobItem.status == "done")
+        .order_by(JobItem.id)
+    )
+    names = [os.path.basename(dst_path) for dst_path in result.scalars().all() if dst_path]
+    await db.close()
+    
+    # Stats every output, so keep it off the event loop
+    archive = await run_in_threadpool(archive_service.build, names, fmt)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": archive.etag,
+        "Content-Disposition": f'attachment; filename="job-{job.id}.{fmt}"'
+    }
+    
+    requested = None
+    if range_header and (if_range is None or if_range.strip() == archive.etag):
+        requested = byte_range(range_header, archive.size)
+    if requested is None:
+        headers["Content-Length"] = str(archive.size)
+        return StreamingResponse(archive.iter_range(), media_type=archive.media_type, headers=headers)
+    
+    start, end = requested
+    headers["Content-Length"] = str(end - start)
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{archive.size}"
+    return StreamingResponse(
+        archive.iter_range(start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=archive.media_type,
+        headers=headers
+    )
@@ -0,0 +1,38 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.cache import rendition_cache
+from app.services.metrics import metrics
+from app.services.passwords import password_hasher
+from app.services.pool import cpu_pool
+
+router = APIRouter(tags=["metrics"])
+
+# State the pools and caches already track, read at scrape time
+metrics.gauge("image_pool_in_flight", "Image tasks queued or running in the CPU pool", function=lambda: cpu_pool.in_flight)
+metrics.gauge("image_pool_queue_limit", "Image tasks allowed in flight before 503s", function=lambda: cpu_pool.queue_limit)
+metrics.gauge(
+    "password_hash_in_flight", "Password hashes queued or running",
+    function=lambda: password_hasher.stats()["in_flight"]
+)
+metrics.counter(
+    "password_hash_rejected_total", "Password operations refused because the pool was full",
+    function=lambda: password_hasher.rejected
+)
+metrics.counter(
+    "rendition_cache_lookups_total", "Rendition cache lookups by result", ["result"],
+    function=lambda: {
+        ("memory",): rendition_cache.hits_memory,
+        ("disk",): rendition_cache.hits_disk,
+        ("miss",): rendition_cache.misses
+    }
+)
+metrics.gauge(
+    "rendition_cache_bytes", "Bytes held by each rendition cache tier", ["tier"],
+    function=lambda: {("memory",): rendition_cache.stats()["memory_bytes"], ("disk",): rendition_cache.stats()["disk_bytes"]}
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Metrics for this API process in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,13 +1,97 @@
-from fastapi import APIRouter
-from app.services.presets import preset_service
-from app.schemas.presets import PresetsResponse
+import uuid
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import get_current_active_user
+from app.core.config import settings
+from app.database.base import get_async_db
+from app.models.preset import CustomPreset
+from app.services.auth_cache import CurrentUser
+from app.services.image import image_service
+from app.services.presets import CUSTOM_PREFIX, preset_service
+from app.schemas.presets import CustomPresetCreate, Preset, PresetsResponse
 
 router = APIRouter(prefix="/presets", tags=["presets"])
 
 
 @router.get("", response_model=PresetsResponse)
-def get_presets():
-    """Get all presets grouped by platform."""
-    return preset_service.get_all_presets()
+def get_presets(if_none_match: Optional[str] = Header(None)):
+    """Get the built-in presets grouped by platform.
+    
+    Custom presets are per user and not included, so this response stays
+    public and cacheable; list them with GET /presets/custom.
+    """
+    # Serialized once per presets.json change
+    body, etag = preset_service.get_presets_body()
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={settings.presets_cache_max_age}"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
+@router.get("/custom", response_model=List[Preset])
+async def list_custom_presets(
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List the current user's custom presets."""
+    result = await db.execute(
+        select(CustomPreset)
+        .where(CustomPreset.user_id == current_user.id)
+        .order_by(CustomPreset.created_at)
+    )
+    return [preset_service.to_preset(row) for row in result.scalars().all()]
+
+
+@router.post("/custom", response_model=Preset)
+async def create_custom_preset(
+    preset_data: CustomPresetCreate,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create a custom preset usable anywhere a preset key is accepted."""
+    if preset_data.profile is not None and preset_data.profile not in image_service.encode_profiles:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown profile '{preset_data.profile}'"
+        )
+
+    row = CustomPreset(
+        user_id=current_user.id,
+        key=f"{CUSTOM_PREFIX}{uuid.uuid4().hex[:12]}",
+        label=preset_data.label,
+        w=preset_data.w,
+        h=preset_data.h,
+        profile=preset_data.profile
+    )
+    preset = preset_service.to_preset(row)
+    db.add(row)
+    await db.commit()
+
+    preset_service.add_custom(preset, current_user.id)
+    return preset
+
+
+@router.delete("/custom/{preset_key}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_custom_preset(
+    preset_key: str,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete one of the current user's custom presets."""
+    result = await db.execute(
+        select(CustomPreset).where(CustomPreset.key == preset_key, CustomPreset.user_id == current_user.id)
+    )
+    row = result.scalars().first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Preset not found"
+        )
+
+    await db.delete(row)
+    await db.commit()
+    preset_service.remove_custom(preset_key)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,43 +1,184 @@
-from fastapi import APIRouter, File, Form, HTTPException, status
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, UploadFile, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from app.services.image import image_service
+from app.core.config import settings
+from app.api.deps import get_optional_user
+from app.database.base import get_async_db
+from app.services.archive import ArchiveService
+from app.services.auth_cache import CurrentUser
+from app.services.cache import rendition_cache
+from app.services.image import InvalidImageError, image_service
+from app.services.pool import PoolSaturatedError, PoolTimeoutError
+from app.services.presets import preset_service
+from app.services.profiling import profiler
+from app.services.storage import MemoryStorage
+from app.services.uploads import IngestedUpload, UploadTooLargeError, upload_service
 
 router = APIRouter(prefix="/transform", tags=["transform"])
 
 
+def _check_profile(profile: Optional[str]) -> None:
+    """Reject unknown encode profiles."""
+    if profile is not None and profile not in image_service.encode_profiles:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown profile '{profile}', expected one of: {', '.join(image_service.encode_profiles)}"
+        )
+
+
+def _check_search(fmt: str, max_bytes: Optional[int], min_psnr: Optional[float], min_quality: int, quality: int) -> None:
+    """Reject quality search parameters that cannot be satisfied."""
+    detail = None
+    if max_bytes is not None and min_psnr is not None:
+        detail = "Specify either max_bytes or min_psnr, not both"
+    elif image_service.supported_formats.get(fmt.lower()) in (None, *image_service.quality_free_formats):
+        detail = "Quality search requires a lossy format (jpeg, webp or avif)"
+    elif (max_bytes is not None and max_bytes <= 0) or not 1 <= min_quality <= quality <= 100:
+        detail = "max_bytes must be positive and 1 <= min_quality <= quality <= 100"
+    if detail:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+async def _ingest_upload(file: UploadFile) -> IngestedUpload:
+    """Stream the upload into memory or a spool file, mapping errors to HTTP."""
+    try:
+        return await upload_service.ingest(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
 @router.post("/resize")
 async def resize_image(
-    file: bytes = File(...),
+    file: UploadFile = File(...),
     width: int = Form(...),
     height: int = Form(...),
     fmt: str = Form("jpeg"),
     quality: int = Form(85),
     fit: str = Form("cover"),
     bg_color: str = Form("#FFFFFF"),
-    strip_metadata: bool = Form(True)
+    strip_metadata: bool = Form(True),
+    profile: Optional[str] = Form(None),
+    max_bytes: Optional[int] = Form(None),
+    min_psnr: Optional[float] = Form(None),
+    min_quality: int = Form(10),
+    max_frames: Optional[int] = Form(None),
+    dedupe_frames: bool = Form(False),
+    if_none_match: Optional[str] = Header(None),
+    x_profile: Optional[str] = Header(None)
 ):
-    """Resize and process image on the server."""
+    """Resize and process image on the server.
+    
+    With `max_bytes` or `min_psnr` the encoder quality is searched between
+    `min_quality` and `quality` instead of being fixed; the chosen quality
+    and number of encode passes are returned in X-Quality and
+    X-Encode-Passes.
+    
+    Animated GIF and WebP sources stay animated in webp and gif output,
+    keeping at most `max_frames` frames (dropped evenly, their time given
+    to the frames kept); `dedupe_frames` merges identical consecutive frames.
+    
+    Sending the admin token in X-Profile (or being sampled) profiles the
+    processing; the stored profile's id is returned in X-Profile-Id.
+    """
+    _check_profile(profile)
+    profile = profile or settings.encode_profile
+    search = max_bytes is not None or min_psnr is not None
+    if search:
+        _check_search(fmt, max_bytes, min_psnr, min_quality, quality)
+    if max_frames is not None and max_frames < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="max_frames must be at least 1")
+    
+    upload = await _ingest_upload(file)
+    profiling = profiler.start("POST /transform/resize", profiler.trigger(x_profile))
+    # An explicitly profiled request must do the work, not hit a cache
+    use_cache = profiling is None or profiling.trigger != "header"
     try:
-        # Validate image
-        is_valid, error_message = image_service.validate_image(file, "uploaded_file")
-        if not is_valid:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=error_message
-            )
-        
-        # Process image
-        processed_image = image_service.process_image(
-            file_content=file,
-            width=width,
-            height=height,
-            fmt=fmt,
-            quality=quality,
-            fit=fit,
-            bg_color=bg_color,
-            strip_metadata=strip_metadata
+        # Identical source and parameters always produce the same rendition
+        target = {"max_bytes": max_bytes, "min_psnr": min_psnr, "min_quality": min_quality} if search else None
+        animation = {"max_frames": max_frames, "dedupe_frames": dedupe_frames} if max_frames or dedupe_frames else None
+        cache_key = rendition_cache.make_key(
+            upload.sha256, width, height, fmt, quality, fit, bg_color, strip_metadata, profile,
+            target=target, animation=animation
         )
+        etag = f'"{cache_key}"'
+        if use_cache and if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        
+        headers = {}
+        if search:
+            # A finished search is cached as its chosen quality, which then
+            # addresses the same rendition a fixed-quality request would
+            processed_image = None
+            cached_quality = await rendition_cache.get_async(cache_key) if use_cache else None
+            if cached_quality is not None:
+                chosen = int(cached_quality)
+                processed_image = await rendition_cache.get_async(
+                    rendition_cache.make_key(upload.sha256, width, height, fmt, chosen, fit, bg_color, strip_metadata, profile)
+                )
+                headers = {"X-Quality": str(chosen), "X-Encode-Passes": "0", "X-Target-Met": "true"}
+            cache_status = "HIT" if processed_image is not None else "MISS"
+            
+            if processed_image is None:
+                processed_image, result = await image_service.process_image_to_target_async(
+                    file_content=upload.source,
+                    width=width,
+                    height=height,
+                    fmt=fmt,
+                    max_bytes=max_bytes,
+                    min_psnr=min_psnr,
+                    min_quality=min_quality,
+                    max_quality=quality,
+                    fit=fit,
+                    bg_color=bg_color,
+                    strip_metadata=strip_metadata,
+                    profile=profile
+                )
+                headers = {
+                    "X-Quality": str(result["quality"]),
+                    "X-Encode-Passes": str(result["passes"]),
+                    "X-Target-Met": "true" if result["met"] else "false"
+                }
+                # Only remember searches that succeeded; a miss may be worth retrying with more budget
+                if result["met"]:
+                    await rendition_cache.put_async(
+                        rendition_cache.make_key(
+                            upload.sha256, width, height, fmt, result["quality"], fit, bg_color, strip_metadata, profile
+                        ),
+                        processed_image
+                    )
+                    await rendition_cache.put_async(cache_key, str(result["quality"]).encode())
+        else:
+            processed_image = await rendition_cache.get_async(cache_key) if use_cache else None
+            cache_status = "HIT" if processed_image is not None else "MISS"
+            
+            if processed_image is None:
+                # Validate and process image in one pass
+                processed_image = await image_service.process_image_async(
+                    file_content=upload.source,
+                    width=width,
+                    height=height,
+                    fmt=fmt,
+                    quality=quality,
+                    fit=fit,
+                    bg_color=bg_color,
+                    strip_metadata=strip_metadata,
+                    profile=profile,
+                    max_frames=max_frames,
+                    dedupe_frames=dedupe_frames
+                )
+                await rendition_cache.put_async(cache_key, processed_image)
+        
+        if profiling is not None and profiling.profile is not None:
+            headers["X-Profile-Id"] = profiling.id
         
         # Return processed image
         content_type = f"image/{fmt.lower()}"
@@ -46,14 +187,144 @@ async def resize_image(
             media_type=content_type,
             headers={
                 "Content-Disposition": f"attachment; filename=processed.{fmt.lower()}",
-                "Content-Length": str(len(processed_image))
+                "Content-Length": str(len(processed_image)),
+                "ETag": etag,
+                "X-Cache": cache_status,
+                **headers
             }
         )
     
+    except HTTPException:
+        raise
+    except InvalidImageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
+    except PoolTimeoutError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process image: {str(e)}"
         )
+    finally:
+        profiler.finish(profiling)
+        upload.cleanup()
 
 
+@router.post("/multi")
+async def multi_resize_image(
+    file: UploadFile = File(...),
+    presets: str = Form(...),
+    formats: str = Form("jpeg"),
+    quality: int = Form(85),
+    fit: str = Form("cover"),
+    bg_color: str = Form("#FFFFFF"),
+    strip_metadata: bool = Form(True),
+    profile: Optional[str] = Form(None),
+    current_user: Optional[CurrentUser] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Render one upload for several presets and formats, returned as a zip.
+    
+    Custom presets are only available to their owner, so using them
+    requires authentication.
+    """
+    _check_profile(profile)
+    preset_keys = [key.strip() for key in presets.split(",") if key.strip()]
+    fmts = [fmt.strip().lower() for fmt in formats.split(",") if fmt.strip()]
+    
+    # Validate renditions
+    unsupported = [fmt for fmt in fmts if fmt not in image_service.supported_formats]
+    if not preset_keys or not fmts or unsupported:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported formats: {', '.join(unsupported)}" if unsupported else "At least one preset and format is required"
+        )
+    if len(preset_keys) * len(fmts) > settings.max_renditions:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many renditions, maximum is {settings.max_renditions}"
+        )
+    
+    renditions = []
+    for key in preset_keys:
+        try:
+            preset = await preset_service.get_preset_async(key, db, current_user.id if current_user else None)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        for fmt in fmts:
+            renditions.append({
+                "name": f"{preset.key}.{fmt}",
+                "width": preset.w,
+                "height": preset.h,
+                "fmt": fmt,
+                # An explicit request profile wins over the preset's own
+                "profile": profile or preset.profile
+            })
+    
+    upload = await _ingest_upload(file)
+    try:
+        # Validate, decode once, render every preset/format
+        outputs = await image_service.process_image_multi_async(
+            file_content=upload.source,
+            renditions=renditions,
+            quality=quality,
+            fit=fit,
+            bg_color=bg_color,
+            strip_metadata=strip_metadata
+        )
+    
+    except HTTPException:
+        raise
+    except InvalidImageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
+    except PoolTimeoutError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to process image: {str(e)}"
+        )
+    finally:
+        upload.cleanup()
+    
+    # Stream the zip straight from the rendered outputs instead of copying them into a buffer
+    rendered = MemoryStorage()
+    for rendition, content in zip(renditions, outputs):
+        rendered.put(rendition["name"], content)
+    archive = ArchiveService(rendered).build([rendition["name"] for rendition in renditions])
+    
+    return StreamingResponse(
+        archive.iter_range(),
+        media_type=archive.media_type,
+        headers={
+            "Content-Disposition": "attachment; filename=renditions.zip",
+            "Content-Length": str(archive.size)
+        }
+    )
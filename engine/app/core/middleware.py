@@ -0,0 +1,82 @@
+import time
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from app.services.metrics import metrics
+
+REQUESTS = metrics.counter("http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+REQUEST_SECONDS = metrics.histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+REQUESTS_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over `max_body_size` while they stream in.
+
+    A declared Content-Length over the limit is refused before any of the
+    body is read; chunked bodies are counted and aborted once they overflow.
+    """
+
+    def __init__(self, app, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds maximum allowed size of {self.max_body_size // (1024*1024)}MB"
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            response = JSONResponse({"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Surfaces through the route as a regular 413 response
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class MetricsMiddleware:
+    """Count requests, time them per route and track how many are in flight.
+
+    Requests are labelled by route template rather than raw path, so
+    `/jobs/{job_id}` is one series however many jobs there are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=path)
+            REQUESTS.inc(method=scope["method"], route=path, status=str(status_code))
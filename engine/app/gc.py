@@ -0,0 +1,35 @@
+"""Output garbage collection entry point.
+
+Run with ``python -m app.gc`` from cron or a scheduled task. Deletes jobs
+past ``settings.output_retention_days`` and then every stored output that
+no remaining job item references.
+"""
+import argparse
+import logging
+from app.core.config import settings
+from app.database.base import SessionLocal
+from app.models import user  # noqa: F401 - register User for the Job relationship
+from app.services.storage import collect_orphans, expire_jobs, storage
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Delete expired jobs and orphaned outputs")
+    parser.add_argument("--retention-days", type=int, default=settings.output_retention_days)
+    parser.add_argument("--grace", type=float, default=settings.storage_gc_grace)
+    parser.add_argument("--dry-run", action="store_true", help="report orphans without deleting anything")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+
+    db = SessionLocal()
+    try:
+        if not args.dry_run:
+            logging.info("Deleted %d expired jobs", expire_jobs(db, args.retention_days))
+        orphans = collect_orphans(storage, db, grace=args.grace, dry_run=args.dry_run)
+    finally:
+        db.close()
+    print(f"{len(orphans)} orphaned outputs, {sum(obj.size for obj in orphans)} bytes{' (dry run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,38 @@
-import os
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
-from app.api import auth, presets, transform, jobs, health
+from app.core.middleware import BodySizeLimitMiddleware, MetricsMiddleware
+from app.api import admin, assets, auth, presets, transform, jobs, health, metrics
+from app.services.events import job_events
+from app.services.passwords import password_hasher
+from app.services.pool import cpu_pool
+
+logging.basicConfig(level=settings.log_level)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop shared resources."""
+    yield
+    cpu_pool.shutdown()
+    password_hasher.shutdown()
+    await job_events.close()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Creative Portal API",
     description="A production-ready image processing API for creative workflows",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Add CORS middleware
+# Abort oversized uploads while they stream in (allowance covers multipart framing and form fields)
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=settings.max_file_size + 1024 * 1024)
+
+# Add CORS middleware (added last so it wraps early 413 responses too)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
@@ -21,16 +41,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so request timings include every other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Include API routes
 app.include_router(auth.router)
 app.include_router(presets.router)
 app.include_router(transform.router)
 app.include_router(jobs.router)
 app.include_router(health.router)
-
-# Mount static files for assets
-if os.path.exists(settings.upload_dir):
-    app.mount("/assets", StaticFiles(directory=settings.upload_dir), name="assets")
+app.include_router(assets.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 @app.get("/")
 def root():
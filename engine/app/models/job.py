@@ -1,15 +1,15 @@
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Integer
+import uuid
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.base import Base
-from app.core.security import generate_uuid
 
 
 class Job(Base):
     __tablename__ = "jobs"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=generate_uuid)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     status = Column(String(50), default="queued", nullable=False)  # queued, processing, done, failed
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -18,21 +18,35 @@ class Job(Base):
     # Relationships
     user = relationship("User", back_populates="jobs")
     items = relationship("JobItem", back_populates="job", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Per-user job listings, newest first
+        Index("ix_jobs_user_id_created_at", "user_id", "created_at"),
+    )
 
 
 class JobItem(Base):
     __tablename__ = "job_items"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=generate_uuid)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     job_id = Column(UUID(as_uuid=True), ForeignKey("jobs.id"), nullable=False)
     src_path = Column(String(500), nullable=False)
     dst_path = Column(String(500), nullable=True)
     preset_key = Column(String(100), nullable=False)
-    fmt = Column(String(10), nullable=True)  # jpeg, png, webp, avif
+    fmt = Column(String(10), nullable=True)  # jpeg, png, webp, avif, gif
     params_json = Column(JSON, nullable=True)
-    status = Column(String(50), default="pending", nullable=False)  # pending, processing, done, failed
+    status = Column(String(50), default="pending", nullable=False, index=True)  # pending, processing, done, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    locked_until = Column(DateTime, nullable=True)  # visibility timeout while processing, retry delay while pending
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships
     job = relationship("Job", back_populates="items")
+    
+    __table_args__ = (
+        # Per-job status counts and finished-result pages
+        Index("ix_job_items_job_id_status", "job_id", "status"),
+    )
 
 
@@ -0,0 +1,18 @@
+import uuid
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+from app.database.base import Base
+
+
+class CustomPreset(Base):
+    __tablename__ = "custom_presets"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    key = Column(String(100), unique=True, index=True, nullable=False)  # custom-<hex>, never clashes with built-ins
+    label = Column(String(255), nullable=False)
+    w = Column(Integer, nullable=False)
+    h = Column(Integer, nullable=False)
+    profile = Column(String(20), nullable=True)  # encode profile: fast, balanced or smallest
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
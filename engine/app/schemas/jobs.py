@@ -8,14 +8,21 @@ class JobItemRequest(BaseModel):
     file: Optional[str] = None  # filename if source is 'upload'
     url: Optional[str] = None  # URL if source is 'url'
     preset_key: str
-    fmt: Optional[str] = None  # jpeg, png, webp, avif
+    fmt: Optional[str] = None  # jpeg, png, webp, avif, gif
     quality: Optional[int] = None  # 5-100
+    profile: Optional[str] = None  # encode profile: fast, balanced or smallest
+    max_frames: Optional[int] = None  # frames kept from animated sources (webp and gif outputs)
+    dedupe_frames: bool = False  # merge consecutive identical frames of animated outputs
 
 
 class JobCreate(BaseModel):
     items: List[JobItemRequest]
 
 
+class JobUploadResponse(BaseModel):
+    file: str  # reference to pass as JobItemRequest.file
+
+
 class JobItemResult(BaseModel):
     filename: str
     url: str
@@ -25,6 +32,8 @@ class JobResponse(BaseModel):
     id: str
     status: str
     results: Optional[List[JobItemResult]] = None
+    counts: Optional[Dict[str, int]] = None  # items per status
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page of results
     created_at: datetime
     updated_at: datetime
     
@@ -32,3 +41,8 @@ class JobResponse(BaseModel):
         from_attributes = True
 
 
+class JobListResponse(BaseModel):
+    jobs: List[JobResponse]
+    next_cursor: Optional[str] = None
+
+
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 
 class Preset(BaseModel):
@@ -7,6 +7,7 @@ class Preset(BaseModel):
     label: str
     w: int
     h: int
+    profile: Optional[str] = None  # encode profile: fast, balanced or smallest
 
 
 class PresetGroup(BaseModel):
@@ -19,3 +20,8 @@ class PresetsResponse(BaseModel):
     groups: List[PresetGroup]
 
 
+class CustomPresetCreate(BaseModel):
+    label: str = Field(..., min_length=1, max_length=255)
+    w: int = Field(..., gt=0, le=16384)
+    h: int = Field(..., gt=0, le=16384)
+    profile: Optional[str] = None  # encode profile: fast, balanced or smallest
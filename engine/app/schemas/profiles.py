@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+from datetime import datetime
+
+
+class ProfileInfo(BaseModel):
+    id: str
+    target: str  # e.g. "POST /transform/resize" or "job item <id>"
+    trigger: str  # header or sample
+    created_at: datetime
+    seconds: float
+    peak_traced_bytes: int
+    stages: Dict[str, float]  # seconds per pipeline stage
+    summary: Optional[str] = None  # top functions by cumulative time
+
+
+class ProfileListResponse(BaseModel):
+    profiles: List[ProfileInfo]
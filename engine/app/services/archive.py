@@ -0,0 +1,226 @@
+import hashlib
+import struct
+import tarfile
+import time
+import zlib
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from app.services.storage import StorageBackend, storage as default_storage
+
+# Sizes and offsets at or above these need zip64 records
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_ENTRY_LIMIT = 0xFFFF
+
+ZIP_UTF8_FLAG = 0x0800
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    key: str  # storage name
+    size: int
+    mtime: float
+
+
+# A segment is either literal bytes (built lazily for zip headers, which need
+# the entry's CRC) or the contents of an entry's stored object
+Segment = Tuple[int, Union[Callable[[], bytes], ArchiveEntry]]
+
+
+class StreamingArchive:
+    """A zip or tar of files, generated on the fly with a known layout.
+
+    Entries are stored rather than compressed, so every header and file
+    offset is known before any byte is read; that gives an exact
+    Content-Length and lets any byte range be produced with ranged reads
+    from storage, which is what makes `Range` resumes possible without a
+    temporary archive.
+    """
+
+    media_types = {"zip": "application/zip", "tar": "application/x-tar"}
+
+    def __init__(
+        self,
+        entries: List[ArchiveEntry],
+        storage: StorageBackend,
+        fmt: str = "zip",
+        chunk_size: int = 1024 * 1024
+    ):
+        if fmt not in self.media_types:
+            raise ValueError(f"Unsupported archive format '{fmt}'")
+        self.entries = entries
+        self.storage = storage
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self._crcs: Dict[str, int] = {}
+        self._segments: List[Segment] = self._zip_layout() if fmt == "zip" else self._tar_layout()
+        self.size = sum(length for length, _ in self._segments)
+
+        digest = hashlib.sha256(fmt.encode())
+        for entry in entries:
+            digest.update(f"\0{entry.name}\0{entry.size}\0{entry.mtime!r}".encode())
+        self.etag = f'"{digest.hexdigest()[:32]}"'
+
+    @property
+    def media_type(self) -> str:
+        return self.media_types[self.fmt]
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the archive bytes in [start, end)."""
+        end = self.size if end is None else min(end, self.size)
+        offset = 0
+        for length, source in self._segments:
+            seg_start, seg_end = max(start - offset, 0), min(end - offset, length)
+            offset += length
+            if seg_start >= seg_end:
+                if offset >= end:
+                    break
+                continue
+            if isinstance(source, ArchiveEntry):
+                yield from self._read(source, seg_start, seg_end)
+            else:
+                yield source()[seg_start:seg_end]
+
+    def _read(self, entry: ArchiveEntry, start: int, end: int) -> Iterator[bytes]:
+        remaining = end - start
+        for chunk in self.storage.read(entry.key, start, end, chunk_size=self.chunk_size):
+            remaining -= len(chunk)
+            yield chunk
+        if remaining:
+            # The layout is fixed, so an object that shrank cannot be patched over
+            raise OSError(f"{entry.key} changed while being archived")
+
+    def _crc(self, entry: ArchiveEntry) -> int:
+        crc = self._crcs.get(entry.key)
+        if crc is None:
+            crc = 0
+            for chunk in self._read(entry, 0, entry.size):
+                crc = zlib.crc32(chunk, crc)
+            self._crcs[entry.key] = crc
+        return crc
+
+    def _zip_layout(self) -> List[Segment]:
+        segments: List[Segment] = []
+        offset = 0
+        records = []
+        for entry in self.entries:
+            name = entry.name.encode()
+            zip64 = entry.size >= ZIP32_LIMIT
+            extra_len = 20 if zip64 else 0
+            header_len = 30 + len(name) + extra_len
+            segments.append((header_len, self._lazy(self._local_header, entry, name, zip64)))
+            segments.append((entry.size, entry))
+            records.append((entry, name, offset))
+            offset += header_len + entry.size
+
+        cd_len = 0
+        for entry, name, local_offset in records:
+            extra_len = (16 if entry.size >= ZIP32_LIMIT else 0) + (8 if local_offset >= ZIP32_LIMIT else 0)
+            cd_len += 46 + len(name) + (4 + extra_len if extra_len else 0)
+        zip64_end = len(records) >= ZIP32_ENTRY_LIMIT or cd_len >= ZIP32_LIMIT or offset >= ZIP32_LIMIT
+        end_len = cd_len + 22 + (56 + 20 if zip64_end else 0)
+        segments.append((end_len, self._lazy(self._central_directory, records, offset, cd_len, zip64_end)))
+        return segments
+
+    def _local_header(self, entry: ArchiveEntry, name: bytes, zip64: bool) -> bytes:
+        dos_time, dos_date = self._dos_datetime(entry.mtime)
+        size = ZIP32_LIMIT if zip64 else entry.size
+        extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, entry.size) if zip64 else b""
+        return struct.pack(
+            "<4s5H3L2H", b"PK\x03\x04", 45 if zip64 else 20, ZIP_UTF8_FLAG, 0,
+            dos_time, dos_date, self._crc(entry), size, size, len(name), len(extra)
+        ) + name + extra
+
+    def _central_directory(self, records, cd_offset: int, cd_len: int, zip64_end: bool) -> bytes:
+        parts = []
+        for entry, name, local_offset in records:
+            dos_time, dos_date = self._dos_datetime(entry.mtime)
+            fields = []
+            size = entry.size
+            if entry.size >= ZIP32_LIMIT:
+                fields += [entry.size, entry.size]
+                size = ZIP32_LIMIT
+            if local_offset >= ZIP32_LIMIT:
+                fields.append(local_offset)
+                local_offset = ZIP32_LIMIT
+            extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields) if fields else b""
+            version = 45 if fields else 20
+            parts.append(struct.pack(
+                "<4s6H3L5H2L", b"PK\x01\x02", (3 << 8) | version, version, ZIP_UTF8_FLAG, 0,
+                dos_time, dos_date, self._crc(entry), size, size, len(name), len(extra), 0,
+                0, 0, 0o100644 << 16, local_offset
+            ) + name + extra)
+
+        count = len(records)
+        if zip64_end:
+            parts.append(struct.pack(
+                "<4sQ2H2L4Q", b"PK\x06\x06", 44, (3 << 8) | 45, 45, 0, 0, count, count, cd_len, cd_offset
+            ))
+            parts.append(struct.pack("<4sLQL", b"PK\x06\x07", 0, cd_offset + cd_len, 1))
+        # Fields that overflow are saturated; readers take them from the zip64 record
+        count = 0xFFFF if count >= ZIP32_ENTRY_LIMIT else count
+        parts.append(struct.pack(
+            "<4s4H2LH", b"PK\x05\x06", 0, 0, count, count,
+            min(cd_len, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF), 0
+        ))
+        return b"".join(parts)
+
+    def _tar_layout(self) -> List[Segment]:
+        segments: List[Segment] = []
+        for entry in self.entries:
+            info = tarfile.TarInfo(entry.name)
+            info.size = entry.size
+            info.mtime = int(entry.mtime)
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT)
+            segments.append((len(header), self._lazy(lambda header=header: header)))
+            segments.append((entry.size, entry))
+            padding = -entry.size % tarfile.BLOCKSIZE
+            if padding:
+                segments.append((padding, self._lazy(bytes, padding)))
+        segments.append((2 * tarfile.BLOCKSIZE, self._lazy(bytes, 2 * tarfile.BLOCKSIZE)))
+        return segments
+
+    @staticmethod
+    def _lazy(fn: Callable[..., bytes], *args) -> Callable[[], bytes]:
+        cached: List[bytes] = []
+
+        def build() -> bytes:
+            if not cached:
+                cached.append(fn(*args))
+            return cached[0]
+        return build
+
+    @staticmethod
+    def _dos_datetime(mtime: float) -> Tuple[int, int]:
+        t = time.localtime(max(mtime, 315532800))  # DOS dates start in 1980
+        return (
+            (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((min(t.tm_year, 2107) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        )
+
+
+class ArchiveService:
+    """Builds streaming archives of job outputs."""
+
+    def __init__(self, storage: StorageBackend, chunk_size: int = 1024 * 1024):
+        self.storage = storage
+        self.chunk_size = chunk_size
+
+    def build(self, names: List[str], fmt: str = "zip") -> StreamingArchive:
+        """Archive the given stored outputs, skipping any that no longer exist."""
+        entries = []
+        seen = set()
+        for key in names:
+            obj = self.storage.stat(key)
+            if obj is None:
+                continue
+            name = key
+            if name in seen:
+                # Identical renditions share one object; give each item its own entry
+                root, ext = name.rsplit(".", 1)
+                name = f"{root}-{len(seen)}.{ext}"
+            seen.add(name)
+            entries.append(ArchiveEntry(name=name, key=key, size=obj.size, mtime=obj.mtime))
+        return StreamingArchive(entries, self.storage, fmt=fmt, chunk_size=self.chunk_size)
+
+
+archive_service = ArchiveService(default_storage)
@@ -0,0 +1,83 @@
+import base64
+import hashlib
+import hmac
+import re
+import time
+from typing import Optional
+from app.core.config import settings
+from app.services.storage import StoredObject
+
+# Storage names of outputs; no path separators, so uploaded sources and the
+# rendition cache can never be addressed
+ASSET_NAME = re.compile(r"^([A-Za-z0-9_-]{1,128})\.(jpeg|png|webp|avif|gif)$")
+CONTENT_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AssetService:
+    """Names and signs rendered outputs.
+
+    Outputs are named by the sha256 of their bytes, so a name never
+    changes meaning: it doubles as a strong ETag and the file can be
+    cached forever. Access is granted by an HMAC over the name and an
+    expiry time, so checking a URL needs no database lookup.
+    """
+
+    media_types = {
+        "jpeg": "image/jpeg",
+        "png": "image/png",
+        "webp": "image/webp",
+        "avif": "image/avif",
+        "gif": "image/gif"
+    }
+
+    def __init__(self, secret: str, url_ttl: int = 3600):
+        self.secret = secret.encode()
+        self.url_ttl = max(url_ttl, 1)
+
+    @staticmethod
+    def name_for(content: bytes, fmt: str) -> str:
+        """Content-addressed file name for an encoded output."""
+        return f"{hashlib.sha256(content).hexdigest()}.{fmt}"
+
+    def url_for(self, name: str, now: Optional[float] = None) -> str:
+        """Signed URL for an asset, valid for between one and two `url_ttl` periods.
+
+        Expiry is rounded up to a period boundary, so repeated calls in the
+        same period return the same URL and clients can cache it.
+        """
+        now = time.time() if now is None else now
+        expires = (int(now) // self.url_ttl + 2) * self.url_ttl
+        return f"/assets/{name}?expires={expires}&sig={self._sign(name, expires)}"
+
+    def verify(self, name: str, expires: int, sig: str, now: Optional[float] = None) -> bool:
+        """Check a URL's signature and expiry."""
+        now = time.time() if now is None else now
+        if expires < now:
+            return False
+        return hmac.compare_digest(self._sign(name, expires), sig)
+
+    @staticmethod
+    def is_asset_name(name: str) -> bool:
+        """Whether a name is in the output namespace."""
+        return ASSET_NAME.match(name) is not None
+
+    @staticmethod
+    def etag(obj: StoredObject) -> str:
+        stem = obj.name.rsplit(".", 1)[0]
+        if CONTENT_HASH.match(stem):
+            return f'"{stem}"'
+        # Outputs written before content addressing
+        return f'"{stem}-{obj.size}-{int(obj.mtime * 1000)}"'
+
+    def media_type(self, name: str) -> str:
+        return self.media_types[name.rsplit(".", 1)[1]]
+
+    def _sign(self, name: str, expires: int) -> str:
+        digest = hmac.new(self.secret, f"{name}\n{expires}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:18]).decode()
+
+
+asset_service = AssetService(
+    secret=settings.asset_secret,
+    url_ttl=settings.asset_url_ttl
+)
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import event, inspect
+from app.core.config import settings
+from app.core.security import verify_token
+from app.models.user import User
+
+
+class CurrentUser:
+    """Session-independent view of the authenticated user.
+
+    Holds only what request handlers need, so it can be cached across
+    requests without keeping ORM instances or their sessions alive.
+    """
+
+    def __init__(self, id: UUID, email: str, created_at: datetime):
+        self.id = id
+        self.email = email
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(id=user.id, email=user.email, created_at=user.created_at)
+
+
+class AuthCache:
+    """TTL-bounded LRU cache of verified token claims and user principals.
+
+    Claims are kept until the token expires or `ttl` passes, whichever is
+    first. Principals are dropped when the user row changes in this
+    process; other processes see the change after at most `ttl` seconds.
+    """
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # sha256(token) -> (claims, expires at)
+        self._tokens: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        # email -> (principal, expires at)
+        self._users: "OrderedDict[str, Tuple[CurrentUser, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Wall clock, comparable with token exp claims
+        self.clock = time.time
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def verify_token(self, token: str) -> Optional[Dict[str, Any]]:
+        """Decode and verify a JWT, reusing earlier verifications of the same token."""
+        if not self.enabled:
+            return verify_token(token)
+
+        # Key on a digest so raw bearer tokens are not kept around
+        key = hashlib.sha256(token.encode()).hexdigest()
+        now = self.clock()
+        with self._lock:
+            claims = self._get(self._tokens, key, now)
+        if claims is not None:
+            return claims
+
+        claims = verify_token(token)
+        if claims is None:
+            return None
+
+        expires_at = now + self.ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, claims["exp"])
+        with self._lock:
+            self._put(self._tokens, key, claims, expires_at)
+        return claims
+
+    def get_user(self, email: str) -> Optional[CurrentUser]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._get(self._users, email, self.clock())
+
+    def put_user(self, user: CurrentUser) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._put(self._users, user.email, user, self.clock() + self.ttl)
+
+    def invalidate_user(self, email: str) -> None:
+        with self._lock:
+            self._users.pop(email, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+
+    def _get(self, entries: OrderedDict, key: str, now: float) -> Any:
+        """Return a live entry and mark it recently used. Caller holds the lock."""
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= now:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _put(self, entries: OrderedDict, key: str, value: Any, expires_at: float) -> None:
+        """Insert an entry and evict least recently used ones. Caller holds the lock."""
+        entries[key] = (value, expires_at)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+auth_cache = AuthCache(ttl=settings.auth_cache_ttl, max_entries=settings.auth_cache_max_entries)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(_mapper, _connection, target: User) -> None:
+    """Drop cached principals for a changed or deleted user, under old and new email."""
+    auth_cache.invalidate_user(target.email)
+    for email in inspect(target).attrs.email.history.deleted or ():
+        auth_cache.invalidate_user(email)
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+
+
+class RenditionCache:
+    """Two-tier (memory, then disk) LRU cache of encoded renditions.
+
+    Keys are content addresses: the sha256 of the source bytes plus the
+    normalized transform parameters, so they double as strong ETags.
+    """
+
+    # Bump when the same parameters start producing different output, so
+    # entries on disk and clients' ETags from older releases stop matching.
+    # 2: GIF and WebP sources stay animated in webp and gif output
+    key_version = 2
+
+    def __init__(self, cache_dir: str, memory_limit: int, disk_limit: int):
+        self.cache_dir = cache_dir
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        # key -> size, oldest first; loaded from disk on first use
+        self._disk: Optional["OrderedDict[str, int]"] = None
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def make_key(
+        self,
+        source_sha256: str,
+        width: int,
+        height: int,
+        fmt: str,
+        quality: int,
+        fit: str,
+        bg_color: str,
+        strip_metadata: bool,
+        profile: str = "balanced",
+        target: Optional[Dict[str, Any]] = None,
+        animation: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Content address for a source and its transform parameters.
+
+        `target` holds the parameters of a quality search; its entry stores
+        the chosen quality rather than the rendition itself. `animation`
+        holds frame options for animated outputs.
+        """
+        params = {
+            "version": self.key_version,
+            "width": width,
+            "height": height,
+            "fmt": fmt.lower(),
+            "quality": quality,
+            "fit": fit.lower() if fit.lower() in ("contain", "stretch") else "cover",
+            "bg_color": bg_color.lower(),
+            "strip_metadata": strip_metadata,
+            "profile": profile,
+            # Output also depends on the decode/resize trade-off
+            "resize_quality": settings.resize_quality
+        }
+        if target:
+            params["target"] = target
+        if animation:
+            params["animation"] = animation
+        digest = hashlib.sha256(source_sha256.encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return a cached rendition, promoting disk hits to memory."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            self._store_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store a rendition in both tiers."""
+        with self._lock:
+            self._store_memory(key, data)
+        self._write_disk(key, data)
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        return await run_in_threadpool(self.get, key)
+
+    async def put_async(self, key: str, data: bytes) -> None:
+        await run_in_threadpool(self.put, key, data)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current tier sizes."""
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size
+        }
+
+    def clear(self) -> None:
+        """Drop the memory tier and reset counters."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            self.hits_memory = self.hits_disk = self.misses = 0
+
+    def _store_memory(self, key: str, data: bytes) -> None:
+        """Insert into the memory tier and evict least recently used entries. Caller holds the lock."""
+        if len(data) > self.memory_limit:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _load_disk_index(self) -> None:
+        """Index existing cache files by access time. Caller holds the lock."""
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _dirs, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name, stat.st_size))
+        entries.sort()
+        self._disk = OrderedDict((name, size) for _mtime, name, size in entries)
+        self._disk_size = sum(size for _mtime, _name, size in entries)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if self.disk_limit <= 0:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # mtime doubles as last access time for LRU across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._disk is not None and key in self._disk:
+                self._disk.move_to_end(key)
+        return data
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        if self.disk_limit <= 0 or len(data) > self.disk_limit:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            if self._disk is None:
+                self._load_disk_index()
+            if key not in self._disk:
+                self._disk_size += len(data)
+            self._disk[key] = len(data)
+            self._disk.move_to_end(key)
+            while self._disk_size > self.disk_limit and self._disk:
+                evicted_key, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                evicted.append(evicted_key)
+
+        # Other engine processes share the directory, so a file may already be gone
+        for evicted_key in evicted:
+            try:
+                os.remove(self._path(evicted_key))
+            except FileNotFoundError:
+                pass
+
+
+rendition_cache = RenditionCache(
+    cache_dir=os.path.join(settings.upload_dir, "cache"),
+    memory_limit=settings.rendition_cache_memory_mb * 1024 * 1024,
+    disk_limit=settings.rendition_cache_disk_mb * 1024 * 1024
+)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Postgres NOTIFY payloads are limited to 8000 bytes
+MAX_ERROR_LENGTH = 1000
+
+
+class JobEventBus:
+    """Fan-out of job and item status transitions to interested listeners.
+
+    Publishers are the job queue's transactions. On Postgres an event is
+    sent with pg_notify inside that transaction, so it is delivered to every
+    API process (each holds one LISTEN connection) only if the transaction
+    commits. Other databases have no cross-process channel, so events are
+    delivered in-process after commit.
+    """
+
+    def __init__(self, channel: str = "job_events", database_url: Optional[str] = None):
+        self.channel = channel
+        self.database_url = database_url
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def uses_postgres(self) -> bool:
+        return bool(self.database_url) and self.database_url.startswith("postgresql")
+
+    def publish(self, db: Session, payload: Dict[str, Any]) -> None:
+        """Queue an event on the session's current transaction."""
+        if payload.get("error"):
+            payload = {**payload, "error": payload["error"][:MAX_ERROR_LENGTH]}
+        if db.bind.dialect.name == "postgresql":
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": json.dumps(payload)}
+            )
+        else:
+            db.info.setdefault("job_events", []).append((self, payload))
+
+    async def subscribe(self, job_id: str) -> "JobSubscription":
+        """Start receiving events for one job.
+        
+        Events published after this returns are not missed, so callers can
+        subscribe first and then read the job's current state.
+        """
+        subscription = JobSubscription(self, job_id)
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscription.entry)
+        if self.uses_postgres:
+            await self._ensure_listener()
+        return subscription
+
+    def unsubscribe(self, subscription: "JobSubscription") -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.job_id)
+            if subscribers is not None:
+                subscribers.discard(subscription.entry)
+                if not subscribers:
+                    del self._subscribers[subscription.job_id]
+
+    def dispatch(self, payload: Dict[str, Any]) -> None:
+        """Deliver an event to this process's subscribers; safe from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(payload.get("job_id"), ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, payload)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                pass
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            await listener.close()
+
+    async def _ensure_listener(self) -> None:
+        """Open (or reopen after a dropped connection) this process's LISTEN connection."""
+        if self._listener is not None and not self._listener.is_closed():
+            return
+        if self._listener_lock is None:
+            self._listener_lock = asyncio.Lock()
+        async with self._listener_lock:
+            if self._listener is not None and not self._listener.is_closed():
+                return
+            import asyncpg
+
+            # asyncpg takes a plain libpq URL, without SQLAlchemy's driver suffix
+            scheme, sep, rest = self.database_url.partition("://")
+            try:
+                connection = await asyncpg.connect(f"postgresql{sep}{rest}")
+                await connection.add_listener(self.channel, self._on_notify)
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("Could not listen for job events: %s", e)
+                return
+            self._listener = connection
+
+    def _on_notify(self, _connection, _pid, _channel, payload: str) -> None:
+        try:
+            self.dispatch(json.loads(payload))
+        except ValueError:
+            logger.warning("Ignoring malformed job event %r", payload)
+
+
+class JobSubscription:
+    """Events for one job, buffered until read."""
+
+    def __init__(self, bus: JobEventBus, job_id: str):
+        self.bus = bus
+        self.job_id = job_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.entry = (asyncio.get_running_loop(), self.queue)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None if none arrived within `timeout` seconds."""
+        if self.bus.uses_postgres:
+            # Reconnects if the LISTEN connection dropped since the last event
+            await self.bus._ensure_listener()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_committed(session: Session) -> None:
+    for bus, payload in session.info.pop("job_events", ()):
+        bus.dispatch(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop("job_events", None)
+
+
+job_events = JobEventBus(database_url=settings.database_url)
@@ -1,9 +1,82 @@
+import asyncio
 import os
 import io
+import math
+import time
+import zlib
 import magic
-from typing import Tuple, Optional
-from PIL import Image, ImageOps
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Tuple, Optional, Union
+from PIL import ExifTags, Image, ImageChops, ImageOps, ImageStat
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.services.metrics import Record, metrics
+from app.services.pool import cpu_pool
+from app.services.profiling import Profile, profiler
+from app.services.strips import StripImage, open_strips
+
+# Image bytes, or a path to a spooled upload on disk
+ImageSource = Union[bytes, str]
+
+STAGE_SECONDS = metrics.histogram(
+    "image_stage_seconds",
+    "Time spent in each image pipeline stage",
+    ["stage", "input_format", "output_format", "fit"]
+)
+BYTES_IN = metrics.counter("image_bytes_in_total", "Source bytes read by the image pipeline", ["input_format"])
+BYTES_OUT = metrics.counter("image_bytes_out_total", "Encoded bytes produced by the image pipeline", ["output_format"])
+
+# Labels for stage timings of the pipeline run in progress
+_pipeline_labels: ContextVar[Dict[str, str]] = ContextVar(
+    "pipeline_labels", default={"input_format": "", "output_format": "", "fit": ""}
+)
+
+
+class InvalidImageError(ValueError):
+    """Raised when a source is not an acceptable image."""
+
+
+class ImageProbe:
+    """Header-level facts about a source image, gathered in a single parse.
+    
+    Keeps the opened (not yet decoded) image so processing in the same
+    process can continue from it without calling Image.open() again.
+    """
+    
+    def __init__(self, image: Image.Image, file_size: int):
+        self.image = image
+        self.file_size = file_size
+        self.format = image.format
+        self.width, self.height = image.size
+        self.mode = image.mode
+        self.orientation = self._orientation(image)
+        self.icc_profile = image.info.get('icc_profile')
+        self.frame_count = getattr(image, 'n_frames', 1)
+    
+    @staticmethod
+    def _orientation(image: Image.Image) -> int:
+        # PngImageFile.getexif() decodes every pixel looking for an eXIf chunk
+        # after the image data; like browsers, only honour one ahead of it
+        if image.format == 'PNG' and 'exif' not in image.info:
+            return 1
+        return image.getexif().get(ExifTags.Base.Orientation, 1)
+    
+    @property
+    def megapixels(self) -> float:
+        return (self.width * self.height) / (1024 * 1024)
+    
+    def close(self) -> None:
+        """Release the underlying file handle."""
+        self.image.close()
+
+
+class AnimationPlan(NamedTuple):
+    """The source frames an animated output keeps."""
+    source_format: str  # stage timing label of the source format
+    frame_count: int  # frames in the source
+    frames: List[int]  # indices of the kept frames, ascending
+    loop: Optional[int]  # 0 loops forever, None plays once
 
 
 class ImageService:
@@ -12,102 +85,915 @@ class ImageService:
             'jpeg': 'JPEG',
             'png': 'PNG',
             'webp': 'WEBP',
-            'avif': 'AVIF'
+            'avif': 'AVIF',
+            'gif': 'GIF'
         }
+        # Encoders without a quality setting
+        self.quality_free_formats = ('PNG', 'GIF')
+        # Output formats multi-frame sources stay animated in; others get the first frame
+        self.animated_formats = ('WEBP', 'GIF')
+        self.animation_max_frames = settings.animation_max_frames
+        self.animation_max_megapixels = settings.animation_max_megapixels
+        self.animation_max_frame_bytes = settings.animation_max_frame_mb * 1024 * 1024
+        # Smallest share of an animation's frames worth its own pool task
+        self.animation_frames_per_task = 8
+        # Largest per-channel difference between frames merged by dedupe_frames
+        self.dedupe_tolerance = 8
         self.max_file_size = settings.max_file_size
         self.max_megapixels = settings.max_megapixels
+        # Sources that never need decoding whole (see _reducible) may be larger
+        self.max_strip_megapixels = settings.max_strip_megapixels
+        # Streamable sources at least this large are resized as they decode
+        self.strip_min_megapixels = settings.strip_min_megapixels
+        self.strip_buffer_bytes = settings.strip_buffer_mb * 1024 * 1024
+        # The limits above are enforced here; Pillow's own bomb check would refuse large sources at open()
+        Image.MAX_IMAGE_PIXELS = max(self.max_megapixels, self.max_strip_megapixels) * 1024 * 1024
+        # Modes Image.reduce() can downsample for the multi-rendition pyramid
+        self.pyramid_modes = ('L', 'LA', 'RGB', 'RGBA')
+        # Speed/quality trade-off for large downscales:
+        # (JPEG draft oversampling factor, resize reducing_gap)
+        self.resize_profiles = {
+            'best': (None, None),
+            'balanced': (2, 3.0),
+            'fast': (1, 2.0)
+        }
+        self.resize_quality = settings.resize_quality
+        # Encoder speed/size trade-offs, per output format
+        self.encode_profiles = {
+            'fast': {
+                'JPEG': {'optimize': False, 'progressive': False, 'subsampling': '4:2:0'},
+                'PNG': {'compress_level': 1},
+                'WEBP': {'method': 2},
+                'AVIF': {'speed': 9},
+                'GIF': {'optimize': False}
+            },
+            # What every request got before profiles existed
+            'balanced': {
+                'JPEG': {'optimize': True, 'progressive': False, 'subsampling': '4:2:0'},
+                'PNG': {'optimize': True},
+                'WEBP': {'method': 6},
+                'AVIF': {'speed': 6},
+                'GIF': {'optimize': True}
+            },
+            'smallest': {
+                'JPEG': {'optimize': True, 'progressive': True, 'subsampling': '4:2:0'},
+                'PNG': {'optimize': True},
+                'WEBP': {'method': 6},
+                'AVIF': {'speed': 4},
+                'GIF': {'optimize': True}
+            }
+        }
+        self.encode_profile = settings.encode_profile
+        # Formats Pillow's header parse vouches for; anything else is double-checked with libmagic
+        self.known_input_formats = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF', 'TIFF', 'BMP', 'AVIF'}
+        # Leading bytes of supported formats, checked before falling back to libmagic
+        self.signatures = [
+            (b'\xff\xd8\xff', 'image/jpeg'),
+            (b'\x89PNG\r\n\x1a\n', 'image/png'),
+            (b'GIF87a', 'image/gif'),
+            (b'GIF89a', 'image/gif'),
+            (b'II*\x00', 'image/tiff'),
+            (b'MM\x00*', 'image/tiff'),
+            (b'BM', 'image/bmp')
+        ]
     
-    def validate_image(self, file_content: bytes, filename: str) -> Tuple[bool, str]:
-        """Validate uploaded image file."""
+    def sniff_mime_type(self, head: bytes) -> str:
+        """Identify the MIME type from the first bytes of a file."""
+        for signature, mime_type in self.signatures:
+            if head.startswith(signature):
+                return mime_type
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'image/webp'
+        if head[4:12] in (b'ftypavif', b'ftypavis'):
+            return 'image/avif'
+        with self._stage('sniff'):
+            return magic.from_buffer(head, mime=True)
+    
+    def probe_image(self, file_content: ImageSource) -> ImageProbe:
+        """Validate a source and return its header facts in one pass.
+        
+        Raises InvalidImageError if the source is not an acceptable image.
+        """
         # Check file size
-        if len(file_content) > self.max_file_size:
-            return False, f"File size exceeds maximum allowed size of {self.max_file_size // (1024*1024)}MB"
+        size = len(file_content) if isinstance(file_content, bytes) else os.path.getsize(file_content)
+        if size > self.max_file_size:
+            raise InvalidImageError(f"File size exceeds maximum allowed size of {self.max_file_size // (1024*1024)}MB")
         
-        # Check magic bytes for image files
-        mime_type = magic.from_buffer(file_content, mime=True)
-        if not mime_type.startswith('image/'):
-            return False, "File is not a valid image"
+        # Parse the header; libmagic is only consulted when Pillow can't vouch for the format
+        started = time.perf_counter()
+        try:
+            image = Image.open(self._as_file(file_content))
+        except Exception as e:
+            if not self._magic_mime_type(file_content).startswith('image/'):
+                raise InvalidImageError("File is not a valid image")
+            raise InvalidImageError(f"Failed to process image: {str(e)}")
+        
+        STAGE_SECONDS.observe(
+            time.perf_counter() - started,
+            stage='header', input_format=self._format_label(image.format), output_format='', fit=''
+        )
+        
+        if image.format not in self.known_input_formats and not self._magic_mime_type(file_content).startswith('image/'):
+            image.close()
+            raise InvalidImageError("File is not a valid image")
         
         # Check megapixels
         try:
-            image = Image.open(io.BytesIO(file_content))
-            width, height = image.size
-            megapixels = (width * height) / (1024 * 1024)
-            if megapixels > self.max_megapixels:
-                return False, f"Image resolution exceeds maximum allowed megapixels of {self.max_megapixels}"
+            probe = ImageProbe(image, size)
         except Exception as e:
-            return False, f"Failed to process image: {str(e)}"
+            image.close()
+            raise InvalidImageError(f"Failed to process image: {str(e)}")
+        limit = self.max_strip_megapixels if self._reducible(probe) else self.max_megapixels
+        if probe.megapixels > limit:
+            probe.close()
+            raise InvalidImageError(f"Image resolution exceeds maximum allowed megapixels of {limit}")
+        
+        return probe
+    
+    def validate_image(self, file_content: ImageSource, filename: str) -> Tuple[bool, str]:
+        """Validate uploaded image file."""
+        try:
+            probe = self.probe_image(file_content)
+        except InvalidImageError as e:
+            return False, str(e)
         
+        probe.close()
         return True, "Valid image"
     
     def process_image(
         self,
-        file_content: bytes,
+        file_content: ImageSource,
         width: int,
         height: int,
         fmt: str = 'jpeg',
         quality: int = 85,
         fit: str = 'cover',
         bg_color: str = '#FFFFFF',
-        strip_metadata: bool = True
+        strip_metadata: bool = True,
+        profile: Optional[str] = None,
+        probe: Optional[ImageProbe] = None,
+        max_frames: Optional[int] = None,
+        dedupe_frames: bool = False
+    ) -> bytes:
+        """Process image with specified parameters.
+        
+        Validates the source unless a probe from probe_image() is passed in.
+        Multi-frame sources stay animated in WebP and GIF outputs, keeping
+        at most `max_frames` frames; with `dedupe_frames` consecutive
+        identical output frames are merged.
+        """
+        probe = probe or self.probe_image(file_content)
+        output_format = self.supported_formats.get(fmt.lower(), 'JPEG')
+        flatten = self._flattens(output_format)
+        with self._pipeline(probe, fmt, fit):
+            if self._animates(probe, output_format):
+                plan = self._plan_animation(probe, width, height, max_frames)
+                frames, durations = self._render_frames(probe, plan.frames, plan.frame_count, width, height, fit, bg_color)
+                return self._encode_animation(
+                    frames, durations, plan.loop, (width, height), output_format, quality, profile, dedupe_frames
+                )
+            
+            image = self._open_image(probe, [(width, height)], fit, strips=True)
+            
+            # Resize image
+            with self._stage('resize'):
+                resized_image = self._resize_image(image, width, height, fit, bg_color, flatten)
+            
+            return self._encode_image(resized_image, fmt, quality, bg_color, profile)
+    
+    def process_image_multi(
+        self,
+        file_content: ImageSource,
+        renditions: List[Dict[str, Any]],
+        quality: int = 85,
+        fit: str = 'cover',
+        bg_color: str = '#FFFFFF',
+        strip_metadata: bool = True,
+        profile: Optional[str] = None,
+        probe: Optional[ImageProbe] = None
+    ) -> List[bytes]:
+        """Render several sizes and formats from a single decode.
+        
+        Each rendition is a dict with ``width``, ``height``, ``fmt`` and an
+        optional ``profile`` overriding `profile`. Outputs are returned in
+        the same order.
+        """
+        probe = probe or self.probe_image(file_content)
+        with self._pipeline(probe, 'multi', fit):
+            image = self._open_image(probe, [(r['width'], r['height']) for r in renditions], fit)
+            with self._stage('resize'):
+                pyramid = self._build_pyramid(image, renditions, fit)
+            
+            # Renditions that differ only by format share one resize; contain
+            # letterboxes are composited per alpha support of the format
+            resized_cache: Dict[Tuple[int, int, bool], Image.Image] = {}
+            outputs = []
+            for rendition in renditions:
+                size = (rendition['width'], rendition['height'])
+                flatten = fit == 'contain' and self._flattens(
+                    self.supported_formats.get(rendition.get('fmt', 'jpeg').lower(), 'JPEG')
+                )
+                key = (*size, flatten)
+                if key not in resized_cache:
+                    source = self._pick_pyramid_level(pyramid, image.size, size, fit)
+                    with self._stage('resize'):
+                        resized_cache[key] = self._resize_image(source, size[0], size[1], fit, bg_color, flatten)
+                outputs.append(self._encode_image(
+                    resized_cache[key],
+                    rendition.get('fmt', 'jpeg'),
+                    quality,
+                    bg_color,
+                    rendition.get('profile') or profile
+                ))
+        
+        return outputs
+    
+    def process_image_to_target(
+        self,
+        file_content: ImageSource,
+        width: int,
+        height: int,
+        fmt: str = 'jpeg',
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None,
+        min_quality: int = 10,
+        max_quality: int = 95,
+        fit: str = 'cover',
+        bg_color: str = '#FFFFFF',
+        strip_metadata: bool = True,
+        profile: Optional[str] = None,
+        probe: Optional[ImageProbe] = None
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """Process image, searching for the encoder quality that meets a target.
+        
+        With `max_bytes` the highest quality whose output fits is chosen, with
+        `min_psnr` the lowest quality whose output is at least that close to
+        the resized image. The source is decoded and resized once; only the
+        encode is repeated. The search stops after
+        ``settings.quality_search_max_passes`` encodes or
+        ``settings.quality_search_time_budget`` seconds and returns the best
+        output found so far.
+        
+        Returns the output and a dict with the chosen ``quality``, the number
+        of encode ``passes`` and whether the target was ``met``.
+        """
+        if (max_bytes is None) == (min_psnr is None):
+            raise ValueError("Exactly one of max_bytes or min_psnr is required")
+        output_format = self.supported_formats.get(fmt.lower(), 'JPEG')
+        if output_format in self.quality_free_formats:
+            raise ValueError("Quality search requires a lossy format")
+        
+        probe = probe or self.probe_image(file_content)
+        if self._animates(probe, output_format):
+            raise InvalidImageError("Quality search is not supported for animated images; limit max_frames instead")
+        with self._pipeline(probe, fmt, fit):
+            return self._search_quality(
+                probe, width, height, output_format, max_bytes, min_psnr, min_quality, max_quality, fit, bg_color, profile
+            )
+    
+    def _search_quality(
+        self,
+        probe: ImageProbe,
+        width: int,
+        height: int,
+        output_format: str,
+        max_bytes: Optional[int],
+        min_psnr: Optional[float],
+        min_quality: int,
+        max_quality: int,
+        fit: str,
+        bg_color: str,
+        profile: Optional[str]
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """Decode and resize once, then bisect over the encoder quality."""
+        image = self._open_image(probe, [(width, height)], fit, strips=True)
+        with self._stage('resize'):
+            resized_image = self._resize_image(image, width, height, fit, bg_color, self._flattens(output_format))
+        with self._stage('flatten'):
+            prepared = self._prepare_for_encode(resized_image, output_format, bg_color)
+        
+        deadline = time.monotonic() + settings.quality_search_time_budget
+        outputs: Dict[int, bytes] = {}
+        
+        def meets(quality: int) -> bool:
+            with self._stage('encode'):
+                outputs[quality] = self._save(prepared, output_format, quality, profile)
+            if max_bytes is not None:
+                return len(outputs[quality]) <= max_bytes
+            with self._stage('psnr'):
+                return self._psnr(prepared, outputs[quality]) >= min_psnr
+        
+        # Quality is monotonic in both size and fidelity, so bisect over it.
+        # For max_bytes we want the highest passing quality, for min_psnr the lowest.
+        low, high = min_quality, max_quality
+        best = None
+        # Try the cheap answer first: the ceiling fits, or the floor is good enough
+        first = max_quality if max_bytes is not None else min_quality
+        if meets(first):
+            best = first
+        elif max_bytes is not None:
+            high = first - 1
+        else:
+            low = first + 1
+        
+        while (
+            best != first
+            and low <= high
+            and len(outputs) < settings.quality_search_max_passes
+            and time.monotonic() < deadline
+        ):
+            mid = (low + high) // 2
+            if meets(mid):
+                best = mid
+                if max_bytes is not None:
+                    low = mid + 1
+                else:
+                    high = mid - 1
+            elif max_bytes is not None:
+                high = mid - 1
+            else:
+                low = mid + 1
+        
+        met = best is not None
+        if not met:
+            # Nothing passed: fall back to the closest attempt
+            best = min(outputs) if max_bytes is not None else max(outputs)
+        
+        BYTES_OUT.inc(len(outputs[best]), output_format=self._format_label(output_format))
+        return outputs[best], {"quality": best, "passes": len(outputs), "met": met}
+    
+    def plan_animation(
+        self,
+        file_content: ImageSource,
+        width: int,
+        height: int,
+        fmt: str = 'webp',
+        quality: int = 85,
+        fit: str = 'cover',
+        bg_color: str = '#FFFFFF',
+        strip_metadata: bool = True,
+        profile: Optional[str] = None,
+        max_frames: Optional[int] = None
+    ) -> Union[bytes, AnimationPlan]:
+        """Plan the frames of an animated output, to be rendered by several workers.
+        
+        Sources that don't stay animated in `fmt` are processed right away
+        and their output returned instead, as by process_image().
+        """
+        probe = self.probe_image(file_content)
+        output_format = self.supported_formats.get(fmt.lower(), 'JPEG')
+        if not self._animates(probe, output_format):
+            return self.process_image(
+                file_content, width, height, fmt, quality, fit, bg_color, strip_metadata, profile, probe=probe
+            )
+        with self._pipeline(probe, fmt, fit):
+            return self._plan_animation(probe, width, height, max_frames)
+    
+    def render_frames(
+        self,
+        file_content: ImageSource,
+        plan: AnimationPlan,
+        frames: List[int],
+        end: int,
+        width: int,
+        height: int,
+        fmt: str,
+        fit: str,
+        bg_color: str
+    ) -> Tuple[List[bytes], List[int]]:
+        """Resize a run of a plan's kept frames, ending before source frame `end`."""
+        probe = self.probe_image(file_content)
+        with self._labels(plan.source_format, fmt, fit):
+            return self._render_frames(probe, frames, end, width, height, fit, bg_color)
+    
+    def encode_animation(
+        self,
+        plan: AnimationPlan,
+        frames: List[bytes],
+        durations: List[int],
+        width: int,
+        height: int,
+        fmt: str,
+        quality: int,
+        fit: str,
+        profile: Optional[str],
+        dedupe_frames: bool
+    ) -> bytes:
+        """Encode frames from render_frames() as one animation."""
+        output_format = self.supported_formats.get(fmt.lower(), 'JPEG')
+        with self._labels(plan.source_format, fmt, fit):
+            return self._encode_animation(
+                frames, durations, plan.loop, (width, height), output_format, quality, profile, dedupe_frames
+            )
+    
+    def _animates(self, probe: ImageProbe, output_format: str) -> bool:
+        return probe.frame_count > 1 and output_format in self.animated_formats
+    
+    def _plan_animation(self, probe: ImageProbe, width: int, height: int, max_frames: Optional[int]) -> AnimationPlan:
+        """Choose the frames to keep within the per-request budget.
+        
+        Frames are coalesced onto the ones before them, so every source
+        frame is decoded; the source may have at most
+        ``animation_max_megapixels`` across all its frames. The output keeps
+        at most `max_frames`, ``animation_max_frames`` and as many frames as
+        fit in ``animation_max_frame_bytes`` of RGBA at the output size; the
+        rest are dropped evenly.
+        Raises InvalidImageError if the source is over budget.
+        """
+        count = probe.frame_count
+        if count * probe.megapixels > self.animation_max_megapixels:
+            raise InvalidImageError(
+                f"Animation exceeds maximum of {self.animation_max_megapixels} megapixels across all frames"
+            )
+        # The encoder holds every kept frame decompressed at once
+        budget = int(self.animation_max_frame_bytes // (width * height * 4))
+        keep = max(min(count, self.animation_max_frames, max_frames or count, budget), 1)
+        
+        # WebP stores how many times to play, GIF how many times to repeat
+        loop = probe.image.info.get('loop')
+        if probe.format == 'WEBP' and loop == 1:
+            loop = None
+        return AnimationPlan(
+            source_format=self._format_label(probe.format),
+            frame_count=count,
+            frames=[index * count // keep for index in range(keep)],
+            loop=loop
+        )
+    
+    def _render_frames(
+        self,
+        probe: ImageProbe,
+        frames: List[int],
+        end: int,
+        width: int,
+        height: int,
+        fit: str,
+        bg_color: str
+    ) -> Tuple[List[bytes], List[int]]:
+        """Resize the kept `frames` among source frames ``frames[0]`` to `end`.
+        
+        Returns each as zlib-compressed RGBA bytes at the output size, with
+        its display time in milliseconds: its own plus that of dropped
+        frames after it. Compression keeps the frames small on their way
+        through the API process to the encoding worker.
+        """
+        image = probe.image
+        kept = set(frames)
+        outputs: List[bytes] = []
+        durations: List[int] = []
+        for index in range(frames[0], end):
+            # Seeking decodes any frames in between; GIF and WebP frames build on earlier ones
+            with self._stage('decode'):
+                image.seek(index)
+                image.load()
+            duration = image.info.get('duration') or 0
+            if index not in kept:
+                durations[-1] += duration
+                continue
+            with self._stage('resize'):
+                # The whole frame as displayed, with the source's disposal and blending applied
+                frame = image.convert('RGBA')
+                resized = self._resize_image(frame, width, height, fit, bg_color)
+            outputs.append(zlib.compress(resized.tobytes(), 1))
+            durations.append(duration)
+        return outputs, durations
+    
+    def _encode_animation(
+        self,
+        frames: List[bytes],
+        durations: List[int],
+        loop: Optional[int],
+        size: Tuple[int, int],
+        output_format: str,
+        quality: int,
+        profile: Optional[str],
+        dedupe: bool
     ) -> bytes:
-        """Process image with specified parameters."""
-        # Open image
-        image = Image.open(io.BytesIO(file_content))
+        """Encode compressed RGBA frames from _render_frames() as an animated WebP or GIF.
+        
+        Both encoders merge identical consecutive frames. With `dedupe`,
+        frames that differ from the one before by at most
+        ``dedupe_tolerance`` per channel (e.g. dithering noise) are merged
+        too, keeping their combined display time.
+        """
+        images = [Image.frombytes('RGBA', size, zlib.decompress(frame)) for frame in frames]
+        if dedupe:
+            kept = [images[0]]
+            kept_durations = [durations[0]]
+            for image, duration in zip(images[1:], durations[1:]):
+                extrema = ImageChops.difference(image, kept[-1]).getextrema()
+                if max(high for _, high in extrema) <= self.dedupe_tolerance:
+                    kept_durations[-1] += duration
+                else:
+                    kept.append(image)
+                    kept_durations.append(duration)
+            images, durations = kept, kept_durations
+        
+        options = self._save_options(output_format, quality, profile)
+        if output_format == 'GIF':
+            if loop is not None:
+                options['loop'] = loop
+            # Frames are whole; transparent pixels must not show the frame before
+            if any(image.getchannel('A').getextrema()[0] < 255 for image in images):
+                options['disposal'] = 2
+        else:
+            options['loop'] = 1 if loop is None else loop
+        
+        label = self._format_label(output_format)
+        output = io.BytesIO()
+        with self._stage('encode', output_format=label):
+            images[0].save(
+                output, format=output_format, save_all=True, append_images=images[1:], duration=durations, **options
+            )
+        BYTES_OUT.inc(output.tell(), output_format=label)
+        return output.getvalue()
+    
+    def _psnr(self, reference: Image.Image, encoded: bytes) -> float:
+        """Peak signal-to-noise ratio in dB of encoded output against its source."""
+        with Image.open(io.BytesIO(encoded)) as decoded:
+            decoded = decoded.convert(reference.mode)
+        diff = ImageChops.difference(reference, decoded)
+        mse = sum(rms ** 2 for rms in ImageStat.Stat(diff).rms) / len(reference.getbands())
+        if mse == 0:
+            return math.inf
+        return 20 * math.log10(255 / math.sqrt(mse))
+    
+    def _open_image(
+        self,
+        probe: ImageProbe,
+        target_sizes: Optional[List[Tuple[int, int]]] = None,
+        fit: str = 'cover',
+        strips: bool = False
+    ) -> Union[Image.Image, StripImage]:
+        """Decode image and normalize orientation and color mode.
+        
+        With `strips`, a large source that supports it is returned as a
+        StripImage instead, to be decoded strip by strip while it is resized.
+        Raises InvalidImageError if the source would have to be decoded at
+        more than ``max_megapixels``.
+        """
+        # Continue from the image opened while probing
+        image = probe.image
+        
+        if strips and probe.megapixels >= self.strip_min_megapixels and probe.orientation == 1:
+            strip_image = open_strips(image, self.strip_buffer_bytes)
+            if strip_image is not None:
+                return strip_image
+        
+        # Let JPEGs decode straight to a reduced scale when the output is much smaller
+        if target_sizes:
+            self._apply_draft(image, probe.orientation, target_sizes, fit)
+        if image.width * image.height / (1024 * 1024) > self.max_megapixels:
+            raise InvalidImageError(
+                f"Image is too large to decode for this output, maximum is {self.max_megapixels} megapixels"
+            )
+        
+        with self._stage('decode'):
+            image.load()
         
         # Handle EXIF orientation
-        image = ImageOps.exif_transpose(image)
+        with self._stage('exif_transpose'):
+            image = ImageOps.exif_transpose(image)
         
         # Convert CMYK to RGB if necessary
         if image.mode == 'CMYK':
-            image = image.convert('RGB')
+            with self._stage('convert'):
+                image = image.convert('RGB')
+        
+        return image
+    
+    @contextmanager
+    def _pipeline(self, probe: ImageProbe, fmt: str, fit: str) -> Iterator[None]:
+        """Label the stage timings of one pipeline run and count its input."""
+        input_format = self._format_label(probe.format)
+        BYTES_IN.inc(probe.file_size, input_format=input_format)
+        with self._labels(input_format, fmt, fit):
+            yield
+    
+    @contextmanager
+    def _labels(self, input_format: str, fmt: str, fit: str) -> Iterator[None]:
+        """Label stage timings, e.g. of a pipeline run split over several tasks."""
+        token = _pipeline_labels.set({
+            'input_format': input_format,
+            # Both come from requests; keep the label sets bounded
+            'output_format': fmt if fmt == 'multi' else self._format_label(self.supported_formats.get(fmt.lower(), 'JPEG')),
+            'fit': fit if fit in ('cover', 'contain', 'stretch') else 'cover'
+        })
+        try:
+            yield
+        finally:
+            _pipeline_labels.reset(token)
+    
+    def _stage(self, stage: str, **labels: str):
+        """Time a pipeline stage under the current run's labels."""
+        return STAGE_SECONDS.time(stage=stage, **{**_pipeline_labels.get(), **labels})
+    
+    def _reducible(self, probe: ImageProbe) -> bool:
+        """Whether a source can be processed without decoding it at full size.
+        
+        JPEGs are decoded at a reduced DCT scale and streamable sources
+        (8-bit PNG, uncompressed TIFF) strip by strip. Whether that is
+        enough for a given output is checked again by _open_image().
+        """
+        if probe.format == 'JPEG':
+            return self.resize_profiles.get(self.resize_quality, self.resize_profiles['balanced'])[0] is not None
+        return probe.orientation == 1 and open_strips(probe.image, self.strip_buffer_bytes) is not None
+    
+    def _format_label(self, image_format: Optional[str]) -> str:
+        if image_format == 'MPO':
+            return 'jpeg'
+        return image_format.lower() if image_format in self.known_input_formats else 'other'
+    
+    def _as_file(self, file_content: ImageSource) -> Union[BinaryIO, str]:
+        """Something Image.open() can read."""
+        return io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content
+    
+    def _magic_mime_type(self, file_content: ImageSource) -> str:
+        with self._stage('sniff'):
+            if isinstance(file_content, bytes):
+                return magic.from_buffer(file_content, mime=True)
+            return magic.from_file(file_content, mime=True)
+    
+    def _apply_draft(self, image: Image.Image, orientation: int, target_sizes: List[Tuple[int, int]], fit: str) -> None:
+        """Configure JPEG DCT scaling (1/2, 1/4 or 1/8) before the pixels are decoded."""
+        oversample, _ = self.resize_profiles.get(self.resize_quality, self.resize_profiles['balanced'])
+        if oversample is None or image.format != 'JPEG':
+            return
         
-        # Resize image
-        resized_image = self._resize_image(image, width, height, fit, bg_color)
+        # Target sizes are in display orientation; draft works on the stored pixels
+        rotated = orientation in (5, 6, 7, 8)
+        width, height = image.size
+        source_size = (height, width) if rotated else (width, height)
         
+        needed = [self._scaled_size(source_size, size, fit) for size in target_sizes]
+        needed_width = max(w for w, _ in needed) * oversample
+        needed_height = max(h for _, h in needed) * oversample
+        if rotated:
+            needed_width, needed_height = needed_height, needed_width
+        
+        # draft() only picks scales that keep both dimensions >= the requested size
+        image.draft(image.mode, (needed_width, needed_height))
+    
+    def _encode_image(
+        self,
+        image: Image.Image,
+        fmt: str,
+        quality: int,
+        bg_color: str,
+        profile: Optional[str] = None
+    ) -> bytes:
+        """Encode image to the requested output format."""
         # Prepare output format
         output_format = self.supported_formats.get(fmt.lower(), 'JPEG')
+        label = self._format_label(output_format)
+        with self._stage('flatten', output_format=label):
+            image = self._prepare_for_encode(image, output_format, bg_color)
+        with self._stage('encode', output_format=label):
+            output = self._save(image, output_format, quality, profile)
+        BYTES_OUT.inc(len(output), output_format=label)
+        return output
+    
+    def _prepare_for_encode(self, image: Image.Image, output_format: str, bg_color: str) -> Image.Image:
+        """Flatten transparency onto the background for formats without alpha."""
+        if self._flattens(output_format) and image.mode in ('RGBA', 'LA', 'P'):
+            image = self._composite(image, image.size, (0, 0), bg_color, flatten=True)
+        return image
+    
+    def _flattens(self, output_format: str) -> bool:
+        """Whether outputs in this format are composited onto the background."""
+        return output_format == 'JPEG'
+    
+    def _composite(
+        self,
+        image: Image.Image,
+        size: Tuple[int, int],
+        offset: Tuple[int, int],
+        bg_color: str,
+        flatten: bool
+    ) -> Image.Image:
+        """Place `image` on a `bg_color` canvas in one pass.
         
-        # Handle transparency for JPEG
-        if output_format == 'JPEG' and resized_image.mode in ('RGBA', 'LA', 'P'):
-            # Create white background
-            background = Image.new('RGB', resized_image.size, bg_color)
-            if resized_image.mode == 'P':
-                resized_image = resized_image.convert('RGBA')
-            background.paste(resized_image, mask=resized_image.split()[-1] if resized_image.mode == 'RGBA' else None)
-            resized_image = background
+        Flattening blends transparent pixels over the background on an RGB
+        canvas; otherwise pixels, alpha included, are copied onto an RGBA
+        canvas. Either way only the canvas is allocated.
+        """
+        if not flatten:
+            canvas = Image.new('RGBA', size, bg_color)
+            canvas.paste(image, offset)
+            return canvas
         
-        # Save to bytes
+        canvas = Image.new('RGB', size, bg_color)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        # RGBA and LA images act as their own mask; only the alpha band is read
+        canvas.paste(image, offset, mask=image if image.mode in ('RGBA', 'LA') else None)
+        return canvas
+    
+    def _save(self, image: Image.Image, output_format: str, quality: int, profile: Optional[str] = None) -> bytes:
+        """Run the encoder on an image already prepared for the format."""
         output = io.BytesIO()
+        image.save(output, format=output_format, **self._save_options(output_format, quality, profile))
         
-        # Save with appropriate parameters
-        if output_format == 'JPEG':
-            resized_image.save(output, format=output_format, quality=quality, optimize=True)
-        elif output_format == 'PNG':
-            resized_image.save(output, format=output_format, optimize=True)
-        elif output_format == 'WEBP':
-            resized_image.save(output, format=output_format, quality=quality, method=6)
-        elif output_format == 'AVIF':
-            resized_image.save(output, format=output_format, quality=quality)
+        return output.getvalue()
+    
+    def _save_options(self, output_format: str, quality: int, profile: Optional[str] = None) -> Dict[str, Any]:
+        """Encoder keyword arguments for a format and encode profile."""
+        profiles = self.encode_profiles.get(profile or self.encode_profile, self.encode_profiles['balanced'])
+        options = dict(profiles.get(output_format, {}))
+        
+        if output_format not in self.quality_free_formats:
+            options['quality'] = quality
+        
+        return options
+    
+    def _scaled_size(self, source_size: Tuple[int, int], target_size: Tuple[int, int], fit: str) -> Tuple[int, int]:
+        """Size the source is scaled to before cropping or padding for a fit mode."""
+        source_width, source_height = source_size
+        target_width, target_height = target_size
+        
+        if fit == 'stretch':
+            return target_width, target_height
+        
+        if fit == 'contain':
+            ratio = min(target_width / source_width, target_height / source_height)
         else:
-            resized_image.save(output, format=output_format, quality=quality)
+            ratio = max(target_width / source_width, target_height / source_height)
         
-        return output.getvalue()
+        return math.ceil(source_width * ratio), math.ceil(source_height * ratio)
+    
+    def _build_pyramid(self, image: Image.Image, renditions: List[Dict[str, Any]], fit: str) -> List[Image.Image]:
+        """Build successively halved copies down to the largest size any rendition needs."""
+        levels = [image]
+        if image.mode not in self.pyramid_modes or not renditions:
+            return levels
+        
+        needed = [
+            self._scaled_size(image.size, (r['width'], r['height']), fit)
+            for r in renditions
+        ]
+        max_width = max(width for width, _ in needed)
+        max_height = max(height for _, height in needed)
+        
+        while True:
+            current = levels[-1]
+            if current.width // 2 < max_width or current.height // 2 < max_height:
+                break
+            # Box-filtered 2x reduction keeps the final LANCZOS pass alias-free
+            levels.append(current.reduce(2))
+        
+        return levels
+    
+    def _pick_pyramid_level(
+        self,
+        pyramid: List[Image.Image],
+        source_size: Tuple[int, int],
+        target_size: Tuple[int, int],
+        fit: str
+    ) -> Image.Image:
+        """Smallest pyramid level that is still at least as large as the scaled output."""
+        needed_width, needed_height = self._scaled_size(source_size, target_size, fit)
+        for level in reversed(pyramid):
+            if level.width >= needed_width and level.height >= needed_height:
+                return level
+        return pyramid[0]
+    
+    async def validate_image_async(self, file_content: ImageSource, filename: str) -> Tuple[bool, str]:
+        """Validate uploaded image file off the event loop."""
+        # Header parsing is cheap, so a thread avoids shipping the upload to another process
+        return await run_in_threadpool(self.validate_image, file_content, filename)
+    
+    async def process_image_async(
+        self,
+        file_content: ImageSource,
+        width: int,
+        height: int,
+        fmt: str = 'jpeg',
+        quality: int = 85,
+        fit: str = 'cover',
+        bg_color: str = '#FFFFFF',
+        strip_metadata: bool = True,
+        profile: Optional[str] = None,
+        max_frames: Optional[int] = None,
+        dedupe_frames: bool = False
+    ) -> bytes:
+        """Process image in the CPU worker pool.
+        
+        Animations have their frames resized by several workers at once and
+        are then encoded by one; see process_image() for the options.
+        """
+        if self.supported_formats.get(fmt.lower(), 'JPEG') not in self.animated_formats:
+            output, records, captured = await cpu_pool.run(
+                _process_image_task,
+                profiler.requested(), file_content, width, height, fmt, quality, fit, bg_color, strip_metadata, profile
+            )
+            metrics.replay(records)
+            profiler.attach(captured)
+            return output
+        
+        # Still sources come back processed from the first task already
+        plan, records, captured = await cpu_pool.run(
+            _plan_animation_task,
+            profiler.requested(), file_content, width, height, fmt, quality, fit, bg_color, strip_metadata, profile,
+            max_frames
+        )
+        metrics.replay(records)
+        profiler.attach(captured)
+        if not isinstance(plan, AnimationPlan):
+            return plan
+        
+        # Contiguous runs of frames; each task decodes the source up to the
+        # end of its own run, since frames build on the ones before them
+        runs = min(cpu_pool.max_workers, math.ceil(len(plan.frames) / self.animation_frames_per_task))
+        run_length = math.ceil(len(plan.frames) / runs)
+        starts = range(0, len(plan.frames), run_length)
+        results = await asyncio.gather(*(
+            cpu_pool.run(
+                _render_frames_task,
+                False, file_content, plan, plan.frames[start:start + run_length],
+                plan.frames[start + run_length] if start + run_length < len(plan.frames) else plan.frame_count,
+                width, height, fmt, fit, bg_color
+            )
+            for start in starts
+        ))
+        frames: List[bytes] = []
+        durations: List[int] = []
+        for (run_frames, run_durations), records, _ in results:
+            metrics.replay(records)
+            frames += run_frames
+            durations += run_durations
+        
+        output, records, captured = await cpu_pool.run(
+            _encode_animation_task,
+            profiler.requested(), plan, frames, durations, width, height, fmt, quality, fit, profile, dedupe_frames
+        )
+        metrics.replay(records)
+        profiler.attach(captured)
+        return output
+    
+    async def process_image_to_target_async(
+        self,
+        file_content: ImageSource,
+        width: int,
+        height: int,
+        fmt: str = 'jpeg',
+        max_bytes: Optional[int] = None,
+        min_psnr: Optional[float] = None,
+        min_quality: int = 10,
+        max_quality: int = 95,
+        fit: str = 'cover',
+        bg_color: str = '#FFFFFF',
+        strip_metadata: bool = True,
+        profile: Optional[str] = None
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """Run a target-size/quality search in the CPU worker pool."""
+        result, records, captured = await cpu_pool.run(
+            _process_image_to_target_task,
+            profiler.requested(), file_content, width, height, fmt, max_bytes, min_psnr, min_quality, max_quality,
+            fit, bg_color, strip_metadata, profile
+        )
+        metrics.replay(records)
+        profiler.attach(captured)
+        return result
+    
+    async def process_image_multi_async(
+        self,
+        file_content: ImageSource,
+        renditions: List[Dict[str, Any]],
+        quality: int = 85,
+        fit: str = 'cover',
+        bg_color: str = '#FFFFFF',
+        strip_metadata: bool = True,
+        profile: Optional[str] = None
+    ) -> List[bytes]:
+        """Render several sizes and formats in the CPU worker pool."""
+        outputs, records, captured = await cpu_pool.run(
+            _process_image_multi_task,
+            profiler.requested(), file_content, renditions, quality, fit, bg_color, strip_metadata, profile
+        )
+        metrics.replay(records)
+        profiler.attach(captured)
+        return outputs
     
     def _resize_image(
         self,
-        image: Image.Image,
+        image: Union[Image.Image, StripImage],
         target_width: int,
         target_height: int,
         fit: str,
-        bg_color: str
+        bg_color: str,
+        flatten: bool = False
     ) -> Image.Image:
-        """Resize image according to fit mode."""
+        """Resize image according to fit mode.
+        
+        With `flatten`, a contain letterbox is composited straight onto an
+        RGB background, ready for formats without alpha.
+        """
         original_width, original_height = image.size
+        _, reducing_gap = self.resize_profiles.get(self.resize_quality, self.resize_profiles['balanced'])
         
         if fit == 'stretch':
             # Simple resize to target dimensions
-            return image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+            return image.resize((target_width, target_height), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
         
         elif fit == 'contain':
             # Fit entire image within target dimensions, maintaining aspect ratio
@@ -115,17 +1001,12 @@ class ImageService:
             new_width = int(original_width * ratio)
             new_height = int(original_height * ratio)
             
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Create background
-            background = Image.new('RGBA', (target_width, target_height), bg_color)
+            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
             
-            # Center the resized image
+            # Center the resized image on the background
             x = (target_width - new_width) // 2
             y = (target_height - new_height) // 2
-            background.paste(resized, (x, y))
-            
-            return background
+            return self._composite(resized, (target_width, target_height), (x, y), bg_color, flatten)
         
         elif fit == 'cover':
             # Fill target dimensions, cropping if necessary, maintaining aspect ratio
@@ -133,7 +1014,7 @@ class ImageService:
             new_width = int(original_width * ratio)
             new_height = int(original_height * ratio)
             
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
             
             # Crop to target dimensions
             left = (new_width - target_width) // 2
@@ -145,9 +1026,44 @@ class ImageService:
         
         else:
             # Default to cover
-            return self._resize_image(image, target_width, target_height, 'cover', bg_color)
+            return self._resize_image(image, target_width, target_height, 'cover', bg_color, flatten)
 
 
 image_service = ImageService()
 
 
+# Worker process entry points. Each returns its result together with the
+# metric observations it made, which the caller replays in the API process,
+# and a profile of the call if the caller's request is being profiled.
+
+def _run_task(fn, profiled: bool, args) -> Tuple[Any, List[Record], Optional[Profile]]:
+    with metrics.recording() as records:
+        if profiled:
+            result, captured = profiler.call(fn, *args)
+        else:
+            result, captured = fn(*args), None
+    return result, records, captured
+
+
+def _process_image_task(profiled: bool, *args) -> Tuple[bytes, List[Record], Optional[Profile]]:
+    return _run_task(image_service.process_image, profiled, args)
+
+
+def _process_image_multi_task(profiled: bool, *args) -> Tuple[List[bytes], List[Record], Optional[Profile]]:
+    return _run_task(image_service.process_image_multi, profiled, args)
+
+
+def _process_image_to_target_task(profiled: bool, *args) -> Tuple[Tuple[bytes, Dict[str, Any]], List[Record], Optional[Profile]]:
+    return _run_task(image_service.process_image_to_target, profiled, args)
+
+
+def _plan_animation_task(profiled: bool, *args) -> Tuple[Union[bytes, AnimationPlan], List[Record], Optional[Profile]]:
+    return _run_task(image_service.plan_animation, profiled, args)
+
+
+def _render_frames_task(profiled: bool, *args) -> Tuple[Tuple[List[bytes], List[int]], List[Record], Optional[Profile]]:
+    return _run_task(image_service.render_frames, profiled, args)
+
+
+def _encode_animation_task(profiled: bool, *args) -> Tuple[bytes, List[Record], Optional[Profile]]:
+    return _run_task(image_service.encode_animation, profiled, args)
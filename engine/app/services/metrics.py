@@ -0,0 +1,247 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# (metric name, label values, value) observations made in a worker process,
+# replayed into the parent's registry when the task's result comes back
+Record = Tuple[str, Tuple[str, ...], float]
+
+_recording: ContextVar[Optional[List[Record]]] = ContextVar("metrics_recording", default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metric:
+    """One metric family; values are kept per label-value tuple.
+
+    Counters and gauges can instead be read from `function` at scrape time,
+    for state another component already tracks. It returns a number, or a
+    dict of label-value tuples to numbers for labelled metrics.
+    """
+
+    type = ""
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], object]] = None
+    ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _record(self, labels: Dict[str, str], value: float) -> None:
+        key = self._key(labels)
+        records = _recording.get()
+        if records is not None:
+            records.append((self.name, key, value))
+        else:
+            self.apply(key, value)
+
+    def apply(self, key: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[str, ...], Any]]:
+        """(suffix, label values, value) for exposition."""
+        if self.function is not None:
+            value = self.function()
+            for key, item in (value.items() if isinstance(value, dict) else [((), value)]):
+                yield "", tuple(key), item
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", key, value
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        self._record(labels, value)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        self._record(labels, value)
+
+    def dec(self, value: float = 1, **labels: str) -> None:
+        self._record(labels, -value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts with a trailing +Inf bucket, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        self._record(labels, value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of a block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def apply(self, key: Tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", key + (_format(bound),), cumulative
+            yield "_sum", key, total
+            yield "_count", key, cumulative
+
+
+class MetricsRegistry:
+    """Process-local metrics in the Prometheus text exposition format.
+
+    Work done in CPU pool processes is recorded with `recording()` and
+    returned with the task's result, then `replay()`ed here, so the API
+    process exposes it as if it had been measured in-process.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], object]] = None
+    ) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames, function=function))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], object]] = None
+    ) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames, function=function))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets=buckets))
+
+    @contextmanager
+    def recording(self, forward: bool = False) -> Iterator[List[Record]]:
+        """Collect observations made in this context instead of applying them.
+
+        With `forward` they are also passed on when the context exits: to
+        the enclosing recording if there is one, otherwise applied here.
+        """
+        outer = _recording.get()
+        records: List[Record] = []
+        token = _recording.set(records)
+        try:
+            yield records
+        finally:
+            _recording.reset(token)
+            if forward:
+                if outer is not None:
+                    outer.extend(records)
+                else:
+                    self.replay(records)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def replay(self, records: List[Record]) -> None:
+        for name, key, value in records:
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.apply(key, value)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, key, value in metric.samples():
+                if suffix == "_bucket":
+                    labels = metric._labels(key[:-1], f'le="{key[-1]}"')
+                else:
+                    labels = metric._labels(key)
+                lines.append(f"{metric.name}{suffix}{labels} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Modules re-imported in worker processes get the same metric back
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+metrics = MetricsRegistry()
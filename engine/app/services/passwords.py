@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.security import get_password_hash, verify_and_update_password
+from app.services.pool import PoolSaturatedError, PoolTimeoutError
+
+
+class PasswordHasher:
+    """Runs bcrypt in a small dedicated thread pool.
+
+    bcrypt releases the GIL, so a login storm on the request threadpool would
+    occupy every core. Here at most `max_workers` hashes run at once, at most
+    `queue_limit` wait, and callers beyond that get PoolSaturatedError.
+    """
+
+    def __init__(self, max_workers: int = 2, queue_limit: int = 32, timeout: float = 10, samples: int = 1024):
+        self.max_workers = max(max_workers, 1)
+        self.queue_limit = max(queue_limit, 1)
+        self.timeout = timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        # Recent (queue wait, hash time) pairs in seconds
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=samples)
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    async def hash(self, password: str) -> str:
+        """Hash a new password at the configured cost."""
+        return await self._run(get_password_hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; also returns a new hash if the stored one uses an outdated cost."""
+        valid, new_hash = await self._run(verify_and_update_password, password, hashed)
+        if new_hash is not None:
+            with self._lock:
+                self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and recent latency percentiles in milliseconds."""
+        with self._lock:
+            samples = list(self._samples)
+            stats = {
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed
+            }
+        waits = sorted(wait for wait, _ in samples)
+        hashes = sorted(duration for _, duration in samples)
+        for name, values in (("queue_wait", waits), ("hash", hashes)):
+            for pct in (50, 99):
+                value = values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+                stats[f"{name}_p{pct}_ms"] = round(value * 1000, 2)
+        return stats
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise PoolSaturatedError("Too many password operations in progress, retry later")
+            self._in_flight += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+
+        submitted = time.perf_counter()
+        try:
+            future = self._executor.submit(self._timed, fn, submitted, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise PoolTimeoutError("Password hashing timed out")
+
+    def _timed(self, fn: Callable[..., Any], submitted: float, *args: Any) -> Any:
+        started = time.perf_counter()
+        result = fn(*args)
+        with self._lock:
+            self._samples.append((started - submitted, time.perf_counter() - started))
+            self.completed += 1
+        return result
+
+    def _release(self, _future: Any = None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.password_hash_workers,
+    queue_limit=settings.password_hash_queue_limit,
+    timeout=settings.password_hash_timeout
+)
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from app.core.config import settings
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the worker pool has no free queue slots."""
+
+
+class PoolTimeoutError(Exception):
+    """Raised when a task does not finish within its timeout."""
+
+
+class CPUWorkerPool:
+    def __init__(self, max_workers: int = 0, queue_limit: int = 64, task_timeout: float = 60):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_limit = max(queue_limit, 1)
+        self.task_timeout = task_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of tasks submitted and not yet finished by a worker."""
+        return self._in_flight
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the process pool on first use."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _acquire(self) -> None:
+        """Reserve a queue slot or fail fast when the pool is saturated."""
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                raise PoolSaturatedError("Image worker pool is busy, retry later")
+            self._in_flight += 1
+
+    def _release(self, _future: Any = None) -> None:
+        """Free a queue slot once a worker has actually finished the task."""
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """Run a picklable callable in a worker process without blocking the event loop."""
+        self._acquire()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM kill); start a fresh pool for the next task
+            self._executor = None
+            self._release()
+            raise
+        except BaseException:
+            self._release()
+            raise
+
+        # The slot is held until the worker finishes, even if the caller gave up,
+        # so timed-out work still counts against the queue limit.
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future),
+                timeout=timeout if timeout is not None else self.task_timeout
+            )
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise PoolTimeoutError("Image processing timed out")
+        except BrokenProcessPool:
+            self._executor = None
+            raise
+
+    def shutdown(self) -> None:
+        """Stop worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cpu_pool = CPUWorkerPool(
+    max_workers=settings.image_workers,
+    queue_limit=settings.image_queue_limit,
+    task_timeout=settings.image_task_timeout
+)
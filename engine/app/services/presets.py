@@ -1,63 +1,169 @@
+import hashlib
 import json
+import logging
 import os
-from typing import List, Dict, Any
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.preset import CustomPreset
 from app.schemas.presets import Preset, PresetGroup, PresetsResponse
 
+logger = logging.getLogger(__name__)
+
+# Keys of user-defined presets; built-in keys never use it
+CUSTOM_PREFIX = "custom-"
+
 
 class PresetService:
-    def __init__(self):
-        self.presets_file = os.path.join(os.path.dirname(__file__), "..", "..", "data", "presets.json")
-        self._presets_data = None
-    
-    def _load_presets(self) -> Dict[str, Any]:
-        """Load presets from JSON file."""
-        if self._presets_data is None:
-            with open(self.presets_file, 'r') as f:
-                self._presets_data = json.load(f)
-        return self._presets_data
-    
+    """Key index over the built-in presets and user-defined ones.
+
+    Built-ins come from data/presets.json, which is re-read when its mtime
+    changes (checked at most every `reload_interval` seconds), so edits
+    apply to running API and worker processes. The `/presets` response is
+    serialized once per load. Custom presets belong to one user and only
+    resolve for that user's id; they are read through from the database
+    on first use and forgotten after `custom_ttl` seconds, so deletions in
+    other processes are picked up.
+    """
+
+    def __init__(self, presets_file: Optional[str] = None, reload_interval: float = 2.0, custom_ttl: float = 60):
+        self.presets_file = presets_file or os.path.join(os.path.dirname(__file__), "..", "..", "data", "presets.json")
+        self.reload_interval = reload_interval
+        self.custom_ttl = custom_ttl
+        self._lock = threading.Lock()
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._index: Dict[str, Preset] = {}
+        self._response: Optional[PresetsResponse] = None
+        self._body = b""
+        self._etag = ""
+        # key -> (preset, owner's user id, loaded at)
+        self._custom: Dict[str, Tuple[Preset, UUID, float]] = {}
+
     def get_all_presets(self) -> PresetsResponse:
         """Get all presets grouped by platform."""
-        data = self._load_presets()
+        self._refresh()
+        return self._response
+
+    def get_presets_body(self) -> Tuple[bytes, str]:
+        """Serialized `/presets` response and its ETag."""
+        self._refresh()
+        return self._body, self._etag
+
+    def get_preset_by_key(self, preset_key: str, db: Optional[Session] = None, user_id: Optional[UUID] = None) -> Preset:
+        """Get a specific preset by its key.
+
+        Custom presets resolve only for their owner, `user_id`; those not
+        yet in the index are loaded through `db`.
+        """
+        preset = self._lookup(preset_key, user_id)
+        if preset is None and db is not None and user_id is not None and preset_key.startswith(CUSTOM_PREFIX):
+            row = db.execute(self._custom_query(preset_key, user_id)).scalars().first()
+            preset = self._remember(row)
+        if preset is None:
+            raise ValueError(f"Preset with key '{preset_key}' not found")
+        return preset
+
+    async def get_preset_async(self, preset_key: str, db: AsyncSession, user_id: Optional[UUID] = None) -> Preset:
+        """Like get_preset_by_key, loading custom presets through an async session."""
+        preset = self._lookup(preset_key, user_id)
+        if preset is None and user_id is not None and preset_key.startswith(CUSTOM_PREFIX):
+            result = await db.execute(self._custom_query(preset_key, user_id))
+            preset = self._remember(result.scalars().first())
+        if preset is None:
+            raise ValueError(f"Preset with key '{preset_key}' not found")
+        return preset
+
+    def add_custom(self, preset: Preset, user_id: UUID) -> None:
+        """Index a newly created custom preset for its owner."""
+        with self._lock:
+            self._custom[preset.key] = (preset, user_id, time.monotonic())
+
+    def remove_custom(self, preset_key: str) -> None:
+        with self._lock:
+            self._custom.pop(preset_key, None)
+
+    @staticmethod
+    def to_preset(row: CustomPreset) -> Preset:
+        return Preset(key=row.key, label=row.label, w=row.w, h=row.h, profile=row.profile)
+
+    @staticmethod
+    def _custom_query(preset_key: str, user_id: UUID):
+        return select(CustomPreset).where(CustomPreset.key == preset_key, CustomPreset.user_id == user_id)
+
+    def _lookup(self, preset_key: str, user_id: Optional[UUID]) -> Optional[Preset]:
+        self._refresh()
+        preset = self._index.get(preset_key)
+        if preset is not None:
+            return preset
+        entry = self._custom.get(preset_key)
+        if entry is not None and entry[1] == user_id and time.monotonic() - entry[2] < self.custom_ttl:
+            return entry[0]
+        return None
+
+    def _remember(self, row: Optional[CustomPreset]) -> Optional[Preset]:
+        if row is None:
+            return None
+        preset = self.to_preset(row)
+        self.add_custom(preset, row.user_id)
+        return preset
+
+    def _refresh(self) -> None:
+        """Reload the presets file if it changed since the last check."""
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.reload_interval:
+            return
+
+        with self._lock:
+            if self._mtime is not None and now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            mtime = os.stat(self.presets_file).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.presets_file, 'r') as f:
+                    data = json.load(f)
+                self._load(data)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                # A half-written file or a malformed entry; keep serving the last good copy
+                if self._mtime is None:
+                    raise
+                logger.warning("Ignoring invalid presets file %s", self.presets_file)
+                return
+            self._mtime = mtime
+
+    def _load(self, data: Dict[str, Any]) -> None:
+        """Build the index and serialized response from parsed presets data. Caller holds the lock."""
+        index = {}
         groups = []
-        
         for group_data in data.get("groups", []):
-            presets = [
-                Preset(
+            presets: List[Preset] = []
+            for preset in group_data.get("presets", []):
+                presets.append(Preset(
                     key=preset["key"],
                     label=preset["label"],
                     w=preset["w"],
-                    h=preset["h"]
-                )
-                for preset in group_data.get("presets", [])
-            ]
-            
-            group = PresetGroup(
-                key=group_data["key"],
-                label=group_data["label"],
-                presets=presets
-            )
-            groups.append(group)
-        
-        return PresetsResponse(groups=groups)
-    
-    def get_preset_by_key(self, preset_key: str) -> Preset:
-        """Get a specific preset by its key."""
-        data = self._load_presets()
-        
-        for group in data.get("groups", []):
-            for preset in group.get("presets", []):
-                if preset["key"] == preset_key:
-                    return Preset(
-                        key=preset["key"],
-                        label=preset["label"],
-                        w=preset["w"],
-                        h=preset["h"]
-                    )
-        
-        raise ValueError(f"Preset with key '{preset_key}' not found")
-
-
-preset_service = PresetService()
+                    h=preset["h"],
+                    profile=preset.get("profile")
+                ))
+                index[preset["key"]] = presets[-1]
+            groups.append(PresetGroup(key=group_data["key"], label=group_data["label"], presets=presets))
+
+        response = PresetsResponse(groups=groups)
+        body = response.model_dump_json().encode()
+        self._index = index
+        self._response = response
+        self._body = body
+        self._etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
 
 
+preset_service = PresetService(
+    reload_interval=settings.presets_reload_interval,
+    custom_ttl=settings.custom_preset_ttl
+)
@@ -0,0 +1,245 @@
+import cProfile
+import hmac
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import random
+import re
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from app.core.config import settings
+from app.services.metrics import Record, metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+
+
+class Profile(NamedTuple):
+    """One profiled pass, captured in the process that did the work."""
+    stats: bytes  # marshalled pstats data, as written by cProfile's dump_stats()
+    seconds: float
+    peak_traced_bytes: int  # tracemalloc peak; Pillow's pixel buffers are not traced
+    stages: Dict[str, float]  # seconds per pipeline stage
+    summary: str
+
+
+class ProfileSession:
+    """A request or job item chosen for profiling."""
+
+    def __init__(self, target: str, trigger: str):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+        self.target = target
+        self.trigger = trigger
+        self.created_at = datetime.now(timezone.utc)
+        self.profile: Optional[Profile] = None
+        self._token = None
+
+
+_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+
+
+class Profiler:
+    """Opt-in cProfile and tracemalloc capture for individual requests.
+
+    A request is profiled when it carries the admin token in X-Profile, or
+    at random with probability `sample_rate`. Deciding costs one random()
+    call, so nothing is traced while profiling is off. Profiles are kept as
+    files in `profile_dir`, which API and job worker processes share; only
+    the newest `max_entries` are kept.
+    """
+
+    summary_lines = 30
+
+    def __init__(self, profile_dir: str, max_entries: int = 100, sample_rate: float = 0.0, token: str = ""):
+        self.profile_dir = profile_dir
+        self.max_entries = max(max_entries, 1)
+        self.sample_rate = sample_rate
+        self.token = token
+
+    def trigger(self, header: Optional[str] = None) -> Optional[str]:
+        """Why this request should be profiled ("header" or "sample"), or None."""
+        if header and self.token and hmac.compare_digest(header.encode(), self.token.encode()):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def start(self, target: str, trigger: Optional[str]) -> Optional[ProfileSession]:
+        """Begin a profiling session for the current context; None when not triggered."""
+        if trigger is None:
+            return None
+        session = ProfileSession(target, trigger)
+        session._token = _session.set(session)
+        return session
+
+    def finish(self, session: Optional[ProfileSession]) -> None:
+        """End a session from start(), storing its profile if one was captured."""
+        if session is None:
+            return
+        _session.reset(session._token)
+        if session.profile is None:
+            return
+        try:
+            self.save(session)
+        except OSError as e:
+            # A full or read-only disk must not fail the request being profiled
+            logger.warning("Could not store profile %s: %s", session.id, e)
+
+    @contextmanager
+    def session(self, target: str, trigger: Optional[str]) -> Iterator[Optional[ProfileSession]]:
+        session = self.start(target, trigger)
+        try:
+            yield session
+        finally:
+            self.finish(session)
+
+    @staticmethod
+    def requested() -> bool:
+        """Whether the current context is being profiled."""
+        return _session.get() is not None
+
+    @staticmethod
+    def attach(profile: Optional[Profile]) -> None:
+        """Hand a profile captured elsewhere (e.g. a pool worker) to the current session."""
+        session = _session.get()
+        if session is not None and profile is not None:
+            session.profile = profile
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Call `fn`, profiling it if the current context is being profiled."""
+        if not self.requested():
+            return fn(*args, **kwargs)
+        result, profile = self.call(fn, *args, **kwargs)
+        self.attach(profile)
+        return result
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, Profile]:
+        """Call `fn` under cProfile and tracemalloc."""
+        profile = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        # Stage timings are passed on as usual and also kept for the profile
+        with metrics.recording(forward=True) as records:
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                seconds = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+
+        profile.create_stats()
+        # Serialize first: pstats.Stats takes the profile's stats dict over
+        stats = marshal.dumps(profile.stats)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(self.summary_lines)
+        return result, Profile(
+            stats=stats,
+            seconds=seconds,
+            peak_traced_bytes=peak,
+            stages=self._stage_seconds(records),
+            summary=summary.getvalue()
+        )
+
+    def save(self, session: ProfileSession) -> None:
+        """Write a session's profile and drop the oldest beyond `max_entries`."""
+        profile = session.profile
+        os.makedirs(self.profile_dir, exist_ok=True)
+        info = {
+            "id": session.id,
+            "target": session.target,
+            "trigger": session.trigger,
+            "created_at": session.created_at.isoformat(),
+            "seconds": profile.seconds,
+            "peak_traced_bytes": profile.peak_traced_bytes,
+            "stages": profile.stages,
+            "summary": profile.summary
+        }
+        # Stats first, so a listed profile can always be downloaded
+        self._write(self._path(session.id, "prof"), profile.stats)
+        self._write(self._path(session.id, "json"), json.dumps(info).encode())
+
+        # Ids sort by time; other processes may be pruning the same files
+        for profile_id in self._ids()[:-self.max_entries]:
+            for ext in ("json", "prof"):
+                try:
+                    os.remove(self._path(profile_id, ext))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Stored profiles without their summaries, newest first."""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            info = self.get(profile_id)
+            if info is not None:
+                info.pop("summary", None)
+                profiles.append(info)
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, "json"), "rb") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        """Path of a profile's pstats file, for download."""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = self._path(profile_id, "prof")
+        return path if os.path.exists(path) else None
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.profile_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json") and PROFILE_ID.match(name[:-5]))
+
+    def _path(self, profile_id: str, ext: str) -> str:
+        return os.path.join(self.profile_dir, f"{profile_id}.{ext}")
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _stage_seconds(records: List[Record]) -> Dict[str, float]:
+        """Total seconds per stage from histogram observations labelled with a stage."""
+        stages: Dict[str, float] = {}
+        for name, key, value in records:
+            metric = metrics.get(name)
+            if metric is not None and metric.type == "histogram" and "stage" in metric.labelnames:
+                stage = key[metric.labelnames.index("stage")]
+                stages[stage] = stages.get(stage, 0.0) + value
+        return stages
+
+
+profiler = Profiler(
+    profile_dir=settings.profile_dir or os.path.join(settings.upload_dir, "profiles"),
+    max_entries=settings.profile_max_entries,
+    sample_rate=settings.profile_sample_rate,
+    token=settings.admin_token
+)
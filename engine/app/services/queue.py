@@ -0,0 +1,181 @@
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+from app.models.job import Job, JobItem
+from app.core.config import settings
+from app.services.assets import asset_service
+from app.services.events import JobEventBus, job_events
+
+
+class JobQueue:
+    """Durable work queue backed by the job_items table."""
+
+    def __init__(
+        self,
+        visibility_timeout: int = 300,
+        max_attempts: int = 3,
+        retry_backoff: int = 10,
+        events: Optional[JobEventBus] = None
+    ):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.events = events or job_events
+
+    def claim(self, db: Session, limit: int = 1) -> List[JobItem]:
+        """Claim up to `limit` runnable items for this worker."""
+        now = datetime.utcnow()
+        self._fail_abandoned(db, now)
+
+        # Pending items whose retry delay has passed, or processing items whose
+        # worker missed its visibility timeout and which have attempts left
+        query = db.query(JobItem).filter(
+            or_(
+                JobItem.status == "pending",
+                and_(JobItem.status == "processing", JobItem.attempts < self.max_attempts)
+            ),
+            or_(JobItem.locked_until.is_(None), JobItem.locked_until <= now)
+        ).order_by(JobItem.created_at).limit(limit)
+
+        if db.bind.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+
+        claimed = []
+        for item in query.all():
+            # Compare-and-set on attempts so backends without SKIP LOCKED
+            # (SQLite in tests) still hand each claim to a single worker
+            result = db.execute(
+                update(JobItem)
+                .where(JobItem.id == item.id, JobItem.attempts == item.attempts)
+                .values(
+                    status="processing",
+                    attempts=JobItem.attempts + 1,
+                    locked_until=now + timedelta(seconds=self.visibility_timeout)
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(item)
+                self._publish_item(db, item, "processing", attempts=item.attempts + 1)
+
+        if claimed:
+            job_ids = {item.job_id for item in claimed}
+            started = db.execute(
+                update(Job)
+                .where(Job.id.in_(job_ids), Job.status == "queued")
+                .values(status="processing", updated_at=now)
+                .returning(Job.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            for job_id in started:
+                self.events.publish(db, {"type": "job", "job_id": str(job_id), "status": "processing"})
+        db.commit()
+
+        for item in claimed:
+            db.refresh(item)
+        return claimed
+
+    def complete(self, db: Session, item: JobItem, dst_path: str) -> bool:
+        """Mark an item as done. Returns False if the claim was lost."""
+        if not self._update_claimed(
+            db, item, status="done", dst_path=dst_path, locked_until=None, error=None,
+            event={"url": asset_service.url_for(os.path.basename(dst_path))}
+        ):
+            return False
+        self._finalize_job(db, item.job_id)
+        return True
+
+    def fail(self, db: Session, item: JobItem, error: str) -> bool:
+        """Schedule a retry, or mark the item failed once attempts are exhausted."""
+        if item.attempts < self.max_attempts:
+            retry_at = datetime.utcnow() + timedelta(seconds=self.retry_backoff * item.attempts)
+            return self._update_claimed(
+                db, item, status="pending", locked_until=retry_at, error=error, event={"error": error}
+            )
+
+        if not self._update_claimed(db, item, status="failed", locked_until=None, error=error, event={"error": error}):
+            return False
+        self._finalize_job(db, item.job_id)
+        return True
+
+    def _fail_abandoned(self, db: Session, now: datetime) -> None:
+        """Fail expired items that have used up their attempts.
+        
+        A worker killed mid-render (OOM, a crash in the decoder) never calls
+        fail(), so without this its item would be reclaimed forever and take
+        down every worker that picked it up.
+        """
+        abandoned = db.query(JobItem).filter(
+            JobItem.status == "processing",
+            JobItem.locked_until <= now,
+            JobItem.attempts >= self.max_attempts
+        ).all()
+        for item in abandoned:
+            error = f"Worker did not finish the item after {item.attempts} attempts"
+            if self._update_claimed(db, item, status="failed", locked_until=None, error=error, event={"error": error}):
+                self._finalize_job(db, item.job_id)
+
+    def _update_claimed(self, db: Session, item: JobItem, event: Optional[dict] = None, **values) -> bool:
+        """Update an item only while this worker still holds its claim.
+        
+        Publishes the transition, with any extra `event` fields, if the update applied.
+        """
+        # A worker that overran its visibility timeout may have had the item
+        # reclaimed, which bumps attempts; its late result must be dropped
+        result = db.execute(
+            update(JobItem)
+            .where(
+                JobItem.id == item.id,
+                JobItem.attempts == item.attempts,
+                JobItem.status == "processing"
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            self._publish_item(db, item, values["status"], **(event or {}))
+        db.commit()
+        return result.rowcount == 1
+
+    def _finalize_job(self, db: Session, job_id) -> None:
+        """Set the job's final status once every item has finished."""
+        # Runs after the item's own commit, so whichever worker finishes last
+        # always sees every other item's terminal state
+        counts = dict(
+            db.query(JobItem.status, func.count(JobItem.id))
+            .filter(JobItem.job_id == job_id)
+            .group_by(JobItem.status)
+            .all()
+        )
+        if counts.get("pending") or counts.get("processing"):
+            return
+
+        final_status = "failed" if counts.get("failed") else "done"
+        result = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status.in_(("queued", "processing")))
+            .values(status=final_status, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            self.events.publish(db, {"type": "job", "job_id": str(job_id), "status": final_status})
+        db.commit()
+
+    def _publish_item(self, db: Session, item: JobItem, status: str, **fields) -> None:
+        self.events.publish(db, {
+            "type": "item",
+            "job_id": str(item.job_id),
+            "item_id": str(item.id),
+            "status": status,
+            "attempts": item.attempts,
+            **fields
+        })
+
+
+job_queue = JobQueue(
+    visibility_timeout=settings.job_visibility_timeout,
+    max_attempts=settings.job_max_attempts,
+    retry_backoff=settings.job_retry_backoff
+)
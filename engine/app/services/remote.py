@@ -0,0 +1,70 @@
+import ipaddress
+import socket
+from typing import List
+from urllib.parse import urljoin, urlsplit
+import httpx
+from app.core.config import settings
+
+
+class RemoteSourceError(ValueError):
+    """Raised when a remote source URL may not be fetched."""
+
+
+class RemoteSourceService:
+    """Fetches job sources from user-supplied URLs, refusing to reach internal hosts."""
+
+    def __init__(self, max_bytes: int, timeout: float = 30, max_redirects: int = 5):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        """Every address the host resolves to."""
+        return [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+
+    def check_url(self, url: str) -> None:
+        """Reject URLs that aren't http(s) or whose host resolves to a non-public address."""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise RemoteSourceError("A valid http(s) URL is required")
+        try:
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            addresses = self.resolve(parts.hostname, port)
+        except (ValueError, UnicodeError, OSError):
+            raise RemoteSourceError(f"Cannot resolve host '{parts.hostname}'")
+        if not addresses:
+            raise RemoteSourceError(f"Cannot resolve host '{parts.hostname}'")
+
+        # Every address must be public, or a second lookup could land on a private one
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split("%", 1)[0])
+            if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+                ip = ip.ipv4_mapped
+            if not ip.is_global or ip.is_multicast:
+                raise RemoteSourceError(f"Host '{parts.hostname}' is not a public address")
+
+    def fetch(self, url: str) -> bytes:
+        """Download a source, re-checking every redirect hop and capping its size."""
+        with httpx.Client(timeout=self.timeout, follow_redirects=False) as client:
+            for _ in range(self.max_redirects + 1):
+                self.check_url(url)
+                with client.stream("GET", url) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    response.raise_for_status()
+
+                    declared = response.headers.get("content-length", "")
+                    if declared.isdigit() and int(declared) > self.max_bytes:
+                        raise RemoteSourceError("Source exceeds maximum file size")
+                    content = bytearray()
+                    for chunk in response.iter_bytes():
+                        content.extend(chunk)
+                        if len(content) > self.max_bytes:
+                            raise RemoteSourceError("Source exceeds maximum file size")
+                    return bytes(content)
+
+        raise RemoteSourceError("Too many redirects")
+
+
+remote_sources = RemoteSourceService(max_bytes=settings.max_file_size)
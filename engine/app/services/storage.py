@@ -0,0 +1,336 @@
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.job import Job, JobItem
+
+logger = logging.getLogger(__name__)
+
+
+class StoredObject(NamedTuple):
+    name: str
+    size: int
+    mtime: float
+
+
+class StorageBackend:
+    """Where rendered outputs live, addressed by flat names.
+
+    Names are content-addressed (`<sha256>.<ext>`), so writes are
+    idempotent and an existing object never changes.
+    """
+
+    def put(self, name: str, data: bytes) -> None:
+        """Store an object atomically; readers never see a partial write."""
+        raise NotImplementedError
+
+    def stat(self, name: str) -> Optional[StoredObject]:
+        """Size and modification time, or None if the object doesn't exist."""
+        raise NotImplementedError
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Stream the bytes in [start, end) of an object."""
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        raise NotImplementedError
+
+    def list(self) -> Iterator[StoredObject]:
+        """Every stored object, in no particular order."""
+        raise NotImplementedError
+
+    def local_path(self, name: str) -> Optional[str]:
+        """Filesystem path of an object, for backends that can hand files to sendfile."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Outputs on a filesystem, sharded by name prefix.
+
+    `ab12...ef.png` is stored as `<root>/ab/12/ab12...ef.png`, which keeps
+    directories small with millions of outputs. `root` may be a volume
+    shared by several engine replicas. Objects missing from the shards are
+    looked up in `fallback_root`, where outputs used to be written flat.
+    """
+
+    def __init__(self, root: str, shard_depth: int = 2, fallback_root: Optional[str] = None):
+        self.root = root
+        self.shard_depth = shard_depth
+        self.fallback_root = fallback_root
+
+    def relative_path(self, name: str) -> str:
+        shards = [name[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return os.path.join(*shards, name)
+
+    def put(self, name: str, data: bytes) -> None:
+        path = os.path.join(self.root, self.relative_path(name))
+        try:
+            # Already stored; refresh its mtime so orphan GC's grace period
+            # restarts for the output that is about to reference it again
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stat(self, name: str) -> Optional[StoredObject]:
+        path = self._find(name)
+        if path is None:
+            return None
+        stat = os.stat(path)
+        return StoredObject(name=name, size=stat.st_size, mtime=stat.st_mtime)
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        path = self._find(name)
+        if path is None:
+            raise FileNotFoundError(name)
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, name: str) -> None:
+        path = self._find(name)
+        if path is not None:
+            os.remove(path)
+
+    def list(self) -> Iterator[StoredObject]:
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    continue
+                yield StoredObject(name=filename, size=stat.st_size, mtime=stat.st_mtime)
+
+    def local_path(self, name: str) -> Optional[str]:
+        return self._find(name)
+
+    def _find(self, name: str) -> Optional[str]:
+        path = os.path.join(self.root, self.relative_path(name))
+        if os.path.isfile(path):
+            return path
+        if self.fallback_root is not None:
+            path = os.path.join(self.fallback_root, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+
+class S3Storage(StorageBackend):
+    """Outputs in an S3-compatible bucket (AWS S3, MinIO, Ceph, R2...).
+
+    Objects larger than `multipart_threshold` are uploaded in parts of
+    `part_size` bytes, and reads stream ranged GETs, so neither direction
+    holds a whole object in memory beyond what the caller passed in.
+    Requires boto3.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.multipart_threshold = multipart_threshold
+        # S3 rejects parts under 5 MiB other than the last
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url or None,
+                region_name=self.region or None,
+                aws_access_key_id=self.access_key or None,
+                aws_secret_access_key=self.secret_key or None
+            )
+        return self._client
+
+    def put(self, name: str, data: bytes) -> None:
+        key = self.prefix + name
+        if len(data) <= self.multipart_threshold:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+            return
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+        try:
+            parts = []
+            for number, offset in enumerate(range(0, len(data), self.part_size), start=1):
+                response = self.client.upload_part(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                    Body=data[offset:offset + self.part_size]
+                )
+                parts.append({"PartNumber": number, "ETag": response["ETag"]})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            # Otherwise the bucket keeps (and bills for) the uploaded parts
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def stat(self, name: str) -> Optional[StoredObject]:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.prefix + name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return StoredObject(name=name, size=response["ContentLength"], mtime=response["LastModified"].timestamp())
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        if end is not None and end <= start:
+            return
+        kwargs = {}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+        body = self.client.get_object(Bucket=self.bucket, Key=self.prefix + name, **kwargs)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + name)
+
+    def list(self) -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", ()):
+                name = obj["Key"][len(self.prefix):]
+                if name and "/" not in name:
+                    yield StoredObject(name=name, size=obj["Size"], mtime=obj["LastModified"].timestamp())
+
+
+class MemoryStorage(StorageBackend):
+    """Objects held in memory, for archiving renditions that are never stored."""
+
+    def __init__(self):
+        self._objects: Dict[str, StoredObject] = {}
+        self._data: Dict[str, bytes] = {}
+
+    def put(self, name: str, data: bytes) -> None:
+        if name not in self._data:
+            self._data[name] = data
+            self._objects[name] = StoredObject(name=name, size=len(data), mtime=time.time())
+
+    def stat(self, name: str) -> Optional[StoredObject]:
+        return self._objects.get(name)
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        data = self._data.get(name)
+        if data is None:
+            raise FileNotFoundError(name)
+        end = len(data) if end is None else min(end, len(data))
+        view = memoryview(data)
+        for offset in range(start, end, chunk_size):
+            yield bytes(view[offset:min(offset + chunk_size, end)])
+
+    def delete(self, name: str) -> None:
+        self._data.pop(name, None)
+        self._objects.pop(name, None)
+
+    def list(self) -> Iterator[StoredObject]:
+        return iter(list(self._objects.values()))
+
+
+def expire_jobs(db: Session, retention_days: int) -> int:
+    """Delete finished jobs older than `retention_days`, leaving their outputs to collect_orphans."""
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = select(Job.id).where(Job.created_at < cutoff, Job.status.in_(("done", "failed")))
+    db.execute(delete(JobItem).where(JobItem.job_id.in_(expired)).execution_options(synchronize_session=False))
+    result = db.execute(delete(Job).where(Job.id.in_(expired)).execution_options(synchronize_session=False))
+    db.commit()
+    return result.rowcount
+
+
+def collect_orphans(backend: StorageBackend, db: Session, grace: float, dry_run: bool = False) -> List[StoredObject]:
+    """Delete stored outputs that no job item references.
+
+    Objects younger than `grace` seconds are kept: a worker writes its
+    output before committing the item that references it.
+    """
+    referenced = set()
+    for dst_path in db.execute(select(JobItem.dst_path).where(JobItem.dst_path.is_not(None))).scalars().yield_per(10000):
+        referenced.add(os.path.basename(dst_path))
+
+    cutoff = time.time() - grace
+    orphans = []
+    for obj in backend.list():
+        if obj.name in referenced or obj.mtime > cutoff:
+            continue
+        if not dry_run:
+            try:
+                backend.delete(obj.name)
+            except FileNotFoundError:
+                continue
+        orphans.append(obj)
+    logger.info("%s %d orphaned outputs", "Found" if dry_run else "Deleted", len(orphans))
+    return orphans
+
+
+def create_storage() -> StorageBackend:
+    """Storage backend selected by settings.storage_backend."""
+    if settings.storage_backend == "s3":
+        return S3Storage(
+            bucket=settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            region=settings.s3_region,
+            access_key=settings.s3_access_key,
+            secret_key=settings.s3_secret_key,
+            multipart_threshold=settings.s3_multipart_threshold,
+            part_size=settings.s3_part_size
+        )
+    if settings.storage_backend != "local":
+        raise ValueError(f"Unknown storage backend '{settings.storage_backend}'")
+    return LocalStorage(
+        root=os.path.join(settings.upload_dir, "outputs"),
+        shard_depth=settings.storage_shard_depth,
+        fallback_root=settings.upload_dir
+    )
+
+
+storage = create_storage()
@@ -0,0 +1,295 @@
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from typing import BinaryIO, List, Optional, Tuple
+from PIL import Image
+
+# Modes whose packed 8-bit rows are stored as-is by Pillow, with bytes per pixel
+ROW_MODES = {'L': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4}
+# Pillow resizes modes with alpha premultiplied (and then ignores reducing_gap)
+PREMULTIPLIED = {'LA': 'La', 'RGBA': 'RGBa'}
+LANCZOS_SUPPORT = 3.0
+
+
+class StripReader(ABC):
+    """Decodes a source's rows top to bottom, a strip at a time."""
+
+    def __init__(self, fp: BinaryIO, size: Tuple[int, int], mode: str):
+        self.fp = fp
+        self.size = size
+        self.mode = mode
+        self.row = 0
+
+    @abstractmethod
+    def read(self, rows: int) -> Image.Image:
+        """The next `rows` rows (fewer at the bottom) as an image."""
+
+
+class PngStripReader(StripReader):
+    """Inflates the IDAT stream incrementally and unfilters one strip at a time.
+
+    Unfiltering is left to Pillow's PNG decoder, driven through private
+    Pillow APIs; open_strips() only uses this reader when PNG_STRIPS says
+    they exist. Row filters refer to the row above, so every strip after
+    the first is decoded behind a copy of the previous strip's last row,
+    stored unfiltered.
+    """
+
+    def __init__(self, fp: BinaryIO, size: Tuple[int, int], mode: str, offset: int):
+        super().__init__(fp, size, mode)
+        # Each row starts with its filter type byte
+        self._row_bytes = size[0] * ROW_MODES[mode] + 1
+        self._inflater = zlib.decompressobj()
+        self._next_chunk = offset - 8  # Pillow's tile offset points past the first IDAT header
+        self._chunk_left = 0
+        self._prior: Optional[bytes] = None
+
+    def read(self, rows: int) -> Image.Image:
+        width, height = self.size
+        rows = min(rows, height - self.row)
+        pieces = self._filtered_rows(rows)
+        if self._prior is not None:
+            pieces[:0] = [b'\x00', self._prior]
+        total = sum(len(piece) for piece in pieces) // self._row_bytes
+
+        strip = Image.new(self.mode, (width, total))
+        decoder = Image._getdecoder(self.mode, 'zip', self.mode)
+        try:
+            decoder.setimage(strip.im, (0, 0, width, total))
+            status, error = decoder.decode(_stored_zlib(pieces))
+        finally:
+            decoder.cleanup()
+        if status >= 0 or error < 0:
+            raise ValueError("Corrupt PNG image data")
+
+        if total > rows:
+            strip = strip.crop((0, 1, width, total))
+        self._prior = strip.crop((0, rows - 1, width, rows)).tobytes()
+        self.row += rows
+        return strip
+
+    def _filtered_rows(self, rows: int) -> List[bytes]:
+        needed = rows * self._row_bytes
+        pieces = []
+        while needed:
+            data = self._inflater.unconsumed_tail or self._read_idat()
+            if not data:
+                raise ValueError("Truncated PNG image data")
+            # Bounded, so the stream is never inflated past the rows asked for
+            piece = self._inflater.decompress(data, needed)
+            pieces.append(piece)
+            needed -= len(piece)
+        return pieces
+
+    def _read_idat(self, size: int = 65536) -> bytes:
+        while self._chunk_left == 0:
+            self.fp.seek(self._next_chunk)
+            header = self.fp.read(8)
+            if len(header) < 8:
+                return b''
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type != b'IDAT':
+                return b''
+            self._chunk_left = length
+            # Skip the CRC; zlib's own checksum still covers the pixel data
+            self._next_chunk += 8 + length + 4
+        data = self.fp.read(min(size, self._chunk_left))
+        if not data:
+            return b''
+        self._chunk_left -= len(data)
+        return data
+
+
+class RawStripReader(StripReader):
+    """Reads uncompressed rows (e.g. uncompressed TIFF) straight from the file."""
+
+    def __init__(self, fp: BinaryIO, size: Tuple[int, int], mode: str, tiles: List[Tuple[int, int, int, int]]):
+        super().__init__(fp, size, mode)
+        # (first row, end row, file offset, row stride) per tile
+        self.tiles = tiles
+
+    def read(self, rows: int) -> Image.Image:
+        width, height = self.size
+        rows = min(rows, height - self.row)
+        data = bytearray()
+        end = self.row + rows
+        for first, last, offset, stride in self.tiles:
+            start, stop = max(first, self.row), min(last, end)
+            if start >= stop:
+                continue
+            self.fp.seek(offset + (start - first) * stride)
+            chunk = self.fp.read((stop - start) * stride)
+            if len(chunk) < (stop - start) * stride:
+                raise ValueError("Truncated image data")
+            if stride == width * ROW_MODES[self.mode]:
+                data += chunk
+            else:
+                for row in range(stop - start):
+                    data += chunk[row * stride:row * stride + width * ROW_MODES[self.mode]]
+        self.row = end
+        return Image.frombytes(self.mode, (width, rows), bytes(data))
+
+
+def _has_png_decoder_internals() -> bool:
+    """Whether this Pillow has the private decoder hooks PngStripReader drives."""
+    try:
+        decoder = Image._getdecoder('L', 'zip', 'L')
+    except (AttributeError, OSError, TypeError):
+        return False
+    try:
+        return hasattr(decoder, 'setimage') and hasattr(decoder, 'decode') and hasattr(Image.new('L', (1, 1)), 'im')
+    finally:
+        decoder.cleanup()
+
+
+# Without them, PNGs are decoded whole like any other source
+PNG_STRIPS = _has_png_decoder_internals()
+
+
+class StripImage:
+    """A source resized while it is decoded, one strip of rows at a time.
+
+    Stands in for the decoded image in ImageService._resize_image, which
+    only needs `size`, `mode` and resize(). resize() gives the same pixels
+    as Image.resize() with LANCZOS, give or take rounding, while holding
+    about `strip_bytes` of source rows plus the output.
+    """
+
+    def __init__(self, reader: StripReader, strip_bytes: int):
+        self.reader = reader
+        self.size = reader.size
+        self.mode = reader.mode
+        self.strip_bytes = strip_bytes
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    def resize(
+        self,
+        size: Tuple[int, int],
+        resample: int = Image.Resampling.LANCZOS,
+        reducing_gap: Optional[float] = None
+    ) -> Image.Image:
+        if resample != Image.Resampling.LANCZOS:
+            raise ValueError("Strip resizing only supports LANCZOS")
+        if self.reader.row:
+            raise ValueError("Source has already been read")
+        width, height = self.size
+        if size == self.size:
+            return self.reader.read(height)
+        out_width, out_height = size
+        mode = PREMULTIPLIED.get(self.mode, self.mode)
+
+        # Pillow's reducing_gap first box-filters by whole factors; strips
+        # that start on a multiple of the factor reduce exactly as the whole image
+        factor_x = factor_y = 1
+        if reducing_gap is not None and mode == self.mode:
+            factor_x = int(width / out_width / reducing_gap) or 1
+            factor_y = int(height / out_height / reducing_gap) or 1
+        box_width, box_height = width / factor_x, height / factor_y
+        reduced_height = -(-height // factor_y)
+        scale = box_height / out_height
+        support = LANCZOS_SUPPORT * max(scale, 1.0)
+
+        rows = max(factor_y, self.strip_bytes // (width * 4) // factor_y * factor_y)
+        chunk = max(1, int(rows / factor_y / max(scale, 1.0)))
+
+        output = Image.new(self.mode, size)
+        window: Optional[Image.Image] = None
+        window_top = 0
+        for top in range(0, out_height, chunk):
+            bottom = min(top + chunk, out_height)
+            # Reduced source rows the LANCZOS kernel reads for these output rows
+            first = max(int((top + 0.5) * scale - support + 0.5), 0)
+            end = min(int((bottom - 0.5) * scale + support + 0.5), reduced_height)
+
+            while window_top + (window.height if window is not None else 0) < end:
+                strip = self.reader.read(rows)
+                if mode != self.mode:
+                    strip = strip.convert(mode)
+                if factor_x > 1 or factor_y > 1:
+                    strip = strip.reduce((factor_x, factor_y))
+                window = strip if window is None else _stack(window, strip)
+                window, window_top = _drop_above(window, window_top, first)
+            window, window_top = _drop_above(window, window_top, first)
+
+            resized = window.resize(
+                (out_width, bottom - top),
+                Image.Resampling.LANCZOS,
+                box=(0, top * scale - window_top, box_width, bottom * scale - window_top)
+            )
+            output.paste(resized.convert(self.mode) if mode != self.mode else resized, (0, top))
+        return output
+
+
+def _stored_zlib(pieces: List[bytes]) -> bytes:
+    """Frame data as an uncompressed zlib stream, for decoders that expect one."""
+    parts = [b'\x78\x01']
+    checksum = 1
+    for piece in pieces:
+        view = memoryview(piece)
+        for start in range(0, len(view), 65535):
+            block = view[start:start + 65535]
+            parts.append(struct.pack('<BHH', 0, len(block), len(block) ^ 0xFFFF))
+            parts.append(block)
+        checksum = zlib.adler32(piece, checksum)
+    # An empty final block ends the stream
+    parts.append(b'\x01\x00\x00\xff\xff')
+    parts.append(struct.pack('>I', checksum))
+    return b''.join(parts)
+
+
+def _drop_above(window: Optional[Image.Image], top: int, first: int) -> Tuple[Optional[Image.Image], int]:
+    """Drop a window's rows above row `first`; returns the window and its new top row."""
+    if window is None or first <= top:
+        return window, top
+    if first - top >= window.height:
+        return None, top + window.height
+    return window.crop((0, first - top, window.width, window.height)), first
+
+
+def _stack(top: Image.Image, bottom: Image.Image) -> Image.Image:
+    stacked = Image.new(top.mode, (top.width, top.height + bottom.height))
+    stacked.paste(top, (0, 0))
+    stacked.paste(bottom, (0, top.height))
+    return stacked
+
+
+def open_strips(image: Image.Image, strip_bytes: int) -> Optional[StripImage]:
+    """Wrap an opened, not yet decoded image for strip processing, if its format allows.
+
+    Supported: non-interlaced 8-bit PNGs and uncompressed images (such as
+    uncompressed TIFFs) stored top-down in L, LA, RGB or RGBA.
+    """
+    if image.mode not in ROW_MODES or getattr(image, 'n_frames', 1) > 1 or image.fp is None:
+        return None
+    width, height = image.size
+    tiles = image.tile
+    if (
+        image.format == 'PNG'
+        and PNG_STRIPS
+        and len(tiles) == 1
+        and tiles[0][0] == 'zip'
+        and tiles[0][3] == image.mode
+        and not image.info.get('interlace')
+    ):
+        return StripImage(PngStripReader(image.fp, image.size, image.mode, tiles[0][2]), strip_bytes)
+
+    raw_tiles = []
+    for codec, (x0, y0, x1, y1), offset, args in tiles:
+        args = args if isinstance(args, tuple) else (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if codec != 'raw' or rawmode != image.mode or orientation != 1 or (x0, x1) != (0, width):
+            return None
+        raw_tiles.append((y0, y1, offset, stride or width * ROW_MODES[image.mode]))
+    raw_tiles.sort()
+    if not raw_tiles or raw_tiles[0][0] != 0 or raw_tiles[-1][1] != height:
+        return None
+    return StripImage(RawStripReader(image.fp, image.size, image.mode, raw_tiles), strip_bytes)
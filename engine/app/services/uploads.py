@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional, Union
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.services.image import image_service
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the maximum file size."""
+
+
+class IngestedUpload:
+    """An upload read once: sniffed, hashed and held in memory or on disk."""
+
+    def __init__(
+        self,
+        size: int,
+        sha256: str,
+        mime_type: str,
+        content: Optional[bytes] = None,
+        path: Optional[str] = None,
+        temporary: bool = False
+    ):
+        self.size = size
+        self.sha256 = sha256
+        self.mime_type = mime_type
+        self.content = content
+        self.path = path
+        self.temporary = temporary
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """Bytes for small uploads, a file path for spooled ones."""
+        return self.content if self.content is not None else self.path
+
+    def cleanup(self) -> None:
+        """Remove the spool file, if this upload created one."""
+        if self.temporary and self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class UploadService:
+    def __init__(self, max_file_size: int, spool_threshold: int, chunk_size: int = 64 * 1024):
+        self.max_file_size = max_file_size
+        self.spool_threshold = spool_threshold
+        self.chunk_size = chunk_size
+
+    async def ingest(self, upload: UploadFile, dest_path: Optional[str] = None) -> IngestedUpload:
+        """Stream an upload, rejecting non-images and oversized files early.
+
+        Uploads are kept in memory up to the spool threshold and written to a
+        temporary file beyond it. With `dest_path` the upload is always
+        written there instead.
+        """
+        return await run_in_threadpool(self._ingest, upload.file, dest_path)
+
+    def _ingest(self, fileobj: BinaryIO, dest_path: Optional[str]) -> IngestedUpload:
+        # Sniff magic bytes from the first chunk before reading the rest
+        head = fileobj.read(self.chunk_size)
+        mime_type = image_service.sniff_mime_type(head)
+        if not mime_type.startswith('image/'):
+            raise ValueError("File is not a valid image")
+
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        size = 0
+        out = None
+        path = dest_path
+        try:
+            if dest_path is not None:
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                out = open(dest_path, "wb")
+
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > self.max_file_size:
+                    raise UploadTooLargeError(
+                        f"File size exceeds maximum allowed size of {self.max_file_size // (1024*1024)}MB"
+                    )
+                digest.update(chunk)
+
+                if out is None:
+                    buffer.extend(chunk)
+                    if len(buffer) > self.spool_threshold:
+                        # Past the threshold, move what we have to disk
+                        out = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+                        path = out.name
+                        out.write(buffer)
+                        buffer = bytearray()
+                else:
+                    out.write(chunk)
+
+                chunk = fileobj.read(self.chunk_size)
+        except BaseException:
+            if out is not None:
+                out.close()
+                os.remove(path)
+            raise
+
+        if out is not None:
+            out.close()
+            return IngestedUpload(
+                size=size,
+                sha256=digest.hexdigest(),
+                mime_type=mime_type,
+                path=path,
+                temporary=dest_path is None
+            )
+
+        return IngestedUpload(
+            size=size,
+            sha256=digest.hexdigest(),
+            mime_type=mime_type,
+            content=bytes(buffer)
+        )
+
+
+upload_service = UploadService(
+    max_file_size=settings.max_file_size,
+    spool_threshold=settings.upload_spool_threshold
+)
@@ -0,0 +1,162 @@
+"""Job worker entry point.
+
+Run with ``python -m app.worker`` next to the API. Each worker process polls
+the job_items table, renders claimed items with ImageService and writes the
+results to the configured storage backend.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+from typing import Callable, Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.database.base import SessionLocal
+from app.models import user  # noqa: F401 - register User for the Job relationship
+from app.models.job import JobItem
+from app.services.assets import asset_service
+from app.services.image import image_service
+from app.services.presets import CUSTOM_PREFIX, preset_service
+from app.services.profiling import profiler
+from app.services.queue import JobQueue, job_queue
+from app.services.remote import remote_sources
+from app.services.storage import StorageBackend, storage as default_storage
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        queue: JobQueue = job_queue,
+        storage: Optional[StorageBackend] = None
+    ):
+        self.session_factory = session_factory
+        self.queue = queue
+        self.storage = storage or default_storage
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._stopping = False
+
+    def stop(self, *_args) -> None:
+        """Finish the current item and exit the poll loop."""
+        self._stopping = True
+
+    def run_forever(self, poll_interval: float = settings.job_poll_interval) -> None:
+        """Poll for work until stopped."""
+        logger.info("Worker %s started", self.worker_id)
+        while not self._stopping:
+            if self.run_once() == 0:
+                time.sleep(poll_interval)
+        logger.info("Worker %s stopped", self.worker_id)
+
+    def run_once(self, limit: int = 1) -> int:
+        """Claim and process up to `limit` items. Returns the number claimed."""
+        db = self.session_factory()
+        try:
+            items = self.queue.claim(db, limit=limit)
+            for item in items:
+                self._process(db, item)
+            return len(items)
+        finally:
+            db.close()
+
+    def _process(self, db: Session, item: JobItem) -> None:
+        """Render one item and record the outcome."""
+        try:
+            dst_path = self.render_item(item, db)
+        except Exception as e:
+            logger.warning("Job item %s failed on attempt %s: %s", item.id, item.attempts, e)
+            self.queue.fail(db, item, str(e))
+            return
+
+        if not self.queue.complete(db, item, dst_path):
+            logger.warning("Job item %s was reclaimed before it finished", item.id)
+
+    def render_item(self, item: JobItem, db: Optional[Session] = None) -> str:
+        """Process the item's source for its preset and store the result.
+        
+        Returns the output's storage name, which is recorded as the item's dst_path.
+        """
+        # The session lets custom presets be read through on first use; they
+        # only resolve for the job owner
+        owner_id = item.job.user_id if item.preset_key.startswith(CUSTOM_PREFIX) else None
+        preset = preset_service.get_preset_by_key(item.preset_key, db, owner_id)
+        params = item.params_json or {}
+        fmt = item.fmt or "jpeg"
+
+        source = self._load_source(item.src_path)
+        with profiler.session(f"job item {item.id}", profiler.trigger()):
+            output = profiler.run(
+                image_service.process_image,
+                file_content=source,
+                width=preset.w,
+                height=preset.h,
+                fmt=fmt,
+                quality=params.get("quality", 85),
+                fit=params.get("fit", "cover"),
+                bg_color=params.get("bg_color", "#FFFFFF"),
+                strip_metadata=params.get("strip_metadata", True),
+                # Batch traffic favours size over encode time unless the item or preset says otherwise
+                profile=params.get("profile") or preset.profile or settings.job_encode_profile,
+                max_frames=params.get("max_frames"),
+                dedupe_frames=params.get("dedupe_frames", False)
+            )
+
+        # Named by content, so identical renditions share one object
+        name = asset_service.name_for(output, fmt)
+        self.storage.put(name, output)
+        return name
+
+    def _load_source(self, src_path: str) -> bytes:
+        """Read the source image from local storage or a remote URL."""
+        if src_path.startswith(("http://", "https://")):
+            # The host is checked again here, since DNS may have changed since the job was created
+            return remote_sources.fetch(src_path)
+
+        with open(src_path, "rb") as f:
+            return f.read()
+
+
+def _run_worker() -> None:
+    """Entry point for a single worker process."""
+    worker = JobWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run job worker processes")
+    parser.add_argument("--processes", type=int, default=settings.job_worker_processes)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+
+    if args.processes <= 1:
+        _run_worker()
+        return
+
+    processes = [
+        multiprocessing.Process(target=_run_worker, name=f"job-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Diff two benchmark result files and flag regressions.
+
+Usage: python -m benchmarks.compare BASE.json HEAD.json [--metric p50_ms] [--threshold 0.10]
+
+Exits non-zero when any scenario in HEAD is slower than BASE by more than
+the threshold, so it can gate CI. Latency changes smaller than --min-ms are
+treated as noise.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+# Metrics where larger is better
+HIGHER_IS_BETTER = {"ops_per_s", "requests_per_s"}
+
+
+def _index(report: Dict[str, Any]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    return {(r["source"], r["operation"]): r for r in report["results"] if "error" not in r}
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], metric: str, threshold: float, min_ms: float = 1.0):
+    """Yield (source, operation, base value, head value, relative change, regressed)."""
+    base_results = _index(base)
+    for key, result in _index(head).items():
+        if key not in base_results or metric not in result:
+            continue
+        before, after = base_results[key][metric], result[metric]
+        if not before:
+            continue
+        change = (after - before) / before
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        noise = metric.endswith("_ms") and abs(after - before) < min_ms
+        yield key[0], key[1], before, after, change, worse > threshold and not noise
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--metric", default="p50_ms")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"{base['environment'].get('commit')} -> {head['environment'].get('commit')} ({args.metric})")
+    regressions = 0
+    for source, operation, before, after, change, regressed in compare(base, head, args.metric, args.threshold, args.min_ms):
+        regressions += regressed
+        marker = "REGRESSION" if regressed else ""
+        print(f"{source:<18} {operation:<24} {before:>10.2f} {after:>10.2f} {change:>+8.1%}  {marker}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Deterministic synthetic image corpus for the benchmarks.
+
+Images are generated from Pillow's built-in effects, so the same corpus can
+be rebuilt on any machine without shipping binary fixtures.
+"""
+import os
+from typing import Dict, List, Optional
+from PIL import Image, ImageChops, ImageDraw
+
+# name -> (width, height, mode, format, EXIF orientation)
+CORPUS = {
+    "thumb_jpeg": (320, 240, "RGB", "JPEG", 1),
+    "hd_jpeg": (1920, 1080, "RGB", "JPEG", 1),
+    "12mp_jpeg": (4000, 3000, "RGB", "JPEG", 1),
+    "12mp_rotated_jpeg": (4000, 3000, "RGB", "JPEG", 6),
+    "cmyk_jpeg": (3000, 2000, "CMYK", "JPEG", 1),
+    "hd_png": (1920, 1080, "RGB", "PNG", 1),
+    "rgba_png": (2000, 2000, "RGBA", "PNG", 1),
+    "60mp_jpeg": (9000, 6600, "RGB", "JPEG", 1),
+}
+
+# Skipped with --quick
+LARGE = {"60mp_jpeg"}
+
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png"}
+
+
+def make_photo(width: int, height: int) -> Image.Image:
+    """Photo-like RGB image: smooth gradients, fractal detail and noise."""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    detail = Image.effect_mandelbrot((width, height), (-2.0, -1.25, 0.75, 1.25), 64)
+    noise = Image.effect_noise((width, height), 24)
+    image = Image.merge('RGB', (gradient, detail, ImageChops.add(gradient, noise, scale=2)))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((width // 4, height // 4, width * 3 // 4, height * 3 // 4), outline=(255, 255, 255), width=6)
+    return image
+
+
+def make_image(width: int, height: int, mode: str) -> Image.Image:
+    image = make_photo(width, height)
+    if mode == "RGBA":
+        # Radial alpha so transparency handling is exercised
+        alpha = Image.radial_gradient('L').resize((width, height))
+        image.putalpha(ImageChops.invert(alpha))
+    elif mode != "RGB":
+        image = image.convert(mode)
+    return image
+
+
+def build_corpus(corpus_dir: str, names: Optional[List[str]] = None) -> Dict[str, str]:
+    """Write missing corpus files and return name -> path."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    paths = {}
+    for name in names or list(CORPUS):
+        width, height, mode, fmt, orientation = CORPUS[name]
+        path = os.path.join(corpus_dir, f"{name}.{EXTENSIONS[fmt]}")
+        if not os.path.exists(path):
+            image = make_image(width, height, mode)
+            options = {"quality": 92} if fmt == "JPEG" else {}
+            if orientation != 1:
+                exif = Image.Exif()
+                exif[0x0112] = orientation
+                options["exif"] = exif.tobytes()
+            tmp_path = f"{path}.tmp"
+            image.save(tmp_path, format=fmt, **options)
+            os.replace(tmp_path, path)
+        paths[name] = path
+    return paths
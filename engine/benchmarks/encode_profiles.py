@@ -0,0 +1,53 @@
+"""Encode time and output size per encode profile and format.
+
+Usage: python -m benchmarks.encode_profiles [--size 1080x1080] [--repeat 5] [--json]
+"""
+import argparse
+import json
+import statistics
+import time
+from app.services.image import image_service
+from benchmarks.corpus import make_photo
+
+
+def run(width: int, height: int, quality: int, repeat: int):
+    image = make_photo(width, height)
+    results = []
+    for profile in image_service.encode_profiles:
+        for fmt in image_service.supported_formats:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = image_service._encode_image(image, fmt, quality, '#FFFFFF', profile)
+                timings.append(time.perf_counter() - start)
+            results.append({
+                "profile": profile,
+                "format": fmt,
+                "encode_ms": round(statistics.median(timings) * 1000, 2),
+                "bytes": len(output)
+            })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1080x1080", help="WIDTHxHEIGHT of the test image")
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    results = run(width, height, args.quality, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'profile':<10} {'format':<6} {'encode ms':>10} {'bytes':>10}")
+    for row in results:
+        print(f"{row['profile']:<10} {row['format']:<6} {row['encode_ms']:>10.2f} {row['bytes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""End-to-end load test for POST /transform/resize.
+
+Without --url the app is served in-process through httpx's ASGI transport,
+which exercises routing, upload ingestion, the worker pool and encoding
+without a network hop. Each request carries unique trailing bytes so the
+rendition cache is bypassed unless --cached is given.
+
+Usage: python -m benchmarks.http_load [--url http://localhost:8000] [--requests 200] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+import httpx
+from benchmarks.corpus import build_corpus
+from benchmarks.measure import environment, summarize
+
+
+async def run(
+    content: bytes,
+    filename: str,
+    requests: int,
+    concurrency: int,
+    url: Optional[str],
+    form: Dict[str, str],
+    cached: bool
+) -> Dict[str, Any]:
+    if url:
+        transport = None
+        base_url = url
+    else:
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+
+    timings = []
+    statuses: Counter = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120) as client:
+        async def one(index: int) -> None:
+            # Bytes after the end-of-image marker are ignored by decoders but change the content hash
+            body = content if cached else content + index.to_bytes(8, "big")
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(
+                        "/transform/resize",
+                        files={"file": (filename, body, "application/octet-stream")},
+                        data=form
+                    )
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                timings.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        **summarize(timings),
+        # Overall rate under concurrency, unlike ops_per_s which is per client
+        "requests_per_s": round(requests / elapsed, 3),
+        "statuses": dict(statuses)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test /transform/resize")
+    parser.add_argument("--url", help="base URL of a running engine; in-process when omitted")
+    parser.add_argument("--source", default="hd_jpeg", help="corpus image to upload")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "engine-bench-corpus"))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--width", type=int, default=1080)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fmt", default="jpeg")
+    parser.add_argument("--cached", action="store_true", help="send identical uploads so the cache can answer")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    path = build_corpus(args.corpus_dir, [args.source])[args.source]
+    with open(path, "rb") as f:
+        content = f.read()
+    form = {"width": str(args.width), "height": str(args.height), "fmt": args.fmt}
+
+    result = asyncio.run(run(
+        content, os.path.basename(path), args.requests, args.concurrency, args.url, form, args.cached
+    ))
+    report = {
+        "suite": "http_load",
+        "environment": environment(),
+        "settings": {
+            "url": args.url or "in-process",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cached": args.cached,
+            **form
+        },
+        "results": [{"source": args.source, "operation": "POST /transform/resize", **result}]
+    }
+    print(
+        f"{result['requests_per_s']:.2f} req/s  p50 {result['p50_ms']:.1f} ms  "
+        f"p99 {result['p99_ms']:.1f} ms  {result['statuses']}",
+        file=sys.stderr
+    )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
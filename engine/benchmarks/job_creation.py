@@ -0,0 +1,121 @@
+"""Time POST /jobs for jobs of increasing size.
+
+The app is served in-process against --database-url (a temporary SQLite
+file by default; pass a Postgres URL for production-like numbers). Items
+use url sources, so no uploads are needed.
+
+Usage: python -m benchmarks.job_creation [--sizes 1,100,10000] [--repeat 5] [--database-url URL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+import httpx
+from sqlalchemy import create_engine, delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.security import create_access_token
+from app.database.base import Base, async_database_url, engine_options, get_async_db
+from app.main import app
+from app.models.job import Job, JobItem
+from app.models.user import User
+from app.services.remote import remote_sources
+from benchmarks.measure import environment, summarize
+
+
+async def run(database_url: str, sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    sessions = sessionmaker(bind=engine)
+    async_engine = create_async_engine(async_database_url(database_url), **engine_options(database_url))
+    async_sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_bench_db():
+        async with async_sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = get_bench_db
+    # Time job creation, not DNS; example.com stands in for a public host
+    remote_sources.resolve = lambda host, port: ["93.184.216.34"]
+    db = sessions()
+    user = User(email=f"bench-{uuid.uuid4().hex[:8]}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+    db.close()
+
+    results = []
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            for size in sizes:
+                body = {"items": [
+                    {"source": "url", "url": f"https://example.com/{i}.jpg", "preset_key": "instagram-square"}
+                    for i in range(size)
+                ]}
+                timings = []
+                # One untimed warmup request per size
+                for attempt in range(repeat + 1):
+                    start = time.perf_counter()
+                    response = await client.post("/jobs", json=body, headers=headers)
+                    elapsed = time.perf_counter() - start
+                    response.raise_for_status()
+                    if attempt:
+                        timings.append(elapsed)
+                result = {"source": f"{size}_items", "operation": "POST /jobs", **summarize(timings)}
+                result["items_per_s"] = round(size / (sum(timings) / len(timings)), 1)
+                results.append(result)
+                print(
+                    f"{size:>6} items  p50 {result['p50_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  "
+                    f"{result['items_per_s']:>10.1f} items/s",
+                    file=sys.stderr
+                )
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+        await async_engine.dispose()
+        db = sessions()
+        job_ids = [job_id for (job_id,) in db.query(Job.id).filter(Job.user_id == user_id)]
+        db.execute(delete(JobItem).where(JobItem.job_id.in_(job_ids)))
+        db.execute(delete(Job).where(Job.user_id == user_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+        db.close()
+        engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark job creation")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--sizes", default="1,100,10000", help="comma-separated item counts")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        sizes = [int(size) for size in args.sizes.split(",")]
+        results = asyncio.run(run(database_url, sizes, args.repeat))
+
+    report = {
+        "suite": "job_creation",
+        "environment": environment(),
+        "settings": {"database": database_url.split("://")[0], "repeat": args.repeat},
+        "results": results
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
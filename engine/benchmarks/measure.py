@@ -0,0 +1,111 @@
+"""Timing, memory and environment helpers shared by the benchmarks."""
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+import PIL
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds and throughput per second."""
+    total = sum(timings)
+    return {
+        "count": len(timings),
+        "mean_ms": round(total / len(timings) * 1000, 3),
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "ops_per_s": round(len(timings) / total, 3) if total else 0.0
+    }
+
+
+def _rss_mb() -> float:
+    """Current resident set size."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _child(conn, setup, fn, repeat, warmup):
+    try:
+        baseline = _rss_mb() if sys.platform.startswith("linux") else _peak_rss_mb()
+        state = setup()
+        for _ in range(warmup):
+            fn(state)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(state)
+            timings.append(time.perf_counter() - start)
+        peak = _peak_rss_mb()
+        conn.send({
+            **summarize(timings),
+            "peak_rss_mb": round(peak, 1),
+            "rss_growth_mb": round(max(0.0, peak - baseline), 1)
+        })
+    except Exception:
+        conn.send({"error": traceback.format_exc(limit=3)})
+    finally:
+        conn.close()
+
+
+def run_isolated(
+    setup: Callable[[], Any],
+    fn: Callable[[Any], Any],
+    repeat: int,
+    warmup: int = 1
+) -> Dict[str, Any]:
+    """Time `fn(setup())` in a fresh forked process.
+
+    Running each scenario in its own process keeps peak RSS attributable to
+    that scenario instead of the largest one run so far. `setup` is not timed.
+    """
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(child, setup, fn, repeat, warmup))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {"error": "benchmark process exited without a result"}
+    process.join()
+    if process.exitcode and "error" not in result:
+        result["error"] = f"benchmark process exited with code {process.exitcode}"
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    """Where and on what the results were produced, for comparing runs."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
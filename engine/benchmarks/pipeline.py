@@ -0,0 +1,124 @@
+"""Image pipeline benchmarks over the synthetic corpus.
+
+Measures validate_image, each fit mode of _resize_image, each output format
+and the full process_image path for every corpus image, and writes JSON
+that benchmarks.compare can diff between commits.
+
+Usage: python -m benchmarks.pipeline [--quick] [--repeat 5] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from functools import partial
+from typing import Any, Dict, List
+from PIL import Image
+from app.services.image import image_service
+from benchmarks.corpus import CORPUS, LARGE, build_corpus
+from benchmarks.measure import environment, run_isolated
+
+TARGET = (1080, 1080)
+FITS = ("cover", "contain", "stretch")
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _decoded(path: str) -> Image.Image:
+    image = image_service._open_image(image_service.probe_image(_read(path)))
+    image.load()
+    return image
+
+
+def _resized(path: str) -> Image.Image:
+    return image_service._resize_image(_decoded(path), *TARGET, "cover", "#FFFFFF")
+
+
+def scenarios(path: str) -> List[Dict[str, Any]]:
+    """(name, setup, fn) for every operation measured on one source."""
+    name = os.path.basename(path)
+    cases = [
+        ("validate_image", partial(_read, path), lambda content: image_service.validate_image(content, name)),
+        (
+            "process_image",
+            partial(_read, path),
+            lambda content: image_service.process_image(content, *TARGET, fmt="jpeg")
+        ),
+        (
+            # Letterboxing and alpha flattening for formats without alpha
+            "process_image_contain",
+            partial(_read, path),
+            lambda content: image_service.process_image(content, *TARGET, fmt="jpeg", fit="contain")
+        )
+    ]
+    for fit in FITS:
+        cases.append((
+            f"resize_{fit}",
+            partial(_decoded, path),
+            partial(lambda fit, image: image_service._resize_image(image, *TARGET, fit, "#FFFFFF"), fit)
+        ))
+    for fmt in image_service.supported_formats:
+        cases.append((
+            f"encode_{fmt}",
+            partial(_resized, path),
+            partial(lambda fmt, image: image_service._encode_image(image, fmt, 85, "#FFFFFF"), fmt)
+        ))
+    return cases
+
+
+def run(corpus: Dict[str, str], repeat: int, only: List[str]) -> List[Dict[str, Any]]:
+    results = []
+    for source, path in corpus.items():
+        for operation, setup, fn in scenarios(path):
+            if only and not any(pattern in operation for pattern in only):
+                continue
+            width, height = CORPUS[source][:2]
+            # The 60 MP source dominates wall time; fewer repeats keep runs practical
+            result = run_isolated(setup, fn, repeat=max(1, repeat // 2) if source in LARGE else repeat)
+            result = {"source": source, "operation": operation, "megapixels": round(width * height / 1e6, 2), **result}
+            results.append(result)
+            print(_format_row(result), file=sys.stderr)
+    return results
+
+
+def _format_row(result: Dict[str, Any]) -> str:
+    label = f"{result['source']:<18} {result['operation']:<16}"
+    if "error" in result:
+        return f"{label} ERROR {result['error'].strip().splitlines()[-1]}"
+    return (
+        f"{label} p50 {result['p50_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  "
+        f"{result['ops_per_s']:>8.2f}/s  peak {result['peak_rss_mb']:>7.1f} MB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the image pipeline")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "engine-bench-corpus"))
+    parser.add_argument("--quick", action="store_true", help="skip the 60 MP source")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", default=[], help="run operations containing this text")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    names = [name for name in CORPUS if not (args.quick and name in LARGE)]
+    corpus = build_corpus(args.corpus_dir, names)
+    report = {
+        "suite": "pipeline",
+        "environment": environment(),
+        "settings": {"repeat": args.repeat, "target": list(TARGET), "resize_quality": image_service.resize_quality},
+        "results": run(corpus, args.repeat, args.only)
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import pytest
+from app.services.cache import rendition_cache
+
+
+@pytest.fixture(autouse=True)
+def rendition_cache_dir(tmp_path, monkeypatch):
+    """Keep the global rendition cache out of the repo's storage directory."""
+    monkeypatch.setattr(rendition_cache, "cache_dir", str(tmp_path / "rendition-cache"))
+    # Forget entries indexed from an earlier test's directory
+    monkeypatch.setattr(rendition_cache, "_disk", None)
+    monkeypatch.setattr(rendition_cache, "_disk_size", 0)
@@ -0,0 +1,95 @@
+import asyncio
+import io
+import zlib
+import pytest
+from PIL import Image
+from app.services.image import InvalidImageError, image_service
+from app.services.pool import cpu_pool
+
+
+def animation(fmt, count=12, size=(160, 90), **options):
+    """A square moving across a transparent background, one step per frame."""
+    frames = []
+    for index in range(count):
+        frame = Image.new('RGBA', size, (0, 0, 0, 0))
+        frame.paste((255, 0, 0, 255), (index * 10, 20, index * 10 + 30, 50))
+        frames.append(frame)
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer, format=fmt, save_all=True, append_images=frames[1:],
+        duration=[(index % 3 + 1) * 50 for index in range(count)], **options
+    )
+    return buffer.getvalue()
+
+
+def timeline(content):
+    """Frame count, per-frame durations and loop of an encoded output."""
+    image = Image.open(io.BytesIO(content))
+    durations = []
+    for index in range(getattr(image, 'n_frames', 1)):
+        image.seek(index)
+        image.load()
+        durations.append(image.info.get('duration'))
+    return image.format, durations, image.info.get('loop')
+
+
+def test_animated_outputs_keep_frames_and_timing():
+    """Test that GIF and WebP sources stay animated, with their timing, loop and transparency."""
+    gif = animation('GIF', loop=0, disposal=2)
+    webp = timeline(image_service.process_image(gif, 80, 45, fmt='webp', fit='stretch'))
+    assert webp == ('WEBP', [(index % 3 + 1) * 50 for index in range(12)], 0)
+
+    output = image_service.process_image(animation('WEBP', loop=3), 80, 45, fmt='gif', fit='stretch')
+    fmt, durations, loop = timeline(output)
+    assert (fmt, len(durations), sum(durations), loop) == ('GIF', 12, 1200, 3)
+    # Frames are whole, so the square's earlier positions must not show through
+    frame = Image.open(io.BytesIO(output))
+    frame.seek(6)
+    assert frame.convert('RGBA').getpixel((5, 17))[3] == 0
+    red, green, _, alpha = frame.convert('RGBA').getpixel((35, 17))
+    assert alpha == 255 and red > 240 and green < 16
+
+    # Formats without animation get the first frame
+    assert timeline(image_service.process_image(gif, 80, 45, fmt='png'))[1] == [None]
+
+
+def test_frame_budget_and_dedupe(monkeypatch):
+    """Test that frames over budget are dropped evenly and near-duplicates merged, keeping total time."""
+    source = animation('GIF', loop=0, disposal=2)
+    _, durations, _ = timeline(image_service.process_image(source, 80, 45, fmt='webp', max_frames=4))
+    assert len(durations) == 4 and sum(durations) == 1200
+
+    monkeypatch.setattr(image_service, 'animation_max_frames', 3)
+    _, durations, _ = timeline(image_service.process_image(source, 80, 45, fmt='webp'))
+    assert durations == [350, 400, 450]
+
+    # Output frames are also held to a byte budget at the output size
+    monkeypatch.setattr(image_service, 'animation_max_frames', 300)
+    monkeypatch.setattr(image_service, 'animation_max_frame_bytes', 2 * 80 * 45 * 4)
+    _, durations, _ = timeline(image_service.process_image(source, 80, 45, fmt='webp'))
+    assert len(durations) == 2 and sum(durations) == 1200
+
+    # Frames differing by less than the tolerance are merged
+    frames = [
+        zlib.compress(Image.new('RGBA', (32, 32), (100 + shift, 100, 100, 255)).tobytes()) for shift in (0, 5, 40)
+    ]
+    output = image_service._encode_animation(frames, [100, 100, 100], 0, (32, 32), 'WEBP', 85, None, True)
+    assert timeline(output)[1] == [200, 100]
+
+    # Sources are refused when decoding every frame would exceed the pixel budget
+    monkeypatch.setattr(image_service, 'animation_max_megapixels', 0.1)
+    with pytest.raises(InvalidImageError):
+        image_service.process_image(source, 80, 45, fmt='webp')
+
+
+def test_frames_rendered_across_the_pool_match_in_process(monkeypatch):
+    """Test that splitting an animation into several pool tasks gives the same output."""
+    monkeypatch.setattr(cpu_pool, 'max_workers', 3)
+    monkeypatch.setattr(image_service, 'animation_frames_per_task', 2)
+    source = animation('WEBP', loop=0)
+    expected = image_service.process_image(source, 64, 64, fmt='webp', fit='contain', max_frames=7)
+    processed = asyncio.run(image_service.process_image_async(
+        source, 64, 64, fmt='webp', fit='contain', max_frames=7
+    ))
+    assert processed == expected
+    assert len(timeline(processed)[1]) == 7
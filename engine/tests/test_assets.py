@@ -0,0 +1,84 @@
+import io
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.main import app
+from app.services.assets import AssetService, asset_service
+from app.services.storage import storage
+
+
+@pytest.fixture
+def asset(tmp_path, monkeypatch):
+    """A content-addressed PNG in temporary local storage."""
+    monkeypatch.setattr(storage, "root", str(tmp_path / "outputs"))
+    monkeypatch.setattr(storage, "fallback_root", str(tmp_path))
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color="green").save(buffer, format="PNG")
+    content = buffer.getvalue()
+    name = asset_service.name_for(content, "png")
+    storage.put(name, content)
+    (tmp_path / "sources").mkdir()
+    (tmp_path / "sources" / name).write_bytes(content)
+    return name, content
+
+
+def test_signed_urls_expire_and_resist_tampering():
+    """Test URL signing, period-stable expiry and rejection of altered URLs."""
+    service = AssetService(secret="secret", url_ttl=100)
+    url = service.url_for("a.png", now=1050)
+    assert url == service.url_for("a.png", now=1099)
+    query = dict(part.split("=", 1) for part in url.split("?", 1)[1].split("&"))
+    expires, sig = int(query["expires"]), query["sig"]
+    assert expires == 1200
+
+    assert service.verify("a.png", expires, sig, now=1150)
+    assert not service.verify("a.png", expires, sig, now=1201)
+    assert not service.verify("b.png", expires, sig, now=1150)
+    assert not service.verify("a.png", expires + 100, sig, now=1150)
+    assert not AssetService(secret="other", url_ttl=100).verify("a.png", expires, sig, now=1150)
+
+
+def test_asset_serving(asset):
+    """Test signed access, caching headers, HEAD, Range and conditional requests."""
+    name, content = asset
+    client = TestClient(app)
+    url = asset_service.url_for(name)
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{name[:-4]}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    head = client.head(url)
+    assert head.status_code == 200 and head.content == b""
+    assert int(head.headers["content-length"]) == len(content)
+
+    partial = client.get(url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206 and partial.content == content[:10]
+    assert client.get(url, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    # Unsigned, tampered and out-of-namespace requests are refused
+    assert client.get(f"/assets/{name}").status_code == 422
+    assert client.get(url.replace("sig=", "sig=x")).status_code == 403
+    traversal = asset_service.url_for(f"sources/{name}")
+    assert client.get(traversal).status_code == 404
+    missing = asset_service.url_for("0" * 64 + ".png")
+    assert client.get(missing).status_code == 404
+
+
+def test_asset_streaming_without_local_path(asset, monkeypatch):
+    """Test the ranged streaming path used for remote backends such as S3."""
+    name, content = asset
+    monkeypatch.setattr(storage, "local_path", lambda _name: None)
+    client = TestClient(app)
+    url = asset_service.url_for(name)
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.content == content
+    partial = client.get(url, headers={"Range": "bytes=-5"})
+    assert partial.status_code == 206 and partial.content == content[-5:]
+    assert partial.headers["content-range"] == f"bytes {len(content) - 5}-{len(content) - 1}/{len(content)}"
+    head = client.head(url)
+    assert head.content == b"" and int(head.headers["content-length"]) == len(content)
@@ -1,9 +1,19 @@
+import asyncio
+from datetime import timedelta
 import pytest
+from passlib.context import CryptContext
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.database.base import get_db
+from app.database.base import Base, get_db
+from app.models import job  # noqa: F401 - register Job for the User relationship
 from app.models.user import User
-from app.core.security import get_password_hash
+from app.core.security import create_access_token, get_password_hash
+from app.services import auth_cache as auth_cache_module
+from app.services.auth_cache import AuthCache, CurrentUser, auth_cache
+from app.services.passwords import PasswordHasher
+from app.services.pool import PoolSaturatedError
 
 client = TestClient(app)
 
@@ -63,3 +73,81 @@ def test_health_check():
     assert data["engine"] == "fastapi"
 
 
+def test_auth_cache_reuses_claims_until_expiry(monkeypatch):
+    """Test that verified claims are cached but never outlive the token."""
+    cache = AuthCache(ttl=60, max_entries=10)
+    token = create_access_token({"sub": "cache@example.com"})
+    claims = cache.verify_token(token)
+    assert claims["sub"] == "cache@example.com"
+    assert cache.verify_token(token) is claims
+    assert cache.verify_token("not-a-token") is None
+
+    expired = create_access_token({"sub": "cache@example.com"}, expires_delta=timedelta(seconds=-1))
+    assert cache.verify_token(expired) is None
+
+    short_lived = create_access_token({"sub": "cache@example.com"}, expires_delta=timedelta(seconds=1))
+    claims = cache.verify_token(short_lived)
+    assert claims is not None
+    # Just past exp but well within the ttl; the cached claims must not answer,
+    # and by then decoding rejects the token
+    monkeypatch.setattr(cache, "clock", lambda: claims["exp"] + 0.1)
+    monkeypatch.setattr(auth_cache_module, "verify_token", lambda token: None)
+    assert cache.verify_token(short_lived) is None
+
+
+def test_auth_cache_invalidates_changed_users():
+    """Test that updating or deleting a user drops its cached principal."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    user = User(email="old@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+
+    auth_cache.put_user(CurrentUser.from_user(user))
+    assert auth_cache.get_user("old@example.com").id == user.id
+
+    user.email = "new@example.com"
+    db.commit()
+    assert auth_cache.get_user("old@example.com") is None
+
+    auth_cache.put_user(CurrentUser.from_user(user))
+    db.delete(user)
+    db.commit()
+    assert auth_cache.get_user("new@example.com") is None
+    db.close()
+    engine.dispose()
+
+
+def test_password_hasher_rehashes_outdated_cost():
+    """Test that verification upgrades hashes made with another cost factor."""
+    hasher = PasswordHasher(max_workers=1)
+    outdated = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4).hash("secret")
+    try:
+        valid, new_hash = asyncio.run(hasher.verify_and_update("secret", outdated))
+        assert valid and new_hash is not None and new_hash != outdated
+        assert asyncio.run(hasher.verify_and_update("secret", new_hash)) == (True, None)
+        assert asyncio.run(hasher.verify_and_update("wrong", new_hash)) == (False, None)
+        stats = hasher.stats()
+        assert stats["completed"] == 3 and stats["rehashed"] == 1
+        assert stats["hash_p50_ms"] > 0
+    finally:
+        hasher.shutdown()
+
+
+def test_password_hasher_backpressure():
+    """Test that hashing beyond the queue limit is rejected."""
+    hasher = PasswordHasher(max_workers=1, queue_limit=1)
+    
+    async def run():
+        first = asyncio.ensure_future(hasher.hash("secret"))
+        await asyncio.sleep(0)
+        with pytest.raises(PoolSaturatedError):
+            await hasher.hash("secret")
+        assert (await first).startswith("$2b$")
+    
+    try:
+        asyncio.run(run())
+        assert hasher.stats()["rejected"] == 1
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,45 @@
+import hashlib
+from app.services.cache import RenditionCache
+
+
+def make_cache(tmp_path, memory_limit=1024, disk_limit=1024):
+    return RenditionCache(str(tmp_path / "cache"), memory_limit, disk_limit)
+
+
+def test_cache_key_normalizes_parameters(tmp_path):
+    """Test that equivalent parameters share a key and different sources don't."""
+    cache = make_cache(tmp_path)
+    source = hashlib.sha256(b"source").hexdigest()
+    other = hashlib.sha256(b"other").hexdigest()
+    key = cache.make_key(source, 100, 100, "JPEG", 85, "unknown", "#FFFFFF", True)
+    assert key == cache.make_key(source, 100, 100, "jpeg", 85, "cover", "#ffffff", True)
+    assert key != cache.make_key(other, 100, 100, "jpeg", 85, "cover", "#ffffff", True)
+    assert key != cache.make_key(source, 100, 100, "jpeg", 80, "cover", "#ffffff", True)
+
+    # Output changes between releases invalidate old entries and ETags
+    cache.key_version += 1
+    assert key != cache.make_key(source, 100, 100, "jpeg", 85, "cover", "#ffffff", True)
+
+
+def test_cache_evicts_lru_and_falls_back_to_disk(tmp_path):
+    """Test LRU eviction in memory with the disk tier still serving hits."""
+    cache = make_cache(tmp_path, memory_limit=250, disk_limit=250)
+    cache.put("a" * 64, b"a" * 100)
+    cache.put("b" * 64, b"b" * 100)
+    assert cache.get("a" * 64) == b"a" * 100
+    cache.put("c" * 64, b"c" * 100)
+
+    # Memory evicted "b" (least recently read); disk evicted "a" (least recently written)
+    assert cache.get("b" * 64) == b"b" * 100
+    assert cache.stats()["hits_disk"] == 1
+    cache.clear()
+    assert cache.get("a" * 64) is None
+    assert cache.get("c" * 64) == b"c" * 100
+    assert cache.get("c" * 64) == b"c" * 100
+    assert cache.stats() == {
+        "hits_memory": 1,
+        "hits_disk": 1,
+        "misses": 1,
+        "memory_bytes": 100,
+        "disk_bytes": 200
+    }
@@ -1,5 +1,12 @@
+import asyncio
+import hashlib
+import os
+import time
 import pytest
-from app.services.image import image_service
+from fastapi import UploadFile
+from app.services.image import InvalidImageError, image_service
+from app.services.pool import CPUWorkerPool, PoolSaturatedError, PoolTimeoutError
+from app.services.uploads import UploadService, UploadTooLargeError
 import io
 from PIL import Image
 
@@ -20,8 +27,24 @@ def test_validate_image_valid():
     assert message == "Valid image"
 
 
-def test_validate_image_too_large():
+def test_probe_image():
+    """Test that probing reports header facts and rejects non-images."""
+    probe = image_service.probe_image(create_test_image(120, 80))
+    assert (probe.format, probe.width, probe.height, probe.mode) == ('JPEG', 120, 80, 'RGB')
+    assert probe.orientation == 1
+    assert probe.frame_count == 1
+    processed = image_service.process_image(b'', width=60, height=40, probe=probe)
+    assert Image.open(io.BytesIO(processed)).size == (60, 40)
+
+    with pytest.raises(InvalidImageError):
+        image_service.probe_image(b'definitely not an image')
+    assert image_service.sniff_mime_type(create_test_image()[:16]) == 'image/jpeg'
+
+
+def test_validate_image_too_large(monkeypatch):
     """Test image validation with oversized image."""
+    # JPEGs may go past max_megapixels as they decode at reduced scale; not here
+    monkeypatch.setattr(image_service, 'max_strip_megapixels', image_service.max_megapixels)
     # Create a large image (this would be very large in practice)
     test_image = create_test_image(10000, 10000)
     is_valid, message = image_service.validate_image(test_image, "test.jpg")
@@ -43,3 +66,153 @@ def test_process_image_basic():
     assert isinstance(processed, bytes)
 
 
+def test_process_image_async():
+    """Test image processing through the CPU worker pool."""
+    test_image = create_test_image(200, 200)
+    processed = asyncio.run(image_service.process_image_async(
+        test_image,
+        width=50,
+        height=50,
+        fmt='png'
+    ))
+    assert Image.open(io.BytesIO(processed)).size == (50, 50)
+
+
+def test_worker_pool_backpressure():
+    """Test that a saturated pool rejects work instead of queueing it."""
+    pool = CPUWorkerPool(max_workers=1, queue_limit=1, task_timeout=5)
+
+    async def run():
+        busy = asyncio.ensure_future(pool.run(time.sleep, 0.5))
+        await asyncio.sleep(0)
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(time.sleep, 0)
+        await busy
+        with pytest.raises(PoolTimeoutError):
+            await pool.run(time.sleep, 1, timeout=0.1)
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+
+def test_process_image_multi():
+    """Test rendering several presets and formats from one decode."""
+    test_image = create_test_image(2000, 1500)
+    renditions = [
+        {'width': 1080, 'height': 1080, 'fmt': 'jpeg'},
+        {'width': 1080, 'height': 1080, 'fmt': 'webp'},
+        {'width': 300, 'height': 250, 'fmt': 'png'},
+        {'width': 88, 'height': 31, 'fmt': 'jpeg'},
+    ]
+    outputs = image_service.process_image_multi(test_image, renditions)
+    assert len(outputs) == len(renditions)
+    for rendition, output in zip(renditions, outputs):
+        image = Image.open(io.BytesIO(output))
+        assert image.size == (rendition['width'], rendition['height'])
+        assert image.format == rendition['fmt'].upper()
+
+
+def _two_step_reference(image, width, height, fit, bg_color):
+    """The letterbox-then-flatten compositing the single-pass path replaces."""
+    resized = image_service._resize_image(image, width, height, fit, bg_color)
+    if fit == 'contain':
+        letterboxed = Image.new('RGBA', (width, height), bg_color)
+        letterboxed.paste(resized.convert('RGBA'), ((width - resized.width) // 2, (height - resized.height) // 2))
+        resized = letterboxed
+    if resized.mode not in ('RGBA', 'LA', 'P'):
+        return resized
+    rgba = resized.convert('RGBA')
+    flattened = Image.new('RGB', rgba.size, bg_color)
+    flattened.paste(rgba, mask=rgba.split()[-1])
+    return flattened
+
+
+def test_single_pass_compositing_matches_two_step():
+    """Test that letterboxing and flattening in one pass give identical pixels."""
+    noise = Image.frombytes('RGBA', (241, 157), os.urandom(241 * 157 * 4))
+    palette = noise.convert('RGB').convert('P')
+    palette.info['transparency'] = 0
+    sources = [noise, noise.convert('LA'), palette, noise.convert('RGB'), noise.convert('L')]
+    for source in sources:
+        for fit, (width, height) in [('contain', (200, 200)), ('contain', (90, 30)), ('cover', (100, 100))]:
+            expected = _two_step_reference(source, width, height, fit, '#336699')
+            resized = image_service._resize_image(source, width, height, fit, '#336699', flatten=True)
+            actual = image_service._prepare_for_encode(resized, 'JPEG', '#336699')
+            assert actual.mode == expected.mode and actual.size == expected.size
+            assert actual.tobytes() == expected.tobytes(), (source.mode, fit, width, height)
+
+    # Formats with alpha keep the transparent letterbox
+    kept = image_service._resize_image(noise, 200, 200, 'contain', '#33669900')
+    assert kept.mode == 'RGBA' and kept.getpixel((0, 0)) == (0x33, 0x66, 0x99, 0)
+
+
+def test_encode_profiles():
+    """Test that encode profiles trade encode effort for output size."""
+    test_image = create_test_image(400, 300)
+    sizes = {}
+    for profile in ('fast', 'balanced', 'smallest'):
+        output = image_service.process_image(test_image, width=200, height=150, fmt='png', profile=profile)
+        assert Image.open(io.BytesIO(output)).size == (200, 150)
+        sizes[profile] = len(output)
+    assert sizes['smallest'] <= sizes['fast']
+
+
+def test_process_image_to_target():
+    """Test searching encoder quality for a size or fidelity target."""
+    # A flat colour compresses the same at every quality, so add detail
+    noisy = io.BytesIO()
+    Image.merge('RGB', [Image.effect_noise((800, 600), 40)] * 3).save(noisy, format='JPEG', quality=95)
+    test_image = noisy.getvalue()
+    unbounded = image_service.process_image(test_image, width=400, height=300, quality=95)
+    
+    output, result = image_service.process_image_to_target(
+        test_image, width=400, height=300, max_bytes=len(unbounded) // 2
+    )
+    assert result['met'] and len(output) <= len(unbounded) // 2
+    assert 10 <= result['quality'] < 95
+    assert 1 < result['passes'] <= 8
+    
+    # A ceiling that already fits needs a single encode
+    output, result = image_service.process_image_to_target(test_image, width=400, height=300, max_bytes=10 ** 7)
+    assert result == {'quality': 95, 'passes': 1, 'met': True}
+    
+    output, result = image_service.process_image_to_target(test_image, width=400, height=300, min_psnr=30.0)
+    assert result['met']
+    
+    with pytest.raises(ValueError):
+        image_service.process_image_to_target(test_image, width=400, height=300, fmt='png', max_bytes=1000)
+
+
+def test_open_image_draft_for_large_downscale():
+    """Test that JPEGs decode at a reduced scale that still covers the target."""
+    test_image = create_test_image(4000, 3000)
+    probe = image_service.probe_image(test_image)
+    image = image_service._open_image(probe, [(300, 250)], 'cover')
+    assert image.size[0] < 4000
+    assert image.size[0] >= 334 and image.size[1] >= 250
+
+    processed = image_service.process_image(test_image, width=300, height=250)
+    assert Image.open(io.BytesIO(processed)).size == (300, 250)
+
+
+def test_ingest_upload_spools_and_limits():
+    """Test streaming ingestion of uploads."""
+    test_image = create_test_image(400, 400)
+    service = UploadService(max_file_size=len(test_image), spool_threshold=1024)
+
+    upload = asyncio.run(service.ingest(UploadFile(file=io.BytesIO(test_image))))
+    try:
+        assert upload.content is None
+        assert upload.sha256 == hashlib.sha256(test_image).hexdigest()
+        processed = image_service.process_image(upload.source, width=50, height=50)
+        assert Image.open(io.BytesIO(processed)).size == (50, 50)
+    finally:
+        upload.cleanup()
+    assert not os.path.exists(upload.path)
+
+    with pytest.raises(ValueError):
+        asyncio.run(service.ingest(UploadFile(file=io.BytesIO(b"not an image" * 100))))
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(service.ingest(UploadFile(file=io.BytesIO(test_image + b"\0"))))
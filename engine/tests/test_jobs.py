@@ -0,0 +1,429 @@
+import asyncio
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.database.base import Base, async_database_url, get_async_db
+from app.main import app
+from app.models.user import User
+from app.models.job import Job, JobItem
+from app.services.events import JobEventBus
+from app.services.queue import JobQueue
+from app.services.remote import RemoteSourceError, RemoteSourceService, remote_sources
+from app.services.storage import LocalStorage, storage
+from app.worker import JobWorker
+
+
+@pytest.fixture
+def session_factory():
+    """In-memory SQLite stand-in for the Postgres job queue."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def api_session_factory(tmp_path, monkeypatch):
+    """Serve the API from an aiosqlite file database shared with a sync worker session."""
+    url = f"sqlite:///{tmp_path / 'api.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    async_engine = create_async_engine(async_database_url(url), poolclass=NullPool)
+    async_sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+    
+    async def get_test_db():
+        async with async_sessions() as db:
+            yield db
+    
+    app.dependency_overrides[get_async_db] = get_test_db
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(storage, "root", str(tmp_path / "out"))
+    yield sessionmaker(bind=engine)
+    app.dependency_overrides.clear()
+    engine.dispose()
+
+
+def create_job(session_factory, src_paths, preset_key="instagram-square"):
+    """Create a queued job with one pending item per source."""
+    db = session_factory()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    job = Job(user_id=user.id)
+    db.add(job)
+    db.flush()
+    for src_path in src_paths:
+        db.add(JobItem(
+            job_id=job.id,
+            src_path=src_path,
+            preset_key=preset_key,
+            fmt="png",
+            params_json={"quality": 80, "fit": "cover", "bg_color": "#FFFFFF"}
+        ))
+    db.commit()
+    job_id = job.id
+    db.close()
+    return job_id
+
+
+def create_source(tmp_path, color="red"):
+    path = tmp_path / f"source-{color}.jpg"
+    Image.new("RGB", (400, 300), color=color).save(path, format="JPEG")
+    return str(path)
+
+
+def test_worker_processes_queued_items(session_factory, tmp_path):
+    """Test that a worker renders every item and finishes the job."""
+    src_path = create_source(tmp_path)
+    job_id = create_job(session_factory, [src_path, src_path])
+    worker = JobWorker(session_factory=session_factory, queue=JobQueue(), storage=LocalStorage(str(tmp_path / "out")))
+
+    assert worker.run_once(limit=10) == 2
+    assert worker.run_once() == 0
+
+    db = session_factory()
+    job = db.get(Job, job_id)
+    assert job.status == "done"
+    for item in job.items:
+        assert item.status == "done"
+        assert Image.open(worker.storage.local_path(item.dst_path)).size == (1080, 1080)
+    db.close()
+
+
+def test_claim_is_exclusive_until_visibility_timeout(session_factory, tmp_path):
+    """Test that a claimed item is only handed out again after its lease expires."""
+    create_job(session_factory, [create_source(tmp_path)])
+    queue = JobQueue(visibility_timeout=60)
+    db = session_factory()
+
+    claimed = queue.claim(db)
+    assert len(claimed) == 1
+    assert queue.claim(db) == []
+
+    # Simulate a crashed worker whose lease ran out
+    claimed[0].locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    reclaimed = queue.claim(db)
+    assert [item.id for item in reclaimed] == [claimed[0].id]
+    assert reclaimed[0].attempts == 2
+    db.close()
+
+
+def test_reclaim_fails_items_out_of_attempts(session_factory, tmp_path):
+    """Test that an item whose workers keep dying is failed instead of reclaimed forever."""
+    job_id = create_job(session_factory, [create_source(tmp_path)])
+    queue = JobQueue(visibility_timeout=60, max_attempts=2)
+    db = session_factory()
+
+    for attempt in (1, 2):
+        claimed = queue.claim(db)
+        assert len(claimed) == 1 and claimed[0].attempts == attempt
+        # The worker dies without calling fail()
+        claimed[0].locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+
+    assert queue.claim(db) == []
+    job = db.get(Job, job_id)
+    assert job.status == "failed"
+    assert job.items[0].status == "failed" and job.items[0].attempts == 2
+    assert job.items[0].error
+    db.close()
+
+
+def test_failed_items_retry_then_fail_job(session_factory, tmp_path):
+    """Test that failing items are retried up to max_attempts."""
+    job_id = create_job(session_factory, [str(tmp_path / "missing.jpg")])
+    worker = JobWorker(
+        session_factory=session_factory,
+        queue=JobQueue(max_attempts=2, retry_backoff=0),
+        storage=LocalStorage(str(tmp_path / "out"))
+    )
+
+    assert worker.run_once() == 1
+    db = session_factory()
+    item = db.query(JobItem).filter(JobItem.job_id == job_id).one()
+    assert item.status == "pending"
+    db.close()
+
+    assert worker.run_once() == 1
+    db = session_factory()
+    job = db.get(Job, job_id)
+    assert job.status == "failed"
+    assert job.items[0].status == "failed"
+    assert job.items[0].error
+    db.close()
+
+
+def test_job_events_follow_committed_transitions(session_factory, tmp_path):
+    """Test that queue transitions reach subscribers only once committed."""
+    job_id = create_job(session_factory, [create_source(tmp_path)])
+    bus = JobEventBus()
+    worker = JobWorker(session_factory=session_factory, queue=JobQueue(events=bus), storage=LocalStorage(str(tmp_path / "out")))
+    
+    async def collect():
+        subscription = await bus.subscribe(str(job_id))
+        db = session_factory()
+        bus.publish(db, {"type": "item", "job_id": str(job_id), "status": "bogus"})
+        db.rollback()
+        db.close()
+        await asyncio.to_thread(worker.run_once)
+        events = []
+        while (event := await subscription.get(0.2)) is not None:
+            events.append(event)
+        subscription.close()
+        return events
+    
+    events = asyncio.run(collect())
+    assert [(e["type"], e["status"]) for e in events] == [
+        ("item", "processing"), ("job", "processing"), ("item", "done"), ("job", "done")
+    ]
+    assert events[2]["url"].startswith("/assets/") and events[2]["attempts"] == 1
+    assert not bus._subscribers
+
+
+def test_job_api_round_trip(api_session_factory, tmp_path):
+    """Test uploading, queueing, processing and polling a job through the async API."""
+    db = api_session_factory()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+    db.close()
+    
+    client = TestClient(app)
+    source = io.BytesIO()
+    Image.new("RGB", (400, 300), color="blue").save(source, format="JPEG")
+    response = client.post("/jobs/uploads", files={"file": ("a.jpg", source.getvalue(), "image/jpeg")}, headers=headers)
+    assert response.status_code == 200
+    
+    items = [{"source": "upload", "file": response.json()["file"], "preset_key": "instagram-square", "fmt": "png"}] * 3
+    response = client.post("/jobs", json={"items": items}, headers=headers)
+    assert response.status_code == 200
+    job_id = response.json()["id"]
+    job = client.get(f"/jobs/{job_id}", headers=headers).json()
+    assert job["status"] == "queued"
+    assert job["counts"] == {"pending": 3}
+    
+    worker = JobWorker(session_factory=api_session_factory, queue=JobQueue())
+    assert worker.run_once(limit=3) == 3
+    
+    # Results are paged with an opaque cursor
+    job = client.get(f"/jobs/{job_id}", params={"limit": 2}, headers=headers).json()
+    assert job["status"] == "done"
+    assert job["counts"] == {"done": 3}
+    assert len(job["results"]) == 2 and job["next_cursor"]
+    rest = client.get(f"/jobs/{job_id}", params={"limit": 2, "cursor": job["next_cursor"]}, headers=headers).json()
+    assert len(rest["results"]) == 1 and rest["next_cursor"] is None
+    db = api_session_factory()
+    assert {r["filename"] for r in job["results"] + rest["results"]} == {
+        os.path.basename(item.dst_path) for item in db.get(Job, uuid.UUID(job_id)).items
+    }
+    db.close()
+    
+    assert client.get("/jobs/not-a-uuid", headers=headers).status_code == 404
+    assert client.get(f"/jobs/{job_id}", params={"cursor": "bogus"}, headers=headers).status_code == 400
+
+
+def test_job_event_stream(api_session_factory, tmp_path):
+    """Test that the SSE stream reports a snapshot, each transition and then ends."""
+    db = api_session_factory()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+    db.close()
+    job_id = create_job(api_session_factory, [create_source(tmp_path)] * 2)
+    db = api_session_factory()
+    db.get(Job, job_id).user_id = user.id
+    db.commit()
+    db.close()
+    
+    worker = JobWorker(session_factory=api_session_factory, queue=JobQueue())
+    
+    def work():
+        # Let the stream subscribe before anything happens
+        time.sleep(0.5)
+        worker.run_once(limit=2)
+    
+    thread = threading.Thread(target=work)
+    thread.start()
+    client = TestClient(app)
+    response = client.get(f"/jobs/{job_id}/events", headers=headers)
+    thread.join()
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+        if block.startswith("event: ")
+    ]
+    assert events[0] == ("snapshot", {"job_id": str(job_id), "status": "queued", "counts": {"pending": 2}})
+    assert [name for name, data in events if name == "item" and data["status"] == "done"] == ["item", "item"]
+    assert events[-1][0] == "job" and events[-1][1]["status"] == "done"
+    
+    # A finished job gets its snapshot and the stream closes immediately
+    response = client.get(f"/jobs/{job_id}/events", headers=headers)
+    assert response.text.count("event: ") == 1 and '"status": "done"' in response.text
+    assert client.get(f"/jobs/{uuid.uuid4()}/events", headers=headers).status_code == 404
+
+
+def test_job_archive_download(api_session_factory, tmp_path):
+    """Test streaming a job's outputs as an archive and resuming it with Range."""
+    db = api_session_factory()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+    db.close()
+    job_id = create_job(api_session_factory, [create_source(tmp_path, color) for color in ("red", "green", "blue")])
+    db = api_session_factory()
+    db.get(Job, job_id).user_id = user.id
+    db.commit()
+    db.close()
+    worker = JobWorker(session_factory=api_session_factory, queue=JobQueue())
+    assert worker.run_once(limit=3) == 3
+    
+    client = TestClient(app)
+    response = client.get(f"/jobs/{job_id}/archive", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert int(response.headers["content-length"]) == len(response.content)
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    outputs = sorted(obj.name for obj in storage.list())
+    assert sorted(archive.namelist()) == outputs
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert archive.read(outputs[0]) == b"".join(storage.read(outputs[0]))
+    
+    # Resume from an offset, only while the archive is unchanged
+    etag = response.headers["etag"]
+    partial = client.get(f"/jobs/{job_id}/archive", headers={**headers, "Range": "bytes=100-", "If-Range": etag})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 100-{len(response.content) - 1}/{len(response.content)}"
+    assert partial.content == response.content[100:]
+    suffix = client.get(f"/jobs/{job_id}/archive", headers={**headers, "Range": "bytes=-22"})
+    assert suffix.status_code == 206 and suffix.content == response.content[-22:]
+    stale = client.get(f"/jobs/{job_id}/archive", headers={**headers, "Range": "bytes=100-", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == response.content
+    unsatisfiable = client.get(f"/jobs/{job_id}/archive", headers={**headers, "Range": f"bytes={len(response.content)}-"})
+    assert unsatisfiable.status_code == 416
+    
+    response = client.get(f"/jobs/{job_id}/archive", params={"fmt": "tar"}, headers=headers)
+    assert response.status_code == 200
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as archive:
+        assert sorted(archive.getnames()) == outputs
+
+
+def test_job_listing_pages_newest_first(api_session_factory):
+    """Test cursor pagination over a user's jobs."""
+    db = api_session_factory()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    start = datetime(2026, 1, 1)
+    # Two jobs share a timestamp to exercise the id tie-breaker
+    for offset in (0, 1, 1, 2, 3):
+        db.add(Job(user_id=user.id, created_at=start + timedelta(minutes=offset)))
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+    db.close()
+    
+    client = TestClient(app)
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/jobs", params=params, headers=headers).json()
+        seen.extend(page["jobs"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 5 and len({job["id"] for job in seen}) == 5
+    assert [job["created_at"] for job in seen] == sorted((job["created_at"] for job in seen), reverse=True)
+
+
+def test_create_job_validates_before_writing(api_session_factory, monkeypatch):
+    """Test that one bad item rejects the whole job without persisting anything."""
+    monkeypatch.setattr(remote_sources, "resolve", lambda host, port: ["93.184.216.34"])
+    db = api_session_factory()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+    
+    client = TestClient(app)
+    good = {"source": "url", "url": "https://example.com/a.jpg", "preset_key": "instagram-square"}
+    response = client.post("/jobs", json={"items": [good] * 50 + [{**good, "preset_key": "missing"}]}, headers=headers)
+    assert response.status_code == 400
+    assert db.query(Job).count() == 0 and db.query(JobItem).count() == 0
+    
+    # An empty job would never finish
+    response = client.post("/jobs", json={"items": []}, headers=headers)
+    assert response.status_code == 400
+    assert db.query(Job).count() == 0
+    
+    response = client.post("/jobs", json={"items": [good] * 50}, headers=headers)
+    assert response.status_code == 200
+    assert db.query(JobItem).filter(JobItem.job_id == uuid.UUID(response.json()["id"])).count() == 50
+    db.close()
+
+
+def test_remote_sources_reject_internal_hosts(monkeypatch):
+    """Test that URLs resolving to loopback, private or metadata addresses are refused."""
+    service = RemoteSourceService(max_bytes=1024)
+    addresses = {
+        "public.example": ["93.184.216.34"],
+        "metadata.example": ["169.254.169.254"],
+        "mixed.example": ["93.184.216.34", "10.0.0.5"],
+        "mapped.example": ["::ffff:127.0.0.1"]
+    }
+    monkeypatch.setattr(service, "resolve", lambda host, port: addresses.get(host, [host]))
+
+    service.check_url("https://public.example/a.jpg")
+    for url in (
+        "http://127.0.0.1/a.jpg",
+        "http://[::1]/a.jpg",
+        "http://192.168.1.10:8080/a.jpg",
+        "http://metadata.example/latest/meta-data/",
+        "https://mixed.example/a.jpg",
+        "https://mapped.example/a.jpg",
+        "file:///etc/passwd"
+    ):
+        with pytest.raises(RemoteSourceError):
+            service.check_url(url)
+
+
+def test_create_job_rejects_internal_urls(api_session_factory):
+    """Test that a job pointing at an internal address is rejected before it is queued."""
+    db = api_session_factory()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+
+    client = TestClient(app)
+    item = {"source": "url", "url": "http://127.0.0.1:8000/admin", "preset_key": "instagram-square"}
+    response = client.post("/jobs", json={"items": [item]}, headers=headers)
+    assert response.status_code == 400
+    assert db.query(Job).count() == 0
+    db.close()
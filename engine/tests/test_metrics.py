@@ -0,0 +1,67 @@
+import io
+import os
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.main import app
+from app.services.metrics import MetricsRegistry
+
+
+def sample(text, line_prefix):
+    """Value of the first exposition line starting with `line_prefix`."""
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_registry_exposition_and_replay():
+    """Test the text format and replaying observations recorded elsewhere."""
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    registry.gauge("depth", "Queue depth", function=lambda: 7)
+
+    requests.inc(route='/a"b')
+    latency.observe(0.5, route="/a")
+    with registry.recording() as records:
+        requests.inc(2, route="/c")
+        latency.observe(0.05, route="/a")
+    assert sample(registry.render(), 'requests_total{route="/c"}') is None
+    registry.replay(records)
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert sample(text, 'requests_total{route="/a\\"b"}') == 1
+    assert sample(text, 'requests_total{route="/c"}') == 2
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="0.1"}') == 1
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="1"}') == 2
+    assert sample(text, 'latency_seconds_bucket{route="/a",le="+Inf"}') == 2
+    assert sample(text, 'latency_seconds_sum{route="/a"}') == 0.55
+    assert sample(text, "depth ") == 7
+
+
+def test_metrics_endpoint_reports_pipeline_stages():
+    """Test that a transform shows up as per-stage timings, bytes and request counts."""
+    client = TestClient(app)
+    # A unique source, so the rendition cache can't answer for the pipeline
+    source = io.BytesIO()
+    Image.new("RGBA", (300, 200), color=(*os.urandom(3), 128)).save(source, format="PNG")
+    before = client.get("/metrics").text
+
+    response = client.post(
+        "/transform/resize",
+        files={"file": ("a.png", source.getvalue(), "image/png")},
+        data={"width": "50", "height": "50", "fmt": "jpeg", "fit": "contain"}
+    )
+    assert response.status_code == 200
+    text = client.get("/metrics").text
+
+    # Timings measured in the worker process are reported by the API process
+    for stage in ("decode", "exif_transpose", "resize", "flatten", "encode"):
+        prefix = f'image_stage_seconds_count{{stage="{stage}",input_format="png",output_format="jpeg",fit="contain"}}'
+        assert sample(text, prefix) == (sample(before, prefix) or 0) + 1
+    assert sample(text, 'image_stage_seconds_count{stage="header",input_format="png"') >= 1
+    assert sample(text, 'image_bytes_out_total{output_format="jpeg"}') >= len(response.content)
+    assert sample(text, 'http_requests_total{method="POST",route="/transform/resize",status="200"}') >= 1
+    assert sample(text, "image_pool_in_flight") == 0
+    assert 'rendition_cache_lookups_total{result="miss"}' in text
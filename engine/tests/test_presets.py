@@ -0,0 +1,111 @@
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from app.core.security import create_access_token
+from app.database.base import Base, async_database_url, get_async_db
+from app.main import app
+from app.models import job  # noqa: F401 - register Job for the User relationship
+from app.models.user import User
+from app.services.presets import PresetService, preset_service
+
+
+def write_presets(path, presets):
+    with open(path, "w") as f:
+        json.dump({"groups": [{"key": "test", "label": "Test", "presets": presets}]}, f)
+
+
+def test_registry_indexes_and_hot_reloads(tmp_path):
+    """Test key lookups and reloading when the presets file changes."""
+    path = tmp_path / "presets.json"
+    write_presets(path, [{"key": "a", "label": "A", "w": 10, "h": 20}])
+    service = PresetService(presets_file=str(path), reload_interval=0)
+    
+    assert service.get_preset_by_key("a").w == 10
+    body, etag = service.get_presets_body()
+    assert json.loads(body)["groups"][0]["presets"][0]["key"] == "a"
+    with pytest.raises(ValueError):
+        service.get_preset_by_key("b")
+    
+    write_presets(path, [{"key": "b", "label": "B", "w": 30, "h": 40}])
+    os.utime(path, ns=(1, 1))
+    assert service.get_preset_by_key("b").h == 40
+    assert service.get_presets_body()[1] != etag
+    
+    # A broken edit keeps the last good copy
+    path.write_text("{")
+    os.utime(path, ns=(2, 2))
+    assert service.get_preset_by_key("b").h == 40
+    write_presets(path, [{"key": "c", "label": "C", "w": 50}])
+    os.utime(path, ns=(3, 3))
+    assert service.get_preset_by_key("b").h == 40
+
+
+def test_presets_etag():
+    """Test that GET /presets revalidates with its ETag."""
+    client = TestClient(app)
+    response = client.get("/presets")
+    assert response.status_code == 200
+    assert "max-age" in response.headers["cache-control"]
+    assert client.get("/presets", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+
+def test_custom_presets(tmp_path):
+    """Test creating, resolving and deleting custom presets."""
+    url = f"sqlite:///{tmp_path / 'api.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    async_sessions = async_sessionmaker(create_async_engine(async_database_url(url), poolclass=NullPool))
+    
+    async def get_test_db():
+        async with async_sessions() as db:
+            yield db
+    
+    app.dependency_overrides[get_async_db] = get_test_db
+    db = sessionmaker(bind=engine)()
+    user = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email})}"}
+    
+    try:
+        client = TestClient(app)
+        response = client.post("/presets/custom", json={"label": "Banner", "w": 970, "h": 90}, headers=headers)
+        assert response.status_code == 200
+        key = response.json()["key"]
+        assert [p["key"] for p in client.get("/presets/custom", headers=headers).json()] == [key]
+        
+        # Another process only finds it through the database
+        other = PresetService(presets_file=preset_service.presets_file)
+        with pytest.raises(ValueError):
+            other.get_preset_by_key(key, user_id=user.id)
+        assert other.get_preset_by_key(key, db, user.id).w == 970
+        
+        # Only the owner can resolve it, and anonymous callers never can
+        stranger = User(email=f"{os.urandom(4).hex()}@example.com", password_hash="x")
+        db.add(stranger)
+        db.commit()
+        for service in (preset_service, PresetService(presets_file=preset_service.presets_file)):
+            with pytest.raises(ValueError):
+                service.get_preset_by_key(key, db, stranger.id)
+            with pytest.raises(ValueError):
+                service.get_preset_by_key(key, db)
+        stranger_headers = {"Authorization": f"Bearer {create_access_token({'sub': stranger.email})}"}
+        item = {"source": "url", "url": "https://example.com/a.jpg", "preset_key": key}
+        assert client.post("/jobs", json={"items": [item]}, headers=stranger_headers).status_code == 400
+        form = {"presets": key, "formats": "png"}
+        files = {"file": ("a.png", b"not read", "image/png")}
+        assert client.post("/transform/multi", data=form, files=files).status_code == 400
+        
+        assert client.delete(f"/presets/custom/{key}", headers=headers).status_code == 204
+        with pytest.raises(ValueError):
+            preset_service.get_preset_by_key(key, user_id=user.id)
+        assert client.delete(f"/presets/custom/{key}", headers=headers).status_code == 404
+    finally:
+        app.dependency_overrides.clear()
+        db.close()
+        engine.dispose()
@@ -0,0 +1,80 @@
+import io
+import marshal
+import pstats
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.core.config import settings
+from app.main import app
+from app.services.profiling import Profiler, profiler
+
+
+@pytest.fixture
+def admin(tmp_path, monkeypatch):
+    """Enable the admin token and keep profiles in a temporary directory."""
+    monkeypatch.setattr(settings, "admin_token", "admin-secret")
+    monkeypatch.setattr(profiler, "token", "admin-secret")
+    monkeypatch.setattr(profiler, "profile_dir", str(tmp_path / "profiles"))
+    return {"X-Admin-Token": "admin-secret"}
+
+
+def test_profiled_transform_request(admin, tmp_path):
+    """Test X-Profile capture through the worker pool and the admin endpoints."""
+    client = TestClient(app)
+    source = io.BytesIO()
+    Image.new("RGB", (400, 300), color="purple").save(source, format="PNG")
+    form = {"width": "100", "height": "100", "fmt": "jpeg"}
+    files = {"file": ("a.png", source.getvalue(), "image/png")}
+
+    plain = client.post("/transform/resize", files=files, data=form)
+    assert plain.status_code == 200 and "X-Profile-Id" not in plain.headers
+    assert client.post("/transform/resize", files=files, data=form, headers={"X-Profile": "wrong"}).headers.get("X-Profile-Id") is None
+
+    # Profiled even though the rendition is now cached
+    response = client.post("/transform/resize", files=files, data=form, headers={"X-Profile": "admin-secret"})
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "MISS"
+    profile_id = response.headers["X-Profile-Id"]
+
+    assert client.get("/admin/profiles").status_code == 403
+    listed = client.get("/admin/profiles", headers=admin).json()["profiles"]
+    assert [p["id"] for p in listed] == [profile_id]
+    assert listed[0]["summary"] is None
+
+    info = client.get(f"/admin/profiles/{profile_id}", headers=admin).json()
+    assert info["target"] == "POST /transform/resize" and info["trigger"] == "header"
+    assert {"decode", "resize", "encode"} <= set(info["stages"])
+    assert info["peak_traced_bytes"] > 0
+    assert "process_image" in info["summary"]
+
+    stats = client.get(f"/admin/profiles/{profile_id}/stats", headers=admin)
+    assert stats.status_code == 200
+    path = tmp_path / "download.prof"
+    path.write_bytes(stats.content)
+    functions = {name for _file, _line, name in pstats.Stats(str(path)).stats}
+    assert "_resize_image" in functions
+    assert client.get("/admin/profiles/../../etc/passwd", headers=admin).status_code == 404
+
+
+def test_admin_endpoints_disabled_without_token():
+    """Test that admin endpoints do not exist unless ADMIN_TOKEN is set."""
+    client = TestClient(app)
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": ""}).status_code == 404
+
+
+def test_profile_sampling_and_ring_buffer(tmp_path):
+    """Test sampled sessions, pass-through when off and pruning to max_entries."""
+    sampled = Profiler(str(tmp_path), max_entries=2, sample_rate=1.0)
+    assert Profiler(str(tmp_path)).trigger("anything") is None
+    assert sampled.run(sum, [1, 2]) == 3
+    assert sampled.list() == []
+
+    ids = []
+    for _ in range(3):
+        with sampled.session("job item", sampled.trigger()) as session:
+            assert sampled.run(sorted, [3, 1, 2]) == [1, 2, 3]
+        ids.append(session.id)
+    ids.sort()
+    assert [p["id"] for p in sampled.list()] == [ids[2], ids[1]]
+    assert sampled.stats_path(ids[0]) is None
+    assert marshal.loads(open(sampled.stats_path(ids[2]), "rb").read())
@@ -0,0 +1,94 @@
+import io
+import os
+import pytest
+from PIL import Image
+from app.services.image import InvalidImageError, image_service
+from app.services import strips as strips_module
+from app.services.strips import StripImage, open_strips
+
+MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+
+def encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def noise(mode, size=(301, 223)):
+    return Image.frombytes('RGBA', size, os.urandom(size[0] * size[1] * 4)).convert(mode)
+
+
+def max_difference(a, b):
+    """Largest per-channel difference, compared premultiplied where Pillow resamples that way."""
+    premultiplied = {'LA': 'La', 'RGBA': 'RGBa'}.get(a.mode)
+    if premultiplied:
+        a, b = a.convert(premultiplied), b.convert(premultiplied)
+    return max(abs(x - y) for x, y in zip(a.tobytes(), b.tobytes()))
+
+
+def test_strip_decoding_is_lossless():
+    """Test that PNG and uncompressed TIFF rows decode exactly, strip by strip."""
+    for mode in MODES:
+        source = noise(mode)
+        for content in (encode(source, 'PNG'), encode(source, 'TIFF')):
+            for strip_rows in (1, 17, 1000):
+                strips = open_strips(Image.open(io.BytesIO(content)), source.width * 4 * strip_rows)
+                assert strips is not None and strips.size == source.size
+                assert strips.resize(source.size).tobytes() == source.tobytes()
+
+    # Formats that can't be decoded in strips fall back to a full decode
+    assert open_strips(Image.open(io.BytesIO(encode(noise('RGB'), 'TIFF', compression='tiff_lzw'))), 1 << 20) is None
+    assert open_strips(Image.open(io.BytesIO(encode(noise('P'), 'PNG'))), 1 << 20) is None
+
+
+def test_png_strips_fall_back_without_pillow_internals(monkeypatch):
+    """Test that PNGs are decoded whole when Pillow lacks the decoder hooks strips rely on."""
+    content = encode(noise('RGB'), 'PNG')
+    assert open_strips(Image.open(io.BytesIO(content)), 1 << 20) is not None
+    monkeypatch.setattr(strips_module, 'PNG_STRIPS', False)
+    assert open_strips(Image.open(io.BytesIO(content)), 1 << 20) is None
+
+
+def test_strip_resize_matches_full_resize():
+    """Test that strip-by-strip LANCZOS (with and without reducing_gap) matches Image.resize."""
+    for mode in MODES:
+        content = encode(noise(mode, (640, 480)), 'PNG')
+        for size in ((100, 75), (64, 400), (333, 120)):
+            for reducing_gap in (None, 3.0):
+                expected = Image.open(io.BytesIO(content)).resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+                strips = open_strips(Image.open(io.BytesIO(content)), 640 * 4 * 24)
+                actual = strips.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+                assert actual.mode == expected.mode and actual.size == expected.size
+                # Only float rounding of the per-strip resampling boxes differs
+                assert max_difference(actual, expected) <= (2 if mode in ('LA', 'RGBA') else 1), (mode, size, reducing_gap)
+
+
+def test_sources_over_the_decode_limit(monkeypatch):
+    """Test which sources may exceed max_megapixels, and that none is ever decoded beyond it."""
+    monkeypatch.setattr(image_service, 'max_megapixels', 0.2)
+    monkeypatch.setattr(image_service, 'max_strip_megapixels', 1)
+    monkeypatch.setattr(image_service, 'strip_min_megapixels', 0)
+    source = noise('RGB', (800, 600))
+
+    # PNGs are resized strip by strip, without decoding them to probe
+    png = encode(source, 'PNG')
+    probe = image_service.probe_image(png)
+    assert probe.image.tile
+    assert isinstance(image_service._open_image(probe, [(100, 100)], 'cover', strips=True), StripImage)
+    output = image_service.process_image(png, width=200, height=100, fmt='jpeg', fit='contain')
+    assert Image.open(io.BytesIO(output)).size == (200, 100)
+    with pytest.raises(InvalidImageError):
+        image_service.process_image_multi(png, [{'width': 100, 'height': 100, 'fmt': 'jpeg'}])
+
+    # JPEGs are decoded at a reduced scale, if the output is small enough for one
+    jpeg = encode(source, 'JPEG')
+    assert Image.open(io.BytesIO(image_service.process_image(jpeg, width=100, height=100))).size == (100, 100)
+    with pytest.raises(InvalidImageError):
+        image_service.process_image(jpeg, width=800, height=600)
+
+    # Everything else is held to max_megapixels up front
+    with pytest.raises(InvalidImageError):
+        image_service.probe_image(encode(source, 'BMP'))
+    with pytest.raises(InvalidImageError):
+        image_service.probe_image(encode(noise('RGB', (1200, 1000)), 'PNG'))